@@ -1,8 +1,45 @@
 import sublime
 import sublime_plugin
-import re
-from threading import Timer
+import time
+from threading import Lock
 from collections import defaultdict
+from .bbcode import Document, PairIndex, parse, merge_dirty_span
+from .scheduler import scheduler, get_setting
+from .cache import documents
+from .profiling import profiler, profiled
+from . import preview
+from .completion import scan_open_tags, suggest
+
+
+# 分段检查时每段的时间上限(毫秒), 以及每推进多少个tag检查一次时间
+LINT_SLICE_MS = 20
+LINT_STEP_TAGS = 256
+# 补全时读取光标前多少个字符判断补全类型, 以及最多扫描多少个尚未检查的字符
+COMPLETION_CONTEXT_CHARS = 16
+COMPLETION_SCAN_CHARS = 4096
+
+# buffer id -> 该buffer上的Highlighter实例
+_highlighters = defaultdict(set)
+_highlighters_lock = Lock()
+
+
+class _LintJob:
+    '''
+    进行中的分段检查
+    '''
+    __slots__ = ('steps', 'dirty', 'change_count', 'expected_change_count', 'document')
+
+    def __init__(self, steps, dirty, change_count, expected_change_count):
+        # Document.iter_update的生成器
+        self.steps = steps
+        # 本次检查使用的脏区间 (全量检查时为None)
+        self.dirty = dirty
+        # 检查结果对应的change_count (读取内容期间发生改动时为None)
+        self.change_count = change_count
+        # 检查期间内容应保持的change_count, 变化时放弃本次检查
+        self.expected_change_count = expected_change_count
+        # 解析完成后的结果, 尚未建立索引
+        self.document = None
 
 
 class Highlighter(sublime_plugin.ViewEventListener):
@@ -11,14 +48,28 @@ class Highlighter(sublime_plugin.ViewEventListener):
     '''
     def __init__(self, view):
         super().__init__(view)
-        # 防抖计时器
-        self.debounce_timer = None
-        # 上一次(多行)光标的位置
+        # 上一次高亮时(多行)光标的位置
         self.last_cursors_pos = []
-        # 代码块的结尾tag映射开头tag
-        self.cache_end2start = defaultdict(lambda: sublime.Region(-1, -1))
-        # list中所属[*]的区域
-        self.list_items = defaultdict(list)
+        # 上一次高亮时使用的检查结果
+        self.highlight_change_count = None
+        # 代码块(开头tag, 结尾tag)及list中所属[*]的索引
+        self.pair_index = PairIndex()
+        # 高亮区域的缓存: (所属的索引, 代码块 -> 两侧tag的Region, [*]区域 -> Region), 索引不变时光标移动不重新创建
+        self.region_cache = (None, {}, {})
+        # 补全时tag栈的缓存: ((检查结果的revision, 进行中的检查, change_count, 位置), tag名)
+        self.open_tags_cache = (None, [])
+
+        # 增量检查的解析结果
+        self.document = Document()
+        # 上一次检查时的change_count, 以及此后累计的脏区间
+        self.lint_change_count = None
+        self.dirty_span = None
+        self.dirty_change_count = None
+        # 大文件进行中的分段检查
+        self.lint_job = None
+
+        with _highlighters_lock:
+            _highlighters[view.buffer_id()].add(self)
 
     @classmethod
     def is_applicable(cls, settings):
@@ -26,121 +77,377 @@ class Highlighter(sublime_plugin.ViewEventListener):
         return syntax.endswith('BBCode (NGA).sublime-syntax')
 
     def on_activated_async(self):
-        self._check_unclosed_tags()
+        view_id = self.view.id()
+        scheduler.cancel(lambda key: key == (view_id, 'release'))
+        self._schedule_lint(0)
+
+    def on_deactivated_async(self):
+        # 长时间未再激活时释放解析结果
+        delay = get_setting('release_inactive_after', 300)
+        if delay:
+            scheduler.schedule((self.view.id(), 'release'), self._release, delay * 1000)
 
     def on_post_save_async(self):
-        self._check_unclosed_tags()
+        self._schedule_lint(0)
 
     def on_modified_async(self):
-        self._check_unclosed_tags()
+        self._schedule_lint(get_setting('lint_delay', 100))
+
+    def on_close(self):
+        buffer_id = self.view.buffer_id()
+        with _highlighters_lock:
+            _highlighters[buffer_id].discard(self)
+            # 同一buffer的克隆视图仍在使用解析缓存
+            closed = not _highlighters[buffer_id]
+            if closed:
+                del _highlighters[buffer_id]
+        if closed:
+            documents.discard(buffer_id)
+        self.lint_job = None
+        view_id = self.view.id()
+        profiler.discard(view_id)
+        preview.discard(view_id)
+        scheduler.cancel(lambda key: key[0] == view_id)
 
     def on_selection_modified_async(self):
-        # 200ms内只触发一次
-        if self.debounce_timer:
-            self.debounce_timer.cancel()
-        self.debounce_timer = Timer(0.2, self._process_cursor_move, [])
-        self.debounce_timer.start()
+        # 延迟期间的多次光标移动只更新一次
+        scheduler.schedule((self.view.id(), 'highlight'), self._process_cursor_move, get_setting('highlight_delay', 200))
+
+    @profiled('completions')
+    def on_query_completions(self, prefix, locations):
+        begin = locations[0] - len(prefix)
+        before = self.view.substr(sublime.Region(max(0, begin - COMPLETION_CONTEXT_CHARS), begin))
+        # 只有结尾tag及子代码块的补全需要tag栈
+        open_tags = self._open_tags_at(begin) if before.endswith('[') or before.endswith('[/') else []
+        items = suggest(open_tags, before)
+        if items is None:
+            return None
+        return ([[trigger + '\t' + annotation, contents] for trigger, annotation, contents in items], sublime.INHIBIT_WORD_COMPLETIONS)
+
+    def _open_tags_at(self, pos):
+        '''
+        pos处尚未闭合的tag名 (由外向内): 使用上一次检查的结果, 此后的改动只扫描改动处与pos之间的少量内容, 不重新解析
+
+        结果按(检查结果, 进行中的检查, change_count, pos)缓存, 同一处连续请求补全时不再重放tag
+        '''
+        # 先读取change_count: 期间发布了新的检查结果时, 只会把新结果当作过期的结果处理
+        lint_change_count = self.lint_change_count
+        document = self.document
+        change_count = self.view.change_count()
+        job = self.lint_job
+        key = (document.revision, job, change_count, pos)
+        cached_key, open_tags = self.open_tags_cache
+        if cached_key != key:
+            open_tags = self._scan_open_tags_at(pos, document, job, lint_change_count, change_count)
+            self.open_tags_cache = (key, open_tags)
+        return list(open_tags)
+
+    def _scan_open_tags_at(self, pos, document, job, lint_change_count, change_count):
+        if change_count == lint_change_count:
+            return [tag for tag, _ in document.open_tags_at(pos)]
+
+        with _highlighters_lock:
+            span = self.dirty_span if self.dirty_change_count == change_count else None
+        if span is not None and job is not None:
+            # 进行中的分段检查已取出的改动尚未生效
+            if job.dirty is None:
+                span = None
+            else:
+                lo, hi, delta = span
+                span = merge_dirty_span(job.dirty, lo, hi - delta, hi - lo)
+        if span is None or lint_change_count is None:
+            # 无法得知改动位置 (如ST3), 直接使用上一次检查的结果
+            return [tag for tag, _ in document.open_tags_at(pos)]
+
+        lo, hi, delta = span
+        if pos <= lo:
+            return [tag for tag, _ in document.open_tags_at(pos)]
+        if pos - lo <= COMPLETION_SCAN_CHARS:
+            open_tags = [tag for tag, _ in document.open_tags_at(lo)]
+            return scan_open_tags(open_tags, self.view.substr(sublime.Region(lo, pos)))
+        # 光标远离改动处时忽略改动的影响
+        return [tag for tag, _ in document.open_tags_at(max(lo, pos - delta))]
+
+    def _release(self):
+        '''
+        释放解析结果及代码块索引 (视图中的错误标记保留), 再次激活时重新全量检查
+        '''
+        if self.lint_job is not None:
+            self._cancel_lint_job()
+        self.document = Document()
+        self.pair_index = PairIndex()
+        self.lint_change_count = None
+        self.open_tags_cache = (None, [])
+        self.highlight_change_count = None
+        self.last_cursors_pos = []
+
+        buffer_id = self.view.buffer_id()
+        with _highlighters_lock:
+            self.dirty_span = self.dirty_change_count = None
+            # 同一buffer的其他视图(克隆)仍在使用时保留缓存
+            in_use = any(highlighter.lint_change_count is not None for highlighter in _highlighters[buffer_id])
+        if not in_use:
+            documents.discard(buffer_id)
+
+    def _schedule_lint(self, delay):
+        scheduler.schedule((self.view.id(), 'lint'), self._check_unclosed_tags, delay)
+
+    def record_change(self, a, b, size, change_count):
+        '''
+        记录一次文本改动 (由DirtySpanRecorder在主线程调用)
+        '''
+        with _highlighters_lock:
+            self.dirty_span = merge_dirty_span(self.dirty_span, a, b, size)
+            self.dirty_change_count = change_count
+
+    def _take_dirty_span(self, change_count):
+        '''
+        取出自上一次检查以来的脏区间, 无法增量检查时返回None
+        '''
+        with _highlighters_lock:
+            span, span_change_count = self.dirty_span, self.dirty_change_count
+            self.dirty_span = self.dirty_change_count = None
+
+        if self.lint_change_count is None:
+            return None
+        # 记录的改动与当前内容不一致(如ST3没有文本改动回调)
+        if span is None or span_change_count != change_count:
+            return None
+        return span
 
     # 检查未闭合tag
+    @profiled('lint')
     def _check_unclosed_tags(self):
-        self.cache_end2start.clear()
-        self.list_items.clear()
-        error_regions = []
-
-        content = self.view.substr(sublime.Region(0, self.view.size()))
-        tag_stack = []
-        list_stack = []     # 用于list多层嵌套时, 获取当前最内层的list
-
-        pattern = re.compile('\[(/)?([^=\[\] \d]+|\*)(\d+| [^\[\]]+|=[^\]]+)?\]')
-        for match in pattern.finditer(content):
-            is_end, tag, suffix = match.groups()
-
-            # 跳过fixsize
-            if tag == 'fixsize':
-                continue
-
-            pos = match.start()
-            region = sublime.Region(pos, pos + len(match.group()))
-
-            # 记录当前list所属[*]的区域
-            if tag == "*":
-                if list_stack:
-                    self.list_items[list_stack[-1]].append(region)
-                continue
-
-            scopes = self.view.scope_name(pos).split()
-
-            # 若非支持的BBCode tag, 则跳过
-            if 'tag.bbcode.nga' not in scopes[-1]:
-                continue
-
-            # style在randomblock外进行警告
-            if tag == 'style' and 'meta.randomblock.bbcode.nga' not in scopes:
-                error_regions.append(region)
-
-            # list多层嵌套处理
-            if tag == 'list':
-                if not is_end:
-                    list_stack.append(region.to_tuple())
-                else:
-                    list_stack.pop()
-
-            if not is_end:
-                # 开头tag
-                tag_stack.append((tag, region))
-            else:
-                # 结尾tag
-                if tag_stack:
-                    start_tag, start_region = tag_stack.pop()
-                    if start_tag == tag:
-                        self.cache_end2start[region.to_tuple()] = start_region
-                    else:
-                        # 标记未闭合/不当闭合顺序代码块的开头tag
-                        error_regions.append(start_region)
-
-        # 标记未闭合代码块的开头tag
-        for _, region in tag_stack:
-            error_regions.append(region)
+        job = self.lint_job
+        if job is not None:
+            if self.view.change_count() == job.expected_change_count:
+                # 进行中的分段检查仍然有效, 继续即可
+                self._continue_lint()
+                return
+            self._cancel_lint_job()
+
+        change_count = self.view.change_count()
+
+        # 内容未变化时无需重新检查
+        if change_count == self.lint_change_count:
+            with _highlighters_lock:
+                self.dirty_span = self.dirty_change_count = None
+            return
+
+        buffer_id = self.view.buffer_id()
+        cached = documents.peek(buffer_id, change_count)
+        if cached is not None and cached[1] is not None:
+            # 该版本已被其他视图(克隆)检查过, 直接复用
+            self._take_dirty_span(change_count)
+            document, pair_index = cached
+            self._publish(document, pair_index, change_count)
+            return
+
+        dirty = self._take_dirty_span(change_count)
+        if cached is not None:
+            # 该版本已被命令解析过, 只需建立索引
+            document = cached[0]
+        else:
+            content = self.view.substr(sublime.Region(0, self.view.size()))
+            expected_change_count = self.view.change_count()
+            if expected_change_count != change_count:
+                # 读取内容期间发生了改动, 只能全量检查
+                dirty = None
+                change_count = None
+
+            threshold = get_setting('chunked_lint_threshold', 1000000)
+            if threshold and len(content) >= threshold:
+                # 大文件分段检查, 不长时间占用工作线程
+                self._start_lint_job(content, dirty, change_count, expected_change_count)
+                return
+            document = self.document.update(content, dirty)
+
+        pair_index = PairIndex.of(document, self.pair_index)
+        if change_count is not None:
+            documents.put(buffer_id, change_count, document, pair_index)
+        self._publish(document, pair_index, change_count)
+
+    def _publish(self, document, pair_index, change_count):
+        '''
+        采用检查结果, 并标记未闭合/不当闭合顺序代码块的开头tag
+        '''
+        self.document = document
+        self.lint_change_count = change_count
+        self.pair_index = pair_index
+
+        error_regions = [sublime.Region(*region) for region in document.error_regions()]
+        attribute_regions = [sublime.Region(*region) for region in document.attribute_errors]
 
         # 覆盖更新错误区域
-        # self.view.add_regions('error', error_regions,  'invalid.illegal', flags=sublime.RegionFlags.DRAW_SQUIGGLY_UNDERLINE)
-        self.view.add_regions('error', error_regions,  'invalid.illegal', flags=2048)
+        with profiler.measure(self.view, 'add_regions.error'):
+            # self.view.add_regions('error', error_regions,  'invalid.illegal', flags=sublime.RegionFlags.DRAW_SQUIGGLY_UNDERLINE)
+            self.view.add_regions('error', error_regions,  'invalid.illegal', flags=2048)
+            self.view.add_regions('attribute_error', attribute_regions, 'invalid.deprecated', flags=2048)
+
+        # 打开预览时按同一检查结果更新
+        preview.schedule_update(self.view, document, pair_index, change_count)
+
+    def _start_lint_job(self, content, dirty, change_count, expected_change_count):
+        if dirty is None:
+            self._publish_visible_errors(content)
+        steps = self.document.iter_update(content, dirty, step=LINT_STEP_TAGS)
+        self.lint_job = _LintJob(steps, dirty, change_count, expected_change_count)
+        self._continue_lint()
+
+    @profiled('lint_slice')
+    def _continue_lint(self):
+        '''
+        推进分段检查, 每段不超过LINT_SLICE_MS毫秒, 段与段之间让出工作线程 (如处理光标高亮)
+        '''
+        job = self.lint_job
+        if job is None:
+            return
+        if self.view.change_count() != job.expected_change_count:
+            # 有新的改动: 放弃本次检查, 由改动触发重新检查
+            self._cancel_lint_job()
+            self._schedule_lint(get_setting('lint_delay', 100))
+            return
+
+        if job.document is None:
+            deadline = time.monotonic() + LINT_SLICE_MS / 1000
+            for document in job.steps:
+                if document is not None:
+                    job.document = document
+                    break
+                if time.monotonic() >= deadline:
+                    break
+            # 解析完成后, 建立索引并发布结果单独作为一段
+            scheduler.schedule((self.view.id(), 'lint'), self._continue_lint, 0)
+            return
+
+        self.lint_job = None
+        document = job.document
+        pair_index = PairIndex.of(document, self.pair_index)
+        if job.change_count is not None:
+            documents.put(self.view.buffer_id(), job.change_count, document, pair_index)
+        self._publish(document, pair_index, job.change_count)
+        # 更新检查期间被推迟的高亮提示
+        scheduler.schedule((self.view.id(), 'highlight'), self._process_cursor_move, 0)
+
+    def _cancel_lint_job(self):
+        job = self.lint_job
+        self.lint_job = None
+        job.steps.close()
+
+        if job.dirty is None:
+            # 放弃的是全量检查, 下一次也只能全量检查
+            self.lint_change_count = None
+            return
+
+        # 放弃的检查已取出的脏区间尚未生效, 与之后记录的改动合并
+        with _highlighters_lock:
+            span = job.dirty
+            if self.dirty_span is not None:
+                lo, hi, delta = self.dirty_span
+                span = merge_dirty_span(span, lo, hi - delta, hi - lo)
+            self.dirty_span = span
+
+    def _publish_visible_errors(self, content):
+        '''
+        全量检查大文件前, 先单独检查可见区域并临时标记其中的错误 (可见区域之外保留上一次的结果)
+
+        可见区域之前的内容尚未检查, 因此只标记不当闭合顺序的代码块, 不标记可能在后面闭合的代码块
+        '''
+        visible = self.view.visible_region()
+        begin = content.rfind('\n', 0, visible.begin()) + 1
+        end = content.find('\n', visible.end())
+        if end == -1:
+            end = len(content)
+
+        local = parse(content[begin:end])
+        error_regions = [region for region in self.view.get_regions('error') if region.end() <= begin or region.begin() >= end]
+        error_regions += [sublime.Region(a + begin, b + begin) for a, b in local.errors]
+        attribute_regions = [region for region in self.view.get_regions('attribute_error') if region.end() <= begin or region.begin() >= end]
+        attribute_regions += [sublime.Region(a + begin, b + begin) for a, b in local.attribute_errors]
+        with profiler.measure(self.view, 'add_regions.error'):
+            self.view.add_regions('error', error_regions,  'invalid.illegal', flags=2048)
+            self.view.add_regions('attribute_error', attribute_regions, 'invalid.deprecated', flags=2048)
 
     # 光标移动时更新高亮提示
+    @profiled('cursor_highlight')
     def _process_cursor_move(self):
+        # 检查结果落后于当前内容时先重新检查, 保证不会按过期的代码块位置高亮
+        if self.view.change_count() != self.lint_change_count:
+            self._check_unclosed_tags()
+            if self.lint_job is not None:
+                # 大文件的分段检查尚未完成, 完成后再更新高亮
+                return
+
         cursors_pos = [region.b for region in self.view.sel()]
 
-        # 位置未变化时跳过
-        if cursors_pos == self.last_cursors_pos:
+        # 位置及检查结果均未变化时跳过
+        if cursors_pos == self.last_cursors_pos and self.lint_change_count == self.highlight_change_count:
             return
         self.last_cursors_pos = cursors_pos
+        self.highlight_change_count = self.lint_change_count
 
+        pair_index = self.pair_index
+        if self.region_cache[0] is not pair_index:
+            self.region_cache = (pair_index, {}, {})
+        _, block_regions, item_regions = self.region_cache
+        starts, ends, parents, Region = pair_index.starts, pair_index.ends, pair_index.parents, sublime.Region
         highlight_regions = []
+        highlighted = set()
+        highlighted_items = set()
 
-        for cursor_pos in cursors_pos:
-            # 若光标没有被任何代码块包裹, 则跳过
-            if len(self.view.scope_name(cursor_pos).split()) <= 1:
-                continue
+        # 按位置顺序扫描各光标, 代码块及其中光标所在的[*]都已被其他光标标记时, 不再继续处理外层代码块
+        for cursor_pos, k in pair_index.innermost_all(sorted(set(cursors_pos))):
+            # 由内向外, 高亮标记包裹光标的代码块的tag
+            while k != -1:
+                # 在list中, 找最后一个位于光标前面的[*]
+                item = pair_index.active_item(k, cursor_pos) if pair_index.in_list(k) else None
+                block_done = k in highlighted
+                item_done = item is None or item in highlighted_items
+                if block_done and item_done:
+                    break
 
-            for end_region in self.cache_end2start.keys():
-                # 若该tag已被标记为高亮显示, 则跳过
-                if end_region in highlight_regions:
-                    continue
+                if not block_done:
+                    highlighted.add(k)
+                    regions = block_regions.get(k)
+                    if regions is None:
+                        regions = block_regions[k] = [Region(*starts[k]), Region(*ends[k])]
+                    highlight_regions += regions
+                if not item_done:
+                    highlighted_items.add(item)
+                    region = item_regions.get(item)
+                    if region is None:
+                        region = item_regions[item] = Region(*item)
+                    highlight_regions.append(region)
+                k = parents[k]
 
-                start_region = self.cache_end2start[end_region]
-                end_region = sublime.Region(a=end_region[0], b=end_region[1])
+        # 覆盖更新高亮区域
+        with profiler.measure(self.view, 'add_regions.highlight'):
+            # self.view.add_regions('highlight', highlight_regions, 'entity.name', flags=sublime.RegionFlags.DRAW_NO_FILL)
+            self.view.add_regions('highlight', highlight_regions, 'entity.name', flags=32)
 
-                # 若光标被该代码块包裹, 则高亮标记该代码块的tag
-                if start_region.begin() <= cursor_pos < end_region.end():
-                    highlight_regions += [start_region, end_region]
 
-                    # 在list中, 从最后一个所属的[*]开始, 找第一个位于光标前面的[*]
-                    if self.view.substr(end_region) == '[/list]':
-                        for item_region in reversed(self.list_items[start_region.to_tuple()]):
-                            if item_region.begin() <= cursor_pos:
-                                highlight_regions.append(item_region)
-                                break
+if hasattr(sublime_plugin, 'TextChangeListener'):
+    class DirtySpanRecorder(sublime_plugin.TextChangeListener):
+        '''
+        记录文本改动的区间, 供Highlighter增量检查及解析缓存增量解析
+        '''
+        @classmethod
+        def is_applicable(cls, buffer):
+            view = buffer.primary_view()
+            return view is not None and Highlighter.is_applicable(view.settings())
 
-        # 覆盖更新高亮区域
-        # self.view.add_regions('highlight', highlight_regions, 'entity.name', flags=sublime.RegionFlags.DRAW_NO_FILL)
-        self.view.add_regions('highlight', highlight_regions, 'entity.name', flags=32)
\ No newline at end of file
+        def on_text_changed(self, changes):
+            buffer_id = self.buffer.id()
+            change_count = self.buffer.primary_view().change_count()
+            # 命令未命中缓存时从缓存的版本增量解析
+            for change in changes:
+                documents.record_change(buffer_id, change.a.pt, change.b.pt, len(change.str), change_count)
+
+            with _highlighters_lock:
+                highlighters = list(_highlighters[buffer_id])
+            if not highlighters:
+                return
+
+            for highlighter in highlighters:
+                for change in changes:
+                    highlighter.record_change(change.a.pt, change.b.pt, len(change.str), change_count)
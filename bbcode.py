@@ -0,0 +1,1351 @@
+import re
+import bisect
+import itertools
+import threading
+from array import array
+# 由 tools/gen_schema.py 根据 BBCode (NGA).sublime-syntax 中的 variables 生成
+from .schema import ALIGN_CODES, COLOR_CODES, FONT_CODES, HEX_CODE
+
+
+__all__ = ['SUPPORTED_TAGS', 'TAG_PATTERN', 'Document', 'PairIndex', 'parse', 'merge_dirty_span']
+
+# 每隔多少个tag记录一次增量解析的断点
+CHECKPOINT_INTERVAL = 256
+
+ERROR_MESSAGE = '未闭合/不当闭合顺序代码块'
+ATTRIBUTE_ERROR_MESSAGE = '不合法的属性值'
+
+TAG_PATTERN = re.compile(r'\[(/)?([^=\[\] \d]+|\*)(\d+| [^\[\]]+|=[^\]]+)?\]')
+
+SUPPORTED_TAGS = frozenset([
+    'b', 'i', 'u', 'h', 'l', 'r', 'sup', 'del', 'code', 'quote', 'randomblock', 'style', 'img', 'url',
+    'tid', 'pid', 'uid', 'align', 'color', 'font', 'size', 'collapse', 'table', 'tr', 'td', 'list'
+])
+
+KEYWORD_TAG = 'keyword.tag.bbcode.nga'
+PUNCTUATION_TAG = 'punctuation.definition.keyword.tag.bbcode.nga'
+TR_TAG = 'variable.function.tag.bbcode.nga'
+TD_TAG = 'variable.parameter.tag.bbcode.nga'
+COMMENT_TAG = 'comment.tag.bbcode.nga'
+IMG_TAG = 'keyword.operator.img.tag.bbcode.nga'
+LINK_TAG = 'markup.underline.link.tag.bbcode.nga'
+
+
+class _Rule:
+    '''
+    sublime-syntax中的一条match规则
+    '''
+    __slots__ = ('pattern', 'scope', 'captures', 'push', 'pop', 'check', 'group')
+
+    def __init__(self, pattern, scope=None, captures=(), push=None, pop=False, check=None):
+        self.pattern = pattern
+        self.scope = scope
+        self.captures = captures    # ((捕获组序号, 作用域), ...), 外层在前
+        self.push = push
+        self.pop = pop
+        self.check = check          # 第1个捕获组的合法取值 (用于忽略大小写的variables)
+        self.group = 0              # 在所属context合并后的正则中的组序号
+
+
+def _close(tag, scope=KEYWORD_TAG):
+    return _Rule(r'\[/' + tag + r'\]', scope, pop=True)
+
+
+_RULES = {
+    'special': [_Rule(r'\b__(.*?)__\b', 'constant.language')],
+    'code': [_Rule(r'\[code\]', PUNCTUATION_TAG, push='code-body')],
+    'style': [_Rule(r'\[style (.[^\]\b]+)\]', PUNCTUATION_TAG, push='style-body')],
+    'img': [_Rule(r'\[img\](.+?)\[/img\]', IMG_TAG, ((1, 'keyword.operator'),))],
+    'url': [
+        _Rule(r'\[url\](.+?)\[/url\]', LINK_TAG),
+        _Rule(r'\[url=([^\]]+)\]', KEYWORD_TAG, ((1, 'markup.underline.link'),), push='url-body'),
+    ],
+    'align': [_Rule(r'\[align=([^\]]*)\]', KEYWORD_TAG, push='align-body', check=ALIGN_CODES)],
+    'color': [_Rule(r'\[color=([^\]]*)\]', KEYWORD_TAG, ((1, 'variable.parameter'),), push='color-body', check=COLOR_CODES)],
+    'font': [_Rule(r'\[font=([^\]]*)\]', KEYWORD_TAG, ((1, 'variable.parameter'),), push='font-body', check=FONT_CODES)],
+    'size': [
+        _Rule(r'\[size=0%\]', COMMENT_TAG, push='size-body-comment'),
+        _Rule(r'\[size=(\d+%)\]', KEYWORD_TAG, ((1, 'constant.numeric'),), push='size-body'),
+    ],
+    'collapse': [
+        _Rule(r'\[collapse\]', KEYWORD_TAG, push='collapse-body'),
+        _Rule(r'\[collapse=([^\]]+)\]', KEYWORD_TAG, ((1, 'constant.language'),), push='collapse-body'),
+    ],
+    'table': [_Rule(r'\[table\]', PUNCTUATION_TAG, push='table-body')],
+    'tr': [_Rule(r'\[tr\]', TR_TAG, push='tr-body')],
+    'td': [
+        _Rule(r'\[td\]', TD_TAG, push='td-body'),
+        _Rule(r'\[td(\d+)\]', TD_TAG, ((1, 'constant.numeric'),), push='td-body'),
+        _Rule(r'\[td (width|colspan|rowspan)=(\d+)\]', TD_TAG, ((2, 'constant.numeric'),), push='td-body'),
+        _Rule(r'\[td (colspan|rowspan)=(\d+) width=(\d+)\]', TD_TAG, ((2, 'constant.numeric'), (3, 'constant.numeric')), push='td-body'),
+    ],
+    'list': [_Rule(r'\[list\]', PUNCTUATION_TAG, push='list-body')],
+    'fixsize': [
+        _Rule(r'\[fixsize height (\d*\.?\d+) width (\d*\.?\d+) (\d*\.?\d+) background (' + HEX_CODE + r')\]', PUNCTUATION_TAG,
+              ((1, 'constant.numeric'), (2, 'constant.numeric'), (3, 'constant.numeric'), (4, 'constant.numeric'))),
+        _Rule(r'\[fixsize height (\d*\.?\d+) width (\d*\.?\d+) (\d*\.?\d+) background (' + HEX_CODE + r') (' + HEX_CODE + r')\]', PUNCTUATION_TAG,
+              ((1, 'constant.numeric'), (2, 'constant.numeric'), (3, 'constant.numeric'), (4, 'constant.numeric'), (6, 'constant.numeric'))),
+    ],
+}
+for _tag in ('b', 'i', 'u', 'h', 'l', 'r', 'sup', 'del', 'quote', 'randomblock'):
+    _RULES[_tag] = [_Rule(r'\[' + _tag + r'\]', KEYWORD_TAG, push=_tag + '-body')]
+for _tag in ('tid', 'uid'):
+    _RULES[_tag] = [
+        _Rule(r'\[' + _tag + r'\](\d+)\[/' + _tag + r'\]', KEYWORD_TAG, ((1, 'constant.numeric'),)),
+        _Rule(r'(\[' + _tag + r'=(\d+)\])(.+?)(\[/' + _tag + r'\])', None,
+              ((1, KEYWORD_TAG), (2, 'constant.numeric'), (3, 'meta.' + _tag + '.bbcode.nga'), (4, KEYWORD_TAG))),
+    ]
+_RULES['pid'] = [
+    _Rule(r'\[pid\](\d+,\d+,\d+)\[/pid\]', KEYWORD_TAG, ((1, 'constant.numeric'),)),
+    _Rule(r'(\[pid=(\d+,\d+,\d+)\])(.+?)(\[/pid\])', None,
+          ((1, KEYWORD_TAG), (2, 'constant.numeric'), (3, 'meta.pid.bbcode.nga'), (4, KEYWORD_TAG))),
+]
+
+_TAGS = [
+    'b', 'i', 'u', 'h', 'l', 'r', 'sup', 'del', 'code', 'quote', 'randomblock', 'style', 'img', 'url',
+    'tid', 'pid', 'uid', 'align', 'color', 'font', 'size', 'collapse', 'table', 'list'
+]
+
+# context名 -> 依次匹配的规则 (字符串表示include)
+_CONTEXTS = {
+    'main': ['tags'],
+    'code-body': [_close('code', PUNCTUATION_TAG)],
+    'table-body': ['tr', _close('table', PUNCTUATION_TAG)],
+    'tr-body': ['td', _close('tr', TR_TAG)],
+    'td-body': ['tags', _close('td', TD_TAG)],
+    'list-body': [_Rule(r'\[\*\]', 'string'), 'tags', _close('list', PUNCTUATION_TAG)],
+    'randomblock-body': ['tags', 'fixsize', _close('randomblock')],
+    'style-body': ['tags', _close('style', PUNCTUATION_TAG)],
+    'size-body-comment': ['tags', _close('size', COMMENT_TAG)],
+}
+for _tag in ('b', 'i', 'u', 'h', 'l', 'r', 'sup', 'del', 'quote', 'url', 'align', 'color', 'font', 'size', 'collapse'):
+    _CONTEXTS[_tag + '-body'] = ['tags', _close(_tag)]
+
+
+class _Context:
+    '''
+    合并context中所有规则的正则, 一次搜索即可找到最靠前的匹配 (位置相同时取规则顺序靠前者, 与Sublime一致)
+    '''
+    def __init__(self, name, items):
+        self.name = name
+        rules = [] if name == 'code-body' else list(_RULES['special'])
+        for item in items:
+            if item == 'tags':
+                for tag in _TAGS:
+                    rules += _RULES[tag]
+            elif isinstance(item, str):
+                rules += _RULES[item]
+            else:
+                rules.append(item)
+
+        self.rules = {}
+        patterns = []
+        group = 1
+        for rule in rules:
+            rule = _Rule(rule.pattern, rule.scope, rule.captures, rule.push, rule.pop, rule.check)
+            rule.group = group
+            self.rules[group] = rule
+            patterns.append('(' + rule.pattern + ')')
+            group += 1 + re.compile(rule.pattern).groups
+        self.regex = re.compile('|'.join(patterns))
+
+
+_COMPILED_CONTEXTS = dict((name, _Context(name, items)) for name, items in _CONTEXTS.items())
+
+
+def _carve(match, rule):
+    '''
+    将一次匹配拆分为若干互不重叠的区域, 每个区域只记录最内层的作用域
+    '''
+    pieces = [(match.start(rule.group), match.end(rule.group), rule.scope)] if rule.scope else []
+    for group, scope in rule.captures:
+        begin, end = match.span(rule.group + group)
+        if begin == end:
+            continue
+        carved = []
+        for piece in pieces:
+            if piece[1] <= begin or piece[0] >= end:
+                carved.append(piece)
+                continue
+            if piece[0] < begin:
+                carved.append((piece[0], begin, piece[2]))
+            if piece[1] > end:
+                carved.append((end, piece[1], piece[2]))
+        carved.append((begin, end, scope))
+        pieces = sorted(carved)
+    return pieces
+
+
+class _Lexer:
+    '''
+    按sublime-syntax的规则逐行模拟语法高亮, 记录每次匹配的最内层作用域
+    '''
+    def __init__(self, text, pos, contexts, spans, attribute_errors):
+        self.text = text
+        self.pos = pos              # 下一个待处理行的行首
+        self.contexts = list(contexts)
+        self.random_depth = self.contexts.count('randomblock-body')
+        self.spans = spans
+        self.attribute_errors = attribute_errors
+
+    def lex_to(self, stop):
+        '''
+        处理所有开始于stop之前的行
+        '''
+        text, contexts, attribute_errors = self.text, self.contexts, self.attribute_errors
+        # 直接追加到各列, 不为每个区域创建元组
+        add_begin, add_end, add_scope, add_flag = [column.append for column in self.spans.columns]
+        scope_ids = _SCOPE_NAMES.ids
+        pos = self.pos
+        while pos < stop:
+            line_end = text.find('\n', pos) + 1 or len(text)
+            context = _COMPILED_CONTEXTS[contexts[-1]]
+            while True:
+                match = context.regex.search(text, pos, line_end)
+                if match is None:
+                    break
+                rule = context.rules[match.lastindex]
+
+                # 忽略大小写的取值不在合法范围内时, 该规则不匹配, 并记录不合法的取值 (取值为空时记录整个tag)
+                if rule.check is not None and match.group(rule.group + 1).lower() not in rule.check:
+                    value = match.span(rule.group + 1)
+                    attribute_errors.append(value if value[0] != value[1] else match.span(rule.group))
+                    pos = match.start() + 1
+                    continue
+
+                if rule.push == 'randomblock-body':
+                    self.random_depth += 1
+                in_randomblock = self.random_depth > 0
+                for begin, end, scope in _carve(match, rule):
+                    scope_id = scope_ids.get(scope)
+                    add_begin(begin)
+                    add_end(end)
+                    add_scope(scope_id if scope_id is not None else _SCOPE_NAMES.id(scope))
+                    add_flag(in_randomblock)
+
+                if rule.push:
+                    contexts.append(rule.push)
+                elif rule.pop:
+                    if contexts.pop() == 'randomblock-body':
+                        self.random_depth -= 1
+                pos = match.end()
+                context = _COMPILED_CONTEXTS[contexts[-1]]
+            pos = line_end
+        self.pos = max(pos, self.pos)
+
+
+def _is_clean_restart(text, prev_end, pos):
+    '''
+    判断能否从pos处重新开始匹配tag, 而不影响pos之前的匹配结果
+
+    tag的匹配最远只会读到其后的第一个']', 因此只需pos之前最后一个'['后面已出现过']'
+    '''
+    if prev_end > pos:
+        return False
+    k = text.rfind('[', prev_end, pos)
+    return k == -1 or text.find(']', k, pos) != -1
+
+
+class _Names:
+    '''
+    字符串与下标的对照表 (tag名、作用域等取值很少的字符串), 所有Document共用, 只增不减
+    '''
+    __slots__ = ('names', 'ids', 'lock')
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+        self.lock = threading.Lock()
+
+    def id(self, name):
+        i = self.ids.get(name)
+        if i is None:
+            # 可能被多个线程同时解析, 先加入names再加入ids, 其他线程不会读到未加入names的下标
+            with self.lock:
+                i = self.ids.get(name)
+                if i is None:
+                    i = len(self.names)
+                    self.names.append(name)
+                    self.ids[name] = i
+        return i
+
+
+_TAG_NAMES = _Names()
+_SCOPE_NAMES = _Names()
+
+
+_NEG_INF = float('-inf')
+_POS_INF = float('inf')
+
+# _Rope的平移分段、段数及被改写的项超出以下数量时, 复制为一个新的array/list
+MAX_ROPE_PIECES = 8
+MAX_ROPE_CHUNKS = 32
+MAX_ROPE_PATCHES = 1024
+
+
+class _Chunk:
+    '''
+    _Rope中的一段: data[start:stop], data可被多个版本共用, 不会再被修改
+
+    offsets为None时取值即data中的原值; 否则原值按分界bounds分段平移, 原值位于第i段时加上offsets[i]
+    '''
+    __slots__ = ('data', 'start', 'stop', 'bounds', 'offsets')
+
+    def __init__(self, data, start, stop, bounds=(), offsets=None):
+        self.data = data
+        self.start = start
+        self.stop = stop
+        self.bounds = bounds
+        self.offsets = offsets
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def sliced(self, start, stop):
+        return _Chunk(self.data, self.start + start, self.start + stop, self.bounds, self.offsets)
+
+    def value(self, i):
+        raw = self.data[self.start + i]
+        if self.offsets is None:
+            return raw
+        return raw + self.offsets[bisect.bisect_right(self.bounds, raw)]
+
+    def values(self):
+        data = self.data[self.start:self.stop]
+        offsets = self.offsets
+        if offsets is None:
+            return iter(data)
+        if not self.bounds:
+            return map(offsets[0].__add__, data) if offsets[0] else iter(data)
+        bounds = self.bounds
+        return (raw + offsets[bisect.bisect_right(bounds, raw)] for raw in data)
+
+    def materialized(self):
+        values = self.values()
+        data = array(self.data.typecode, values) if isinstance(self.data, array) else list(values)
+        return _Chunk(data, 0, len(data))
+
+    def remapped(self, steps):
+        '''
+        按分段函数改写取值, steps见_Rope.remapped; 只合并各段的平移量, 不逐项计算
+        '''
+        offsets = self.offsets or (0,)
+        lows = (_NEG_INF,) + tuple(self.bounds)
+        highs = tuple(self.bounds) + (_POS_INF,)
+        steps = [(_NEG_INF, 0)] + list(steps) + [(_POS_INF, 0)]
+        pieces = []
+        for low, high, offset in zip(lows, highs, offsets):
+            for (step_low, delta), (step_high, _) in zip(steps, steps[1:]):
+                # 该平移区间对应的原值区间
+                a, b = max(low, step_low - offset), min(high, step_high - offset)
+                if a >= b:
+                    continue
+                if pieces and pieces[-1][1] == offset + delta:
+                    continue
+                pieces.append((a, offset + delta))
+        bounds = tuple(a for a, _ in pieces[1:])
+        offsets = tuple(offset for _, offset in pieces)
+        chunk = _Chunk(self.data, self.start, self.stop, bounds, offsets if offsets != (0,) else None)
+        return chunk.materialized() if len(offsets) > MAX_ROPE_PIECES else chunk
+
+    def bisect(self, x, right):
+        '''
+        (已排序的)段中取值小于x的项数, right为True时为不大于x的项数
+        '''
+        find = bisect.bisect_right if right else bisect.bisect_left
+        data, start, stop, offsets = self.data, self.start, self.stop, self.offsets
+        if offsets is None:
+            return find(data, x, start, stop) - start
+        count = 0
+        a = start
+        for i, offset in enumerate(offsets):
+            b = bisect.bisect_left(data, self.bounds[i], a, stop) if i < len(self.bounds) else stop
+            count += find(data, x - offset, a, b) - a
+            a = b
+        return count
+
+
+def _compose(steps, value):
+    '''
+    steps所表示的分段函数在value处的取值
+    '''
+    i = bisect.bisect_right(steps, (value, _POS_INF)) - 1
+    return value + steps[i][1] if i >= 0 else value
+
+
+class _Rope:
+    '''
+    只读的数值(或任意值)序列, 由若干_Chunk拼接而成: 切片、拼接及分段平移只处理段的列表, 不复制数据
+
+    增量解析时, 新版本的各列由上一版本的前后两部分(后一部分整体平移)与重新解析的部分拼接而成, 不必逐项复制;
+    段数或平移分段过多时才复制为一个新的array. patches为个别被改写的项 (下标 -> 取值)
+    '''
+    __slots__ = ('chunks', 'starts', 'length', 'patches', '_lasts')
+
+    def __init__(self, chunks=(), patches=None):
+        self.chunks = [chunk for chunk in chunks if chunk.stop > chunk.start]
+        self.starts = []
+        length = 0
+        for chunk in self.chunks:
+            self.starts.append(length)
+            length += len(chunk)
+        self.length = length
+        self.patches = patches or None
+        # 各段最后一项的取值, 第一次二分查找时计算
+        self._lasts = None
+
+    @classmethod
+    def wrap(cls, data):
+        return data if isinstance(data, _Rope) else cls([_Chunk(data, 0, len(data))])
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            start, stop, _ = k.indices(self.length)
+            return self._sliced(start, max(start, stop))
+        if k < 0:
+            k += self.length
+        if not 0 <= k < self.length:
+            raise IndexError('rope index out of range')
+        if self.patches is not None and k in self.patches:
+            return self.patches[k]
+        if len(self.chunks) == 1:
+            return self.chunks[0].value(k)
+        i = bisect.bisect_right(self.starts, k) - 1
+        return self.chunks[i].value(k - self.starts[i])
+
+    def _sliced(self, start, stop):
+        chunks = []
+        i = max(0, bisect.bisect_right(self.starts, start) - 1)
+        for chunk, offset in zip(self.chunks[i:], self.starts[i:]):
+            if offset >= stop:
+                break
+            a, b = max(start - offset, 0), min(stop - offset, len(chunk))
+            chunks.append(chunk if a == 0 and b == len(chunk) else chunk.sliced(a, b))
+        patches = None
+        if self.patches is not None:
+            patches = dict((k - start, value) for k, value in self.patches.items() if start <= k < stop)
+        return _Rope(chunks, patches)
+
+    def __iter__(self):
+        values = itertools.chain.from_iterable(chunk.values() for chunk in self.chunks)
+        if self.patches is None:
+            return values
+        values = list(values)
+        for k, value in self.patches.items():
+            values[k] = value
+        return iter(values)
+
+    def __add__(self, other):
+        other = _Rope.wrap(other)
+        chunks = list(self.chunks)
+        for chunk in other.chunks:
+            last = chunks[-1] if chunks else None
+            if (last is not None and last.data is chunk.data and last.stop == chunk.start and
+                    last.bounds == chunk.bounds and last.offsets == chunk.offsets):
+                chunks[-1] = _Chunk(last.data, last.start, chunk.stop, last.bounds, last.offsets)
+            else:
+                chunks.append(chunk)
+        patches = dict(self.patches or ())
+        for k, value in (other.patches or {}).items():
+            patches[k + self.length] = value
+        rope = _Rope(chunks, patches)
+        if len(rope.chunks) > MAX_ROPE_CHUNKS or len(patches) > MAX_ROPE_PATCHES:
+            return rope.compacted()
+        return rope
+
+    def patched(self, patches):
+        '''
+        改写个别项 (下标 -> 取值)
+        '''
+        merged = dict(self.patches or ())
+        merged.update(patches)
+        rope = _Rope(self.chunks, merged)
+        return rope.compacted() if len(merged) > MAX_ROPE_PATCHES else rope
+
+    def remapped(self, steps):
+        '''
+        按分段函数改写取值: steps为(下界, 平移量), 取值不小于某个下界时加上其中最大的下界的平移量 (下界相同时以靠后的为准)
+        '''
+        steps = sorted(dict(steps).items())
+        patches = None
+        if self.patches is not None:
+            patches = dict((k, _compose(steps, value)) for k, value in self.patches.items())
+        return _Rope([chunk.remapped(steps) for chunk in self.chunks], patches)
+
+    def compacted(self):
+        '''
+        复制为只有一段、没有平移的序列
+        '''
+        if not self.chunks:
+            return _Rope()
+        data = self.chunks[0].data
+        return _Rope.wrap(array(data.typecode, self) if isinstance(data, array) else list(self))
+
+    def _last_values(self):
+        if self._lasts is None:
+            self._lasts = [chunk.value(len(chunk) - 1) for chunk in self.chunks]
+        return self._lasts
+
+    def _bisect(self, x, right):
+        chunks = self.chunks
+        if len(chunks) == 1:
+            return chunks[0].bisect(x, right)
+        # 第一个最后一项大于x(right为False时不小于x)的段
+        c = (bisect.bisect_right if right else bisect.bisect_left)(self._last_values(), x)
+        if c == len(chunks):
+            return self.length
+        return self.starts[c] + chunks[c].bisect(x, right)
+
+    def bisect_left(self, x):
+        '''
+        (已排序、没有被改写的项的)序列中, 取值小于x的项数
+        '''
+        return self._bisect(x, False)
+
+    def bisect_right(self, x):
+        '''
+        (已排序、没有被改写的项的)序列中, 取值不大于x的项数
+        '''
+        return self._bisect(x, True)
+
+    def bisect_right_all(self, xs):
+        '''
+        依次返回已排序的xs中各项的bisect_right: 按顺序扫描各段, 只在所在段内二分查找
+        '''
+        chunks, starts, lasts = self.chunks, self.starts, self._last_values()
+        c = 0
+        for x in xs:
+            while c < len(chunks) and lasts[c] <= x:
+                c += 1
+            yield starts[c] + chunks[c].bisect(x, True) if c < len(chunks) else self.length
+
+
+class _Columns:
+    '''
+    按列存放的元组序列, 不为每一项创建元组: 解析时各列为array(或list), 解析完成后转为_Rope, 切片、拼接及平移时不复制数据
+
+    按下标读取或迭代时才组成元组 (由子类的_item/__iter__组成); 按下标读取较慢, 大量读取时应先切片再迭代
+    '''
+    __slots__ = ('columns',)
+    # 各列的类型: array的typecode, 或None (list)
+    _TYPECODES = ()
+
+    def __init__(self, columns=None):
+        self.columns = columns if columns is not None else [
+            array(typecode) if typecode is not None else [] for typecode in self._TYPECODES]
+
+    @property
+    def begins(self):
+        return self.columns[0]
+
+    @property
+    def ends(self):
+        return self.columns[1]
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return type(self)([_Rope.wrap(column)[k] for column in self.columns])
+        return self._item(k)
+
+    def __add__(self, other):
+        return type(self)([_Rope.wrap(column) + values for column, values in zip(self.columns, other.columns)])
+
+    def frozen(self):
+        '''
+        各列转为_Rope (解析完成后不再append)
+        '''
+        return type(self)([_Rope.wrap(column) for column in self.columns])
+
+    def shifted(self, delta, threshold=None):
+        '''
+        位置平移delta (复用上一次解析的后续结果时使用): threshold不为None时, 只平移开头不小于threshold的区域
+        (复用的区域或位于改动之前, 或开头不早于改动的结尾; 结尾恰好等于threshold的区域位于改动之前, 不平移)
+        '''
+        columns = [_Rope.wrap(column) for column in self.columns]
+        if threshold is None:
+            thresholds = (_NEG_INF, _NEG_INF)
+        else:
+            thresholds = (threshold, threshold + 1)
+        for i in (0, 1):
+            columns[i] = columns[i].remapped([(thresholds[i], delta)])
+        return type(self)(columns)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+
+class _Regions(_Columns):
+    '''
+    区域序列 (begin, end)
+    '''
+    __slots__ = ()
+    _TYPECODES = ('l', 'l')
+
+    def append(self, region):
+        self.columns[0].append(region[0])
+        self.columns[1].append(region[1])
+
+    def _item(self, k):
+        return (self.columns[0][k], self.columns[1][k])
+
+    def __iter__(self):
+        return zip(self.columns[0], self.columns[1])
+
+
+class _RegionPairs:
+    '''
+    (区域, 区域)序列, 如代码块的(开头tag, 结尾tag)、list中的(所属list, [*]): 四个位置分别按列存放在_Regions中, 不为每一项创建元组
+
+    支持Document增量解析所需的append/切片/拼接/平移, 迭代或按下标读取时才组成((begin, end), (begin, end))
+    '''
+    __slots__ = ('first', 'second')
+
+    def __init__(self, pairs=(), first=None, second=None):
+        self.first = first if first is not None else _Regions()
+        self.second = second if second is not None else _Regions()
+        for pair in pairs:
+            self.append(pair)
+
+    def append(self, pair):
+        self.first.append(pair[0])
+        self.second.append(pair[1])
+
+    def __len__(self):
+        return len(self.first)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return _RegionPairs(first=self.first[k], second=self.second[k])
+        return (self.first[k], self.second[k])
+
+    def __add__(self, other):
+        return _RegionPairs(first=self.first + other.first, second=self.second + other.second)
+
+    def frozen(self):
+        return _RegionPairs(first=self.first.frozen(), second=self.second.frozen())
+
+    def shifted(self, delta, threshold):
+        '''
+        位置平移delta: second总是位于threshold之后, 整体平移; first只平移开头不小于threshold的区域
+        '''
+        return _RegionPairs(first=self.first.shifted(delta, threshold), second=self.second.shifted(delta))
+
+    def __iter__(self):
+        return zip(self.first, self.second)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+
+class _Tokens(_Columns):
+    '''
+    tag序列 (begin, end, tag, is_end, suffix): tag名存为_TAG_NAMES中的下标, is_end存为array('b'), suffix大多为None
+    '''
+    __slots__ = ()
+    _TYPECODES = ('l', 'l', 'H', 'b', None)
+
+    def append(self, token):
+        begins, ends, tags, is_ends, suffixes = self.columns
+        begins.append(token[0])
+        ends.append(token[1])
+        tags.append(_TAG_NAMES.id(token[2]))
+        is_ends.append(token[3])
+        suffixes.append(token[4])
+
+    def _item(self, k):
+        begins, ends, tags, is_ends, suffixes = self.columns
+        return (begins[k], ends[k], _TAG_NAMES.names[tags[k]], bool(is_ends[k]), suffixes[k])
+
+    def __iter__(self):
+        begins, ends, tags, is_ends, suffixes = self.columns
+        return zip(begins, ends, map(_TAG_NAMES.names.__getitem__, tags), map(bool, is_ends), suffixes)
+
+
+class _Spans(_Columns):
+    '''
+    语法匹配区域序列 (begin, end, scope, in_randomblock): 作用域存为_SCOPE_NAMES中的下标, in_randomblock存为array('b')
+    '''
+    __slots__ = ()
+    _TYPECODES = ('l', 'l', 'H', 'b')
+
+    def append(self, span):
+        begins, ends, scopes, in_randomblocks = self.columns
+        begins.append(span[0])
+        ends.append(span[1])
+        scopes.append(_SCOPE_NAMES.id(span[2]))
+        in_randomblocks.append(span[3])
+
+    def _item(self, k):
+        begins, ends, scopes, in_randomblocks = self.columns
+        return (begins[k], ends[k], _SCOPE_NAMES.names[scopes[k]], bool(in_randomblocks[k]))
+
+    def __iter__(self):
+        begins, ends, scopes, in_randomblocks = self.columns
+        return zip(begins, ends, map(_SCOPE_NAMES.names.__getitem__, scopes), map(bool, in_randomblocks))
+
+
+class _Checkpoint:
+    '''
+    增量解析的断点: 某行行首处的语法context栈与tag栈状态, 以及此前已产出的结果数量
+    '''
+    __slots__ = ('pos', 'contexts', 'tag_stack', 'list_stack', 'counts')
+
+    def __init__(self, pos, contexts, tag_stack, list_stack, counts):
+        self.pos = pos
+        self.contexts = tuple(contexts)
+        self.tag_stack = tuple(tag_stack)
+        self.list_stack = tuple(list_stack)
+        self.counts = counts
+
+
+# Document.revision的来源
+_revisions = itertools.count()
+
+
+class Document:
+    '''
+    BBCode文本的解析结果
+
+    tokens: (begin, end, tag, is_end, suffix) 作用域为BBCode tag的tag (按列存放)
+    spans: (begin, end, scope, in_randomblock) 语法规则匹配到的区域及其最内层作用域 (按列存放)
+    pairs: (开头tag, 结尾tag) 正确闭合的代码块 (按列存放)
+    errors: 解析过程中标记的错误tag (未闭合/不当闭合顺序代码块的开头tag, randomblock外的style)
+    attribute_errors: 取值不合法的属性 (如[color=reddd]中的reddd)
+    items: (所属list, [*]) list中所属[*]的区域 (按列存放)
+    open_tags: (tag, 区域) 解析结束时仍未闭合的tag
+    revision: 解析结果的编号, 每次解析/update各不相同
+    change: 由update增量解析时为(上一版本的revision, 脏区间, 重新解析的起点, 在上一版本中的终点, 重新解析得到的pairs的下标范围),
+        终点为None表示一直解析到了末尾; 其余情况为None. 供PairIndex增量更新
+    '''
+    _FIELDS = ('tokens', 'spans', 'pairs', 'errors', 'attribute_errors', 'items')
+
+    def __init__(self):
+        self.text = ''
+        self.tokens = _Tokens().frozen()
+        self.spans = _Spans().frozen()
+        self.pairs = _RegionPairs().frozen()
+        self.errors = []
+        self.attribute_errors = []
+        self.items = _RegionPairs().frozen()
+        self.open_tags = []
+        self.checkpoints = []
+        self.checkpoint_pos = []
+        self.revision = next(_revisions)
+        self.change = None
+
+    def error_regions(self):
+        '''
+        所有需要警告的tag区域
+        '''
+        return self.errors + [region for _, region in self.open_tags]
+
+    def diagnostics(self):
+        '''
+        未闭合/不当闭合顺序代码块及不合法的属性值, 按位置返回(行, 列, 结束行, 结束列, 信息, tag原文), 行列从1开始, 列按字符计数
+        '''
+        regions = sorted([(region, ERROR_MESSAGE) for region in self.error_regions()] +
+                         [(region, ATTRIBUTE_ERROR_MESSAGE) for region in self.attribute_errors])
+        if not regions:
+            return []
+
+        text = self.text
+        line_starts = [0]
+        pos = text.find('\n')
+        while pos != -1:
+            line_starts.append(pos + 1)
+            pos = text.find('\n', pos + 1)
+
+        diagnostics = []
+        for (begin, end), message in regions:
+            line = bisect.bisect_right(line_starts, begin)
+            end_line = bisect.bisect_right(line_starts, end)
+            diagnostics.append((line, begin - line_starts[line - 1] + 1, end_line, end - line_starts[end_line - 1] + 1,
+                                message, text[begin:end]))
+        return diagnostics
+
+    def span_at(self, pos):
+        '''
+        包含pos的语法匹配区域 (未被任何语法规则匹配时返回None)
+        '''
+        spans = self.spans
+        i = spans.begins.bisect_right(pos) - 1
+        if i >= 0 and spans.ends[i] > pos:
+            return spans[i]
+        return None
+
+    def scope_at(self, pos):
+        '''
+        pos处的最内层作用域 (未被任何语法规则匹配时返回None)
+        '''
+        span = self.span_at(pos)
+        return span[2] if span is not None else None
+
+    def token_at(self, pos):
+        '''
+        包含pos的tag (不存在时返回None)
+        '''
+        tokens = self.tokens
+        i = tokens.begins.bisect_right(pos) - 1
+        if i >= 0 and tokens.ends[i] > pos:
+            return tokens[i]
+        return None
+
+    def is_tag(self, pos):
+        scope = self.scope_at(pos)
+        return scope is not None and 'tag.bbcode.nga' in scope
+
+    def spans_within(self, begin, end):
+        '''
+        与[begin, end)相交的语法匹配区域
+        '''
+        # 区域互不重叠, 结尾位置同样有序
+        spans = self.spans
+        i = max(0, spans.begins.bisect_right(begin) - 1)
+        j = max(i, spans.begins.bisect_left(end))
+        for span in spans[i:j]:
+            if span[1] > begin:
+                yield span
+
+    def tokens_within(self, begin, end):
+        '''
+        完全位于[begin, end)中的tag
+        '''
+        # tag互不重叠, 结尾位置同样有序
+        tokens = self.tokens
+        i = tokens.begins.bisect_left(begin)
+        j = max(i, tokens.ends.bisect_right(end))
+        return iter(tokens[i:j])
+
+    def open_tags_at(self, pos):
+        '''
+        pos处尚未闭合的tag (tag, 区域), 由外向内排列
+
+        从pos之前最近的断点处的tag栈开始, 只重放断点与pos之间的tag, 不需要从头解析
+        '''
+        i = bisect.bisect_right(self.checkpoint_pos, pos) - 1
+        if i < 0:
+            return []
+        checkpoint = self.checkpoints[i]
+        tag_stack = list(checkpoint.tag_stack)
+        tokens = self.tokens
+        k = checkpoint.counts['tokens']
+        for begin, end, tag, is_end, _ in tokens[k:max(k, tokens.ends.bisect_right(pos))]:
+            if tag == 'fixsize' or tag == '*':
+                continue
+            if not is_end:
+                tag_stack.append((tag, (begin, end)))
+            elif tag_stack:
+                tag_stack.pop()
+        return tag_stack
+
+    def update(self, text, dirty=None):
+        '''
+        解析text. dirty为相对上一次解析的脏区间(lo, hi, delta): 改动后[lo, hi)之外的内容均未变化, delta为长度变化
+
+        从脏区间之前最近的断点开始重新解析, 当状态与上一次解析重新一致时, 直接复用上一次的后续结果
+        返回新的Document, 自身保持不变 (可供其他线程继续读取)
+        '''
+        return next(self.iter_update(text, dirty))
+
+    def iter_update(self, text, dirty=None, step=None):
+        '''
+        分段进行的update: 每处理约step个tag (在行首) 产出一次None, 最后产出新的Document
+
+        调用方可在两次产出之间让出线程, 或直接丢弃生成器以取消解析
+        '''
+        new = Document()
+        old = dict((field, getattr(self, field)) for field in self._FIELDS)
+        old_checkpoints = []
+        converge_from = len(text) + 1
+        lo = old_hi = delta = 0
+
+        if dirty is None or not self.checkpoints:
+            cp = _Checkpoint(0, ['main'], [], [], dict((field, 0) for field in self._FIELDS))
+            new.checkpoints = [cp]
+        else:
+            lo, hi, delta = dirty
+            old_hi = hi - delta
+            # 语法高亮逐行进行, 因此从脏区间所在行的行首之前开始
+            line_begin = text.rfind('\n', 0, lo) + 1
+            i = bisect.bisect_right(self.checkpoint_pos, line_begin) - 1
+            cp = self.checkpoints[i]
+            old_checkpoints = self.checkpoints[i + 1:]
+            new.checkpoints = self.checkpoints[:i + 1]
+            # 脏区间所在行之后的行才可能与上一次解析的结果重新一致
+            converge_from = text.find('\n', hi) + 1 or converge_from
+
+        def shift(region):
+            a, b = region
+            if b <= lo:
+                return region
+            if a >= old_hi:
+                return (a + delta, b + delta)
+            return None
+
+        new.text = text
+        # 断点之前的结果直接复用 (不复制), 重新解析的结果写入新的array, 完成后再拼接
+        prefix = dict((field, old[field][:cp.counts[field]]) for field in self._FIELDS)
+        tokens, spans, pairs, items = _Tokens(), _Spans(), _RegionPairs(), _RegionPairs()
+        errors, attribute_errors = prefix['errors'], prefix['attribute_errors']
+        parsed = {'tokens': tokens, 'spans': spans, 'pairs': pairs, 'items': items,
+                  'errors': errors, 'attribute_errors': attribute_errors}
+        reused = dict((field, len(prefix[field]) if parsed[field] is not prefix[field] else 0) for field in self._FIELDS)
+        span_begins, span_ends, span_scopes, span_flags = spans.columns
+        token_begins, token_ends, token_tags, token_is_ends, token_suffixes = tokens.columns
+        scope_names, tag_ids = _SCOPE_NAMES.names, _TAG_NAMES.ids
+        lexer = _Lexer(text, cp.pos, cp.contexts, spans, attribute_errors)
+        tag_stack = list(cp.tag_stack)
+        list_stack = list(cp.list_stack)     # 用于list多层嵌套时, 获取当前最内层的list
+
+        j = 0
+        k = 0
+        since = 0
+        since_yield = 0
+        prev_end = cp.pos
+        line_end = cp.pos - 1
+        converged = None
+
+        for match in TAG_PATTERN.finditer(text, cp.pos):
+            pos = match.start()
+
+            # 每行第一个tag处, 尝试与上一次解析重新一致, 或记录断点
+            if pos > line_end:
+                line_begin = text.rfind('\n', 0, pos) + 1
+                line_end = text.find('\n', pos)
+                if line_end == -1:
+                    line_end = len(text)
+                lexer.lex_to(line_begin)
+
+                if _is_clean_restart(text, prev_end, line_begin):
+                    if line_begin >= converge_from:
+                        while j < len(old_checkpoints) and old_checkpoints[j].pos + delta < line_begin:
+                            j += 1
+                        if j < len(old_checkpoints) and old_checkpoints[j].pos + delta == line_begin:
+                            old_cp = old_checkpoints[j]
+                            if (tuple(lexer.contexts) == old_cp.contexts and
+                                    tag_stack == [(tag, shift(region)) for tag, region in old_cp.tag_stack] and
+                                    list_stack == [shift(region) for region in old_cp.list_stack]):
+                                converged = old_cp
+                                break
+
+                    if since >= CHECKPOINT_INTERVAL:
+                        since = 0
+                        counts = dict((field, reused[field] + len(parsed[field])) for field in self._FIELDS)
+                        new.checkpoints.append(_Checkpoint(line_begin, lexer.contexts, tag_stack, list_stack, counts))
+
+                if step is not None and since_yield >= step:
+                    since_yield = 0
+                    yield None
+
+                lexer.lex_to(line_begin + 1)
+
+            prev_end = match.end()
+            since += 1
+            since_yield += 1
+
+            # 当前tag所在的语法匹配区域
+            while k < len(span_ends) and span_ends[k] <= pos:
+                k += 1
+            in_span = k < len(span_ends) and span_begins[k] <= pos
+
+            is_end, tag, suffix = match.groups()
+            region = match.span()
+            is_tag = in_span and 'tag.bbcode.nga' in scope_names[span_scopes[k]]
+            if is_tag:
+                # 直接追加到各列, 不为每个tag创建元组
+                tag_id = tag_ids.get(tag)
+                token_begins.append(region[0])
+                token_ends.append(region[1])
+                token_tags.append(tag_id if tag_id is not None else _TAG_NAMES.id(tag))
+                token_is_ends.append(is_end is not None)
+                token_suffixes.append(suffix)
+
+            # 跳过fixsize
+            if tag == 'fixsize':
+                continue
+
+            # 记录当前list所属[*]的区域
+            if tag == '*':
+                if list_stack:
+                    items.append((list_stack[-1], region))
+                continue
+
+            # 若非支持的BBCode tag, 则跳过
+            if not is_tag:
+                continue
+
+            # style在randomblock外进行警告
+            if tag == 'style' and not span_flags[k]:
+                errors.append(region)
+
+            # list多层嵌套处理
+            if tag == 'list':
+                if not is_end:
+                    list_stack.append(region)
+                elif list_stack:
+                    list_stack.pop()
+
+            if not is_end:
+                # 开头tag
+                tag_stack.append((tag, region))
+            else:
+                # 结尾tag
+                if tag_stack:
+                    start_tag, start_region = tag_stack.pop()
+                    if start_tag == tag:
+                        pairs.append((start_region, region))
+                    else:
+                        # 标记未闭合/不当闭合顺序代码块的开头tag
+                        errors.append(start_region)
+
+        if converged is None:
+            lexer.lex_to(len(text))
+        base = dict((field, reused[field] + len(parsed[field])) for field in self._FIELDS)
+        for field in ('tokens', 'spans', 'pairs', 'items'):
+            setattr(new, field, prefix[field] + parsed[field])
+        new.errors, new.attribute_errors = errors, attribute_errors
+        if dirty is not None and self.checkpoints:
+            new.change = (self.revision, dirty, cp.pos, converged.pos if converged is not None else None,
+                          cp.counts['pairs'], base['pairs'])
+
+        if converged is None:
+            new.open_tags = tag_stack
+        else:
+            # 复用上一次解析的后续结果: 只记录平移, 不逐项复制 (开头tag可能位于脏区间之前, 只平移位于其后的)
+            start = converged.counts
+            new.tokens += old['tokens'][start['tokens']:].shifted(delta)
+            new.spans += old['spans'][start['spans']:].shifted(delta)
+            new.pairs += old['pairs'][start['pairs']:].shifted(delta, old_hi)
+            new.items += old['items'][start['items']:].shifted(delta, old_hi)
+            errors += [shift(region) for region in old['errors'][start['errors']:]]
+            attribute_errors += [(b + delta, e + delta) for b, e in old['attribute_errors'][start['attribute_errors']:]]
+            new.open_tags = [(tag, shift(region)) for tag, region in self.open_tags]
+
+            for old_cp in old_checkpoints[j:]:
+                counts = dict((field, old_cp.counts[field] - start[field] + base[field]) for field in self._FIELDS)
+                new.checkpoints.append(_Checkpoint(
+                    old_cp.pos + delta,
+                    old_cp.contexts,
+                    [(tag, shift(region)) for tag, region in old_cp.tag_stack],
+                    [shift(region) for region in old_cp.list_stack],
+                    counts))
+
+        new.checkpoint_pos = [checkpoint.pos for checkpoint in new.checkpoints]
+        yield new
+
+
+def parse(text):
+    '''
+    解析整段BBCode文本
+    '''
+    return Document().update(text)
+
+
+def merge_dirty_span(span, a, b, size):
+    '''
+    将一次文本改动([a, b)被替换为长度size的文本)合并进脏区间
+
+    脏区间(lo, hi, delta)位于改动后的坐标系: [lo, hi)之外的内容均未变化, delta为累计长度变化
+    '''
+    d = size - (b - a)
+    if span is None:
+        return (a, a + size, d)
+
+    lo, hi, delta = span
+    if hi >= b:
+        hi += d
+    elif hi > a:
+        hi = a + size
+    return (min(lo, a), max(hi, a + size), delta + d)
+
+
+def _nest(begins, ends, first, stack, stop):
+    '''
+    按开头位置依次处理下标从first开始的代码块 (开头/结尾位置为begins/ends), stack为包裹它们的外层代码块(下标, 结尾位置), 由外向内
+
+    返回(各代码块的外层代码块, 小段的起始位置, 小段最内层的代码块), 只结束stop之前的代码块
+    '''
+    parents, bounds, owners = array('l'), array('l'), array('l')
+    add_parent, add_bound, add_owner = parents.append, bounds.append, owners.append
+    last = None     # 最后一个小段的起始位置
+
+    for k, begin, end in zip(itertools.count(first), begins, ends):
+        while stack and stack[-1][1] <= begin:
+            last = stack.pop()[1]
+            add_bound(last)
+            add_owner(stack[-1][0] if stack else -1)
+        add_parent(stack[-1][0] if stack else -1)
+        if begin == last:
+            # 前一个代码块的结尾紧接着当前代码块的开头 (结尾之间不会重合)
+            owners[-1] = k
+        else:
+            last = begin
+            add_bound(begin)
+            add_owner(k)
+        stack.append((k, end))
+    while stack and stack[-1][1] < stop:
+        add_bound(stack.pop()[1])
+        add_owner(stack[-1][0] if stack else -1)
+    return parents, bounds, owners
+
+
+class PairIndex:
+    '''
+    代码块(开头tag, 结尾tag)按位置排序的索引, 用于二分查找包裹某位置的代码块
+
+    匹配成功的代码块之间只有嵌套或不相交两种关系, 因此所有tag边界将全文划分为若干小段,
+    每一小段都对应唯一一个最内层的代码块
+
+    所有数据均按列存放在_Rope中 (每个代码块只占几个机器字). 由of从上一版本的索引建立时, 只重新计算重新解析的区间,
+    其余部分与上一版本共用; list中的[*]在查询时从Document.items中二分查找, 不单独建立索引
+    '''
+    __slots__ = ('starts', 'ends', 'parents', 'bounds', 'owners', 'items', 'text', 'revision', '_is_list', '_in_list')
+
+    def __init__(self, pairs=(), items=(), text=''):
+        if not isinstance(pairs, _RegionPairs):
+            pairs = _RegionPairs(pairs)
+        if not isinstance(items, _RegionPairs):
+            items = _RegionPairs(items)
+        columns = [list(pairs.first.begins), list(pairs.first.ends), list(pairs.second.begins), list(pairs.second.ends)]
+        # 按开头tag位置排序 (不同代码块的开头tag不会重合), 只对下标排序, 不逐项创建元组
+        order = sorted(range(len(pairs)), key=columns[0].__getitem__)
+        start_begins, start_ends, end_begins, end_ends = [array('l', [column[i] for i in order]) for column in columns]
+        parents, bounds, owners = _nest(start_begins, end_ends, 0, [], _POS_INF)
+
+        self.starts = _Regions([start_begins, start_ends]).frozen()
+        self.ends = _Regions([end_begins, end_ends]).frozen()
+        self.parents = _Rope.wrap(parents)
+        # 小段的起始位置, 以及该小段最内层的代码块
+        self.bounds = _Rope.wrap(bounds)
+        self.owners = _Rope.wrap(owners)
+        self.items = items.frozen()
+        self.text = text
+        self.revision = None
+        self._is_list = {}
+        self._in_list = {}
+
+    @classmethod
+    def of(cls, document, previous=None):
+        '''
+        document的代码块索引; previous为document由update增量解析之前的版本的索引时, 只更新重新解析的部分
+        '''
+        index = None
+        change = document.change
+        if previous is not None and change is not None and change[0] == previous.revision:
+            index = previous._updated(document)
+        if index is None:
+            index = cls(document.pairs, document.items, document.text)
+        index.revision = document.revision
+        return index
+
+    def _updated(self, document):
+        '''
+        按document.change更新: 开头tag位于重新解析的区间[begin, end)之前/之后的代码块在索引中的位置不变/整体平移,
+        只需重新排列开头tag位于区间中的代码块, 并修改跨过区间开头的外层代码块的结尾; 外层代码块有变化时返回None (需要重新建立)
+        '''
+        _, (lo, hi, delta), begin, old_end, p0, p1 = document.change
+        old_hi = hi - delta
+        if old_end is None:
+            old_end = new_end = _POS_INF
+            i1, b1 = len(self), len(self.bounds)
+        else:
+            new_end = old_end + delta
+            i1, b1 = self.starts.begins.bisect_left(old_end), self.bounds.bisect_left(old_end)
+        i0, b0 = self.starts.begins.bisect_left(begin), self.bounds.bisect_left(begin)
+
+        def shift(region):
+            # 开头tag或位于改动之前, 或开头不早于改动的结尾 (结尾恰好在改动处的tag不平移)
+            return (region[0] + delta, region[1] + delta) if region[0] >= old_hi else region
+
+        # 重新解析得到的代码块: 开头tag位于区间之前的(外层代码块)在区间中结束, 其余的位于区间中
+        reparsed = {}
+        middle = []
+        for start, end in document.pairs[p0:p1]:
+            if start[0] < begin:
+                reparsed[start] = end
+            else:
+                middle.append((start, end))
+
+        # 外层代码块: 在区间之后结束的, 结尾平移; 在区间中结束的, 须与重新解析的外层代码块一一对应
+        outer = []
+        for k in self.enclosing(begin):
+            start, end = self.starts[k], self.ends[k]
+            if start[0] >= begin:
+                continue
+            if end[0] >= old_end:
+                end = (end[0] + delta, end[1] + delta)
+            elif start in reparsed:
+                end = reparsed.pop(start)
+            else:
+                return None
+            outer.append((k, end))
+        if reparsed:
+            return None
+        outer.reverse()
+
+        # 开头tag位于区间中、在区间之后结束的代码块, 结尾平移
+        straddling = []
+        for k, (end_begin, end_end) in enumerate(self.ends[i0:i1], i0):
+            if end_begin >= old_end:
+                start = shift(self.starts[k])
+                middle.append((start, (end_begin + delta, end_end + delta)))
+                straddling.append((start[0], k))
+        middle.sort()
+
+        start_begins, start_ends, end_begins, end_ends = [array('l', column) for column in (
+            [start[0] for start, _ in middle], [start[1] for start, _ in middle],
+            [end[0] for _, end in middle], [end[1] for _, end in middle])]
+        parents, bounds, owners = _nest(start_begins, end_ends, i0, [(k, end[1]) for k, end in outer], new_end)
+
+        # 区间之后的小段及代码块引用的下标: 位于区间中的代码块改为新的下标, 之后的整体平移
+        steps = []
+        for start_begin, k in straddling:
+            steps += [(k, start_begins.index(start_begin) + i0 - k), (k + 1, 0)]
+        steps.append((i1, i0 + len(middle) - i1))
+        positions = [(_NEG_INF, delta)]
+
+        index = PairIndex.__new__(PairIndex)
+        ends = self.ends[:i0]
+        ends = _Regions([ends.begins.patched(dict((k, end[0]) for k, end in outer)),
+                         ends.ends.patched(dict((k, end[1]) for k, end in outer))])
+        index.starts = self.starts[:i0] + _Regions([start_begins, start_ends]) + self.starts[i1:].shifted(delta)
+        index.ends = ends + _Regions([end_begins, end_ends]) + self.ends[i1:].shifted(delta)
+        index.parents = self.parents[:i0] + parents + self.parents[i1:].remapped(steps)
+        index.bounds = self.bounds[:b0] + bounds + self.bounds[b1:].remapped(positions)
+        index.owners = self.owners[:b0] + owners + self.owners[b1:].remapped(steps)
+        index.items = document.items
+        index.text = document.text
+        index.revision = None
+        index._is_list = {}
+        index._in_list = {}
+        return index
+
+    def __len__(self):
+        return len(self.starts)
+
+    def is_list(self, k):
+        '''
+        代码块k是否为list
+        '''
+        memo = self._is_list
+        result = memo.get(k)
+        if result is None:
+            result = memo[k] = self.text.startswith('[list]', self.starts.begins[k])
+        return result
+
+    def in_list(self, k):
+        '''
+        代码块k自身或其外层是否为list
+        '''
+        memo = self._in_list
+        chain = []
+        j = k
+        while j != -1 and j not in memo:
+            chain.append(j)
+            j = self.parents[j]
+        result = memo.get(j, False)
+        for j in reversed(chain):
+            result = result or self.is_list(j)
+            memo[j] = result
+        return memo[k]
+
+    def innermost(self, pos):
+        '''
+        包裹pos的最内层代码块, 不存在时返回-1
+        '''
+        i = self.bounds.bisect_right(pos) - 1
+        return self.owners[i] if i >= 0 else -1
+
+    def innermost_all(self, positions):
+        '''
+        依次返回已排序的各位置及包裹它的最内层代码块 (按位置顺序扫描小段的边界, 而非逐个二分查找)
+        '''
+        owners = self.owners
+        for pos, i in zip(positions, self.bounds.bisect_right_all(positions)):
+            yield pos, owners[i - 1] if i > 0 else -1
+
+    def enclosing(self, pos):
+        '''
+        由内向外依次返回包裹pos的代码块
+        '''
+        k = self.innermost(pos)
+        while k != -1:
+            yield k
+            k = self.parents[k]
+
+    def depth_zero_ranges(self, size):
+        '''
+        按位置依次返回不在任何代码块中的区间[begin, end] (两端均可作为切分位置), size为全文长度
+        '''
+        bounds = self.bounds
+        if not bounds or bounds[0] > 0:
+            yield (0, bounds[0] if bounds else size)
+        begin = None
+        for bound, owner in zip(bounds, self.owners):
+            if begin is not None:
+                yield (begin, bound)
+            begin = bound if owner == -1 else None
+        if begin is not None:
+            yield (begin, size)
+
+    def containing(self, begin, end):
+        '''
+        由内向外依次返回完整包含[begin, end]的代码块 (含两侧tag)
+        '''
+        for k in self.enclosing(begin):
+            if self.ends[k][1] >= end:
+                yield k
+
+    def tag_at(self, pos):
+        '''
+        开头tag或结尾tag包含pos的代码块 (光标紧贴在tag右侧时也算), 不存在时返回-1
+
+        代码块自身的tag不会落在其内层代码块中, 因此只需检查包裹该位置的最内层代码块
+        '''
+        for p in (pos, pos - 1):
+            k = self.innermost(p)
+            if k != -1 and (self.starts[k][0] <= p < self.starts[k][1] or self.ends[k][0] <= p < self.ends[k][1]):
+                return k
+        return -1
+
+    def items_of(self, k):
+        '''
+        list代码块k中所有[*]的区域 (按位置排序)
+        '''
+        list_region = self.starts[k]
+        item_begins = self.items.second.begins
+        i, j = item_begins.bisect_left(list_region[1]), item_begins.bisect_left(self.ends[k][0])
+        return [item for owner, item in self.items[i:j] if owner == list_region]
+
+    def active_item(self, k, pos):
+        '''
+        list代码块k中, 位于pos前面的最后一个[*]
+        '''
+        if not self.is_list(k):
+            return None
+        list_begin, list_end = self.starts[k]
+        owners, item_begins = self.items.first.begins, self.items.second.begins
+        i = item_begins.bisect_right(pos) - 1
+        while i >= 0 and item_begins[i] >= list_end:
+            owner = owners[i]
+            if owner == list_begin:
+                return self.items.second[i]
+            # 属于内层的list, 跳过该list中的所有[*]
+            i = item_begins.bisect_left(owner) - 1 if owner > list_begin else i - 1
+        return None
@@ -0,0 +1,99 @@
+'''
+生成用于基准测试的NGA帖子
+'''
+import random
+
+
+_WORDS = ['艾泽拉斯', '国家地理', '角色', '剧情', '先行情报', 'PV', 'OP', 'ED', 'abc', 'Sublime', '测试', '第一段', '第二段']
+_INLINE = ['b', 'i', 'u', 'del', 'sup', 'h']
+
+
+def _text(rng, n=3):
+    return ' '.join(rng.choice(_WORDS) for _ in range(rng.randint(1, n)))
+
+
+def _inline(rng):
+    choice = rng.random()
+    if choice < 0.45:
+        tag = rng.choice(_INLINE)
+        return '[{0}]{1}[/{0}]'.format(tag, _text(rng))
+    if choice < 0.6:
+        return '[url]https://bbs.nga.cn/read.php?tid={}[/url]'.format(rng.randint(10000000, 99999999))
+    if choice < 0.7:
+        return '[url=https://www.bilibili.com/video/BV1{}?spm_id_from=333.1007&vd_source=abc]{}[/url]'.format(
+            rng.randint(1000, 9999), _text(rng))
+    if choice < 0.8:
+        return '[img]./mon_2025{:02d}/{:02d}/-9lddQ{}-ac.png[/img]'.format(rng.randint(1, 12), rng.randint(1, 28), rng.randint(0, 99999))
+    if choice < 0.9:
+        return '[color={}]{}[/color]'.format(rng.choice(['red', 'skyblue', 'bgteal']), _text(rng))
+    return '[size=120%]{}[/size]'.format(_text(rng))
+
+
+def _line(rng, n_inline=3):
+    return ' '.join([_text(rng)] + [_inline(rng) for _ in range(rng.randint(1, n_inline))])
+
+
+def nested_post(depth=40, repeat=50, seed=0):
+    '''
+    深层嵌套的[list]/[quote]/[collapse]
+    '''
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(repeat):
+        closing = []
+        for level in range(depth):
+            tag = ('list', 'quote', 'collapse')[level % 3]
+            if tag == 'list':
+                parts.append('[list]\n[*]' + _line(rng) + '\n[*]')
+            elif tag == 'collapse':
+                parts.append('[collapse={}]\n{}\n'.format(_text(rng, 1), _line(rng)))
+            else:
+                parts.append('[quote]' + _line(rng) + '\n')
+            closing.append(tag)
+        for tag in reversed(closing):
+            parts.append('[/{}]\n'.format(tag))
+    return ''.join(parts)
+
+
+def table_post(n_tables=120, rows=20, cols=4, seed=0):
+    '''
+    大量[table]
+    '''
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(n_tables):
+        parts.append(_line(rng) + '\n[table]\n')
+        for _ in range(rows):
+            cells = ''.join('[td]{}[/td]'.format(_inline(rng) if rng.random() < 0.5 else _text(rng)) for _ in range(cols))
+            parts.append('[tr]' + cells + '[/tr]\n')
+        parts.append('[/table]\n')
+    return ''.join(parts)
+
+
+def tag_post(n_tags=50000, seed=0):
+    '''
+    约n_tags个tag的普通长帖, 混合各类代码块
+    '''
+    rng = random.Random(seed)
+    parts = []
+    n = 0
+    while n < n_tags:
+        choice = rng.random()
+        if choice < 0.7:
+            line = _line(rng)
+        elif choice < 0.8:
+            line = '[quote]' + _line(rng) + '[/quote]'
+        elif choice < 0.9:
+            line = '[collapse={}]{}[/collapse]'.format(_text(rng, 1), _line(rng))
+        else:
+            line = '[list][*]{}[*]{}[/list]'.format(_line(rng), _line(rng))
+        n += line.count("[")
+        parts.append(line)
+    return '\n'.join(parts) + '\n'
+
+
+POSTS = {
+    'nested': nested_post,
+    'tables': table_post,
+    'tags': tag_post,
+}
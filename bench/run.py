@@ -0,0 +1,365 @@
+'''
+NGA BBCode 插件的基准测试
+
+不依赖 Sublime Text: 使用同目录下的 sublime / sublime_plugin 替身模块加载插件, 在生成的帖子上
+计时检查未闭合tag、光标高亮以及各右键菜单命令, 并以JSON格式输出结果
+
+    python bench/run.py [-o bench_output.json] [--repeat 5] [--scale 1.0]
+'''
+import argparse
+import importlib
+import json
+import os
+import platform
+import sys
+import time
+import types
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(1, ROOT)
+
+import sublime  # noqa: E402
+from posts import POSTS  # noqa: E402
+
+PACKAGE = sublime.PACKAGE
+
+
+def load_plugin():
+    '''
+    以包的形式加载插件 (插件内部使用相对导入)
+    '''
+    package = types.ModuleType(PACKAGE)
+    package.__path__ = [ROOT]
+    sys.modules[PACKAGE] = package
+    return dict((name, importlib.import_module(PACKAGE + '.' + name)) for name in ('bbcode', 'Highlighter', 'commands', 'jobs'))
+
+
+def timeit(func, repeat):
+    '''
+    执行repeat次func, 返回每次的耗时(ms)及最后一次的返回值
+    '''
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append((time.perf_counter() - start) * 1000)
+    return times, result
+
+
+def summarize(name, post, times, **extra):
+    times = sorted(times)
+    result = {
+        'name': name,
+        'post': post,
+        'runs': len(times),
+        'best_ms': round(times[0], 3),
+        'median_ms': round(times[len(times) // 2], 3),
+    }
+    result.update(extra)
+    return result
+
+
+def bench_lint(plugin, post, text, repeat):
+    Highlighter = plugin['Highlighter'].Highlighter
+    results = []
+
+    def full():
+        view = sublime.View(text)
+        highlighter = Highlighter(view)
+        highlighter._check_unclosed_tags()
+        return view, highlighter
+
+    times, (view, highlighter) = timeit(full, repeat)
+    results.append(summarize('lint_full', post, times, calls=dict(view.calls), errors=len(view.get_regions('error'))))
+
+    # 在文档中间输入一个字符后的增量检查
+    def typing():
+        pos = len(view.text) // 2
+        view.insert(None, pos, 'x')
+        highlighter.record_change(pos, pos, 1, view.change_count())
+        highlighter._check_unclosed_tags()
+
+    times, _ = timeit(typing, repeat)
+    results.append(summarize('lint_incremental', post, times))
+    return results, highlighter
+
+
+def bench_chunked_lint(plugin, post, text, repeat):
+    '''
+    大文件分段检查: 首次调用(可见区域临时结果+第一段)的耗时, 单段最长耗时, 以及全部完成的总耗时
+    '''
+    Highlighter = plugin['Highlighter'].Highlighter
+    settings = sublime.load_settings('BBCode-NGA.sublime-settings')
+    settings.set('chunked_lint_threshold', 1)
+
+    first_times, max_slices, total_times = [], [], []
+    for _ in range(repeat):
+        view = sublime.View(text)
+        highlighter = Highlighter(view)
+        slices = []
+        finished = []
+        continue_lint = highlighter._continue_lint
+
+        def timed_slice():
+            start = time.perf_counter()
+            continue_lint()
+            slices.append((time.perf_counter() - start) * 1000)
+            if highlighter.lint_job is None:
+                finished.append(True)
+
+        # 后续各段由插件的工作线程执行
+        highlighter._continue_lint = timed_slice
+        start = time.perf_counter()
+        highlighter._check_unclosed_tags()
+        first_times.append((time.perf_counter() - start) * 1000)
+        # 最后一段(建立索引并发布结果)开始时lint_job已清空, 等该段执行完, 以免与之后的计时同时进行
+        while not finished:
+            time.sleep(0.001)
+        total_times.append((time.perf_counter() - start) * 1000)
+        max_slices.append(max(slices))
+
+    del settings['chunked_lint_threshold']
+    return [
+        summarize('lint_chunked_first_call', post, first_times),
+        summarize('lint_chunked_max_slice', post, max_slices),
+        summarize('lint_chunked_total', post, total_times, errors=len(view.get_regions('error'))),
+    ]
+
+
+def bench_cursors(plugin, post, highlighter, repeat, n_cursors=1000):
+    view = highlighter.view
+    size = view.size()
+    positions = [size * (i + 1) // (n_cursors + 1) for i in range(n_cursors)]
+
+    view.sel().clear()
+    view.sel().add_all(sublime.Region(pos) for pos in positions)
+
+    def highlight():
+        highlighter.last_cursors_pos = []
+        highlighter._process_cursor_move()
+
+    times, _ = timeit(highlight, repeat)
+    return [summarize('cursor_highlight', post, times, cursors=n_cursors, pairs=len(highlighter.pair_index))]
+
+
+def bench_completions(plugin, post, highlighter, n_positions=200):
+    '''
+    各处的补全: 检查结果与内容一致时求tag栈的耗时, 以及刚输入"[/"、尚未重新检查时的补全耗时 (需要扫描改动处)
+    '''
+    view = highlighter.view
+    size = view.size()
+    positions = [size * (i + 1) // (n_positions + 1) for i in range(n_positions)]
+
+    exact_times, stale_times = [], []
+    for pos in positions:
+        start = time.perf_counter()
+        highlighter._open_tags_at(pos)
+        exact_times.append((time.perf_counter() - start) * 1000)
+
+    highlighter._check_unclosed_tags()
+    for pos in reversed(positions):
+        view.insert(None, pos, '[/')
+        highlighter.record_change(pos, pos, 2, view.change_count())
+        start = time.perf_counter()
+        highlighter.on_query_completions('', [pos + 2])
+        stale_times.append((time.perf_counter() - start) * 1000)
+        view.erase(None, sublime.Region(pos, pos + 2))
+        highlighter.record_change(pos, pos + 2, 0, view.change_count())
+    return [
+        summarize('completions', post, exact_times, max_ms=round(max(exact_times), 3)),
+        summarize('completions_stale', post, stale_times, max_ms=round(max(stale_times), 3)),
+    ]
+
+
+def bench_toggle_commands(plugin, post, text, repeat, n_positions=100):
+    '''
+    通过替身View查询作用域: 逐点scope_name, 右键菜单的is_visible, 以及在选区两侧添加再去除tag (match_selector)
+    '''
+    commands = plugin['commands']
+    view = sublime.View(text)
+    step = max(1, len(text) // n_positions)
+    results = []
+
+    times, scopes = timeit(lambda: [view.scope_name(pos) for pos in range(0, len(text), step)], repeat)
+    results.append(summarize('scope_name', post, times, tag_scopes=sum('tag.bbcode.nga' in scope for scope in scopes)))
+    times, visible = timeit(lambda: commands.DecodeCommand(view).is_visible(), repeat)
+    results.append(summarize('is_visible', post, times, visible=visible))
+
+    middle = len(text) // 2
+    for name, command in (
+        ('toggle_bold', commands.ToggleBoldCommand),
+        ('toggle_quote', commands.ToggleQuoteCommand),
+    ):
+        def toggle_twice():
+            view.sel().clear()
+            view.sel().add(sublime.Region(middle, middle + step))
+            command(view).run(None)
+            command(view).run(None)
+            return view.text == text
+
+        times, restored = timeit(toggle_twice, repeat)
+        results.append(summarize(name, post, times, restored=restored))
+    return results
+
+
+def bench_commands(plugin, post, text, repeat):
+    commands = plugin['commands']
+    settings = sublime.load_settings('BBCode-NGA.sublime-settings')
+    # 计时的是转换本身, 不在后台进行
+    settings.set('background_command_threshold', 0)
+    results = []
+    for name, command in (
+        ('decode', commands.DecodeCommand),
+        ('condense_url', commands.CondenseUrlCommand),
+        ('replace_img', commands.ReplaceImgCommand),
+        ('transform_pipeline', commands.TransformPipelineCommand),
+        ('table_to_markdown', commands.TableToMarkdownCommand),
+    ):
+        times = []
+        error = None
+        for _ in range(repeat):
+            view = sublime.View(text)
+            if command is commands.TableToMarkdownCommand:
+                view.sel().clear()
+                view.sel().add(sublime.Region(0, len(text)))
+            start = time.perf_counter()
+            try:
+                command(view).run(None)
+            except Exception as e:
+                # 记录失败的命令, 不影响其余项目
+                error = '{}: {}'.format(type(e).__name__, e)
+                break
+            times.append((time.perf_counter() - start) * 1000)
+
+        if error is None:
+            results.append(summarize(name, post, times, calls=dict(view.calls), size_after=view.size()))
+        else:
+            results.append({'name': name, 'post': post, 'error': error})
+
+    # 高亮检查之后执行命令, 复用同一版本的解析结果
+    Highlighter = plugin['Highlighter'].Highlighter
+    times = []
+    for _ in range(repeat):
+        view = sublime.View(text)
+        Highlighter(view)._check_unclosed_tags()
+        start = time.perf_counter()
+        commands.DecodeCommand(view).run(None)
+        times.append((time.perf_counter() - start) * 1000)
+    results.append(summarize('decode_after_lint', post, times, calls=dict(view.calls), size_after=view.size()))
+    del settings['background_command_threshold']
+    return results
+
+
+def bench_markdown(plugin, post, text, repeat):
+    '''
+    Markdown转BBCode: 先用table转Markdown得到Markdown文本, 再计时转换回BBCode
+    '''
+    commands = plugin['commands']
+    settings = sublime.load_settings('BBCode-NGA.sublime-settings')
+    settings.set('background_command_threshold', 0)
+    view = sublime.View(text)
+    view.sel().clear()
+    view.sel().add(sublime.Region(0, len(text)))
+    commands.TableToMarkdownCommand(view).run(None)
+    del settings['background_command_threshold']
+    markdown = view.substr(sublime.Region(0, view.size()))
+
+    times = []
+    for _ in range(repeat):
+        view = sublime.View(markdown)
+        start = time.perf_counter()
+        commands.MarkdownToBbcodeCommand(view).run(None)
+        times.append((time.perf_counter() - start) * 1000)
+    return [summarize('markdown_to_bbcode', post, times, calls=dict(view.calls), size_before=len(markdown), size_after=view.size())]
+
+
+def bench_background_command(plugin, post, text, repeat):
+    '''
+    后台转换: 命令本身(读取快照并启动)的耗时, 单段最长耗时, 以及应用结果前的总耗时
+    '''
+    jobs = plugin['jobs']
+    settings = sublime.load_settings('BBCode-NGA.sublime-settings')
+    settings.set('background_command_threshold', 1)
+
+    first_times, max_slices, total_times = [], [], []
+    for _ in range(repeat):
+        view = sublime.View(text)
+        slices = []
+        continue_job = jobs._continue
+
+        def timed_slice(job):
+            start = time.perf_counter()
+            continue_job(job)
+            slices.append((time.perf_counter() - start) * 1000)
+
+        # 各段由插件的工作线程执行
+        jobs._continue = timed_slice
+        start = time.perf_counter()
+        plugin['commands'].DecodeCommand(view).run(None)
+        first_times.append((time.perf_counter() - start) * 1000)
+        # 结果应用后内容才会改变
+        while view.change_count() == 0:
+            time.sleep(0.001)
+        total_times.append((time.perf_counter() - start) * 1000)
+        max_slices.append(max(slices))
+        jobs._continue = continue_job
+
+    del settings['background_command_threshold']
+    return [
+        summarize('decode_background_first_call', post, first_times),
+        summarize('decode_background_max_slice', post, max_slices),
+        summarize('decode_background_total', post, total_times, size_after=view.size()),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o', '--output', help='JSON输出路径 (默认输出到stdout)')
+    parser.add_argument('--repeat', type=int, default=5, help='每项重复次数')
+    parser.add_argument('--scale', type=float, default=1.0, help='帖子规模的缩放比例')
+    parser.add_argument('--posts', nargs='*', default=sorted(POSTS), choices=sorted(POSTS), help='参与测试的帖子类型')
+    args = parser.parse_args()
+
+    plugin = load_plugin()
+    scale = args.scale
+    params = {
+        'nested': {'depth': 40, 'repeat': max(1, int(50 * scale))},
+        'tables': {'n_tables': max(1, int(120 * scale))},
+        'tags': {'n_tags': max(1, int(50000 * scale))},
+    }
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'posts': {},
+        'results': [],
+    }
+    for post in args.posts:
+        text = POSTS[post](**params[post])
+        report['posts'][post] = {'params': params[post], 'chars': len(text), 'tags': len(plugin['bbcode'].parse(text).tokens)}
+
+        results, highlighter = bench_lint(plugin, post, text, args.repeat)
+        report['results'] += results
+        report['results'] += bench_chunked_lint(plugin, post, text, args.repeat)
+        report['results'] += bench_cursors(plugin, post, highlighter, args.repeat)
+        report['results'] += bench_completions(plugin, post, highlighter)
+        report['results'] += bench_toggle_commands(plugin, post, text, args.repeat)
+        report['results'] += bench_commands(plugin, post, text, args.repeat)
+        report['results'] += bench_markdown(plugin, post, text, args.repeat)
+        report['results'] += bench_background_command(plugin, post, text, args.repeat)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
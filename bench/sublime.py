@@ -0,0 +1,271 @@
+'''
+用于基准测试的 sublime 模块替身, 只实现插件用到的API
+'''
+import importlib
+import re
+
+
+# 基准测试以该包名加载插件 (插件内部使用相对导入, 解析器也须通过该包导入)
+PACKAGE = 'bbcode_nga'
+INHIBIT_WORD_COMPLETIONS = 8
+
+
+def version():
+    return '4192'
+
+
+def set_timeout(callback, delay=0):
+    callback()
+
+
+def set_timeout_async(callback, delay=0):
+    callback()
+
+
+_settings = {}
+
+
+def load_settings(name):
+    # 与Sublime一致, 同名设置返回同一个对象
+    return _settings.setdefault(name, Settings())
+
+
+def status_message(message):
+    pass
+
+
+class Region:
+    __slots__ = ('a', 'b', 'xpos')
+
+    def __init__(self, a, b=None, xpos=-1):
+        self.a = a
+        self.b = a if b is None else b
+        self.xpos = xpos
+
+    def __repr__(self):
+        return 'Region({}, {})'.format(self.a, self.b)
+
+    def __eq__(self, other):
+        return isinstance(other, Region) and self.a == other.a and self.b == other.b
+
+    def __hash__(self):
+        return hash((self.a, self.b))
+
+    def __len__(self):
+        return self.size()
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def size(self):
+        return abs(self.b - self.a)
+
+    def empty(self):
+        return self.a == self.b
+
+    def contains(self, x):
+        if isinstance(x, Region):
+            return self.begin() <= x.begin() and x.end() <= self.end()
+        return self.begin() <= x <= self.end()
+
+    def to_tuple(self):
+        return (self.a, self.b)
+
+
+class Settings(dict):
+    def get(self, key, default=None):
+        return dict.get(self, key, default)
+
+    def set(self, key, value):
+        self[key] = value
+
+    def add_on_change(self, tag, callback):
+        pass
+
+    def clear_on_change(self, tag):
+        pass
+
+
+class Selection:
+    def __init__(self, regions=None):
+        self.regions = list(regions or [Region(0)])
+
+    def __iter__(self):
+        # 与Sublime一致, 返回的是选区的副本, 之后的修改不会改变已取得的Region
+        return iter([Region(region.a, region.b, region.xpos) for region in self.regions])
+
+    def __len__(self):
+        return len(self.regions)
+
+    def __getitem__(self, index):
+        region = self.regions[index]
+        return Region(region.a, region.b, region.xpos)
+
+    def clear(self):
+        self.regions = []
+
+    def add(self, region):
+        self.regions.append(region)
+        self.regions.sort(key=lambda region: region.begin())
+
+    def add_all(self, regions):
+        self.regions.extend(regions)
+        self.regions.sort(key=lambda region: region.begin())
+
+    def _adjust(self, pos, delta):
+        for region in self.regions:
+            if region.a >= pos:
+                region.a = max(pos, region.a + delta)
+            if region.b >= pos:
+                region.b = max(pos, region.b + delta)
+
+
+class View:
+    '''
+    只保存一段文本的View, 作用域由插件自带的解析器模拟
+    '''
+    _next_id = 1
+    VISIBLE_LINES = 60
+
+    def __init__(self, text='', syntax='Packages/BBCode (NGA)/BBCode (NGA).sublime-syntax'):
+        self.text = text
+        self._id = View._next_id
+        View._next_id += 1
+        self._change_count = 0
+        self._sel = Selection()
+        self._settings = Settings(syntax=syntax)
+        self._regions = {}
+        self._document = None
+        self._document_change_count = -1
+        # 各API的调用次数, 用于衡量与Sublime之间的通信量
+        self.calls = {}
+
+    def _count(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def id(self):
+        return self._id
+
+    def buffer_id(self):
+        return self._id
+
+    def window(self):
+        return None
+
+    def file_name(self):
+        return None
+
+    def name(self):
+        return ''
+
+    def is_loading(self):
+        return False
+
+    def is_valid(self):
+        return True
+
+    def settings(self):
+        return self._settings
+
+    def change_count(self):
+        return self._change_count
+
+    def size(self):
+        return len(self.text)
+
+    def sel(self):
+        return self._sel
+
+    def substr(self, x):
+        self._count('substr')
+        if isinstance(x, Region):
+            return self.text[x.begin():x.end()]
+        return self.text[x:x + 1]
+
+    def _modify(self, begin, end, string):
+        self.text = self.text[:begin] + string + self.text[end:]
+        self._change_count += 1
+        self._sel._adjust(end, len(string) - (end - begin))
+
+    def insert(self, edit, pt, string):
+        self._count('insert')
+        self._modify(pt, pt, string)
+        return len(string)
+
+    def erase(self, edit, region):
+        self._count('erase')
+        self._modify(region.begin(), region.end(), '')
+
+    def replace(self, edit, region, string):
+        self._count('replace')
+        self._modify(region.begin(), region.end(), string)
+
+    def _scopes(self, pt):
+        if self._document_change_count != self._change_count:
+            self._document = importlib.import_module(PACKAGE + '.bbcode').parse(self.text)
+            self._document_change_count = self._change_count
+        scope = self._document.scope_at(pt)
+        return 'source.bbcode.nga ' + scope if scope else 'source.bbcode.nga'
+
+    def scope_name(self, pt):
+        self._count('scope_name')
+        return self._scopes(pt) + ' '
+
+    def match_selector(self, pt, selector):
+        self._count('match_selector')
+        return all(part in self._scopes(pt) for part in selector.split())
+
+    def find_all(self, pattern, flags=0, fmt=None, extractions=None, within=None):
+        self._count('find_all')
+        if within is None:
+            matches = re.finditer(pattern, self.text)
+        else:
+            matches = re.compile(pattern).finditer(self.text, within.begin(), within.end())
+        return [Region(*match.span()) for match in matches]
+
+    def add_regions(self, key, regions, scope='', icon='', flags=0, *args, **kwargs):
+        self._count('add_regions')
+        self._regions[key] = list(regions)
+
+    def get_regions(self, key):
+        return list(self._regions.get(key, []))
+
+    def erase_regions(self, key):
+        self._regions.pop(key, None)
+
+    def run_command(self, name, args=None):
+        # 按命令名找到插件中对应的TextCommand (如 bbcode_apply_edits -> BbcodeApplyEditsCommand)
+        import sublime_plugin
+        class_name = ''.join(part.capitalize() for part in name.split('_')) + 'Command'
+        pending = list(sublime_plugin.TextCommand.__subclasses__())
+        while pending:
+            command = pending.pop()
+            if command.__name__ == class_name:
+                return command(self).run(None, **(args or {}))
+            pending += command.__subclasses__()
+        raise KeyError(name)
+
+    def show_popup(self, content, flags=0, location=-1, *args, **kwargs):
+        pass
+
+    def set_status(self, key, value):
+        pass
+
+    def erase_status(self, key):
+        pass
+
+    def visible_region(self):
+        # 视为从开头显示VISIBLE_LINES行
+        end = -1
+        for _ in range(self.VISIBLE_LINES):
+            end = self.text.find('\n', end + 1)
+            if end == -1:
+                return Region(0, len(self.text))
+        return Region(0, end)
+
+    def rowcol(self, pt):
+        row = self.text.count('\n', 0, pt)
+        return (row, pt - (self.text.rfind('\n', 0, pt) + 1))
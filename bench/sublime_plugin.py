@@ -0,0 +1,39 @@
+'''
+用于基准测试的 sublime_plugin 模块替身
+'''
+
+
+class EventListener:
+    pass
+
+
+class ViewEventListener:
+    def __init__(self, view):
+        self.view = view
+
+
+class TextChangeListener:
+    def __init__(self):
+        self.buffer = None
+
+
+class TextCommand:
+    def __init__(self, view):
+        self.view = view
+
+
+class WindowCommand:
+    def __init__(self, window):
+        self.window = window
+
+
+class ApplicationCommand:
+    pass
+
+
+class ListInputHandler:
+    pass
+
+
+class TextInputHandler:
+    pass
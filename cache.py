@@ -0,0 +1,122 @@
+import sublime
+from threading import Lock
+from collections import OrderedDict
+from .bbcode import PairIndex, parse, merge_dirty_span
+from .scheduler import get_setting
+
+
+__all__ = ['documents']
+
+
+class _Entry:
+    __slots__ = ('change_count', 'document', 'pair_index', 'dirty', 'dirty_change_count')
+
+    def __init__(self, change_count, document, pair_index=None):
+        self.change_count = change_count
+        self.document = document
+        self.pair_index = pair_index
+        # 此后改动的脏区间及其对应的change_count (有改动未被记录时为None), 用于未缓存当前版本时增量解析
+        self.dirty = None
+        self.dirty_change_count = change_count
+
+
+class DocumentCache:
+    '''
+    按buffer缓存解析结果: 同一buffer的同一版本(change_count)只解析一次, 供高亮及各命令共用
+
+    缓存的Document不会再被修改, 可在多个线程间共享; 超出容量时淘汰最久未使用的buffer
+    '''
+    def __init__(self):
+        # buffer id -> _Entry, 按最近使用排序
+        self._entries = OrderedDict()
+        # buffer id -> 最近一次记录的改动后的change_count
+        self._recorded = {}
+        self._lock = Lock()
+
+    def peek(self, buffer_id, change_count):
+        '''
+        该buffer指定版本的(Document, PairIndex), 未缓存时返回None (PairIndex可能为None)
+        '''
+        with self._lock:
+            entry = self._entries.get(buffer_id)
+            if entry is None or entry.change_count != change_count:
+                return None
+            self._entries.move_to_end(buffer_id)
+            return entry.document, entry.pair_index
+
+    def put(self, buffer_id, change_count, document, pair_index=None):
+        '''
+        缓存该buffer某一版本的解析结果 (替换该buffer之前的版本)
+        '''
+        with self._lock:
+            entry = _Entry(change_count, document, pair_index)
+            if self._recorded.get(buffer_id, change_count) > change_count:
+                # 解析的内容读取之后已记录了新的改动, 之后无法增量解析
+                entry.dirty_change_count = None
+            self._entries[buffer_id] = entry
+            self._entries.move_to_end(buffer_id)
+            capacity = max(1, get_setting('parse_cache_size', 8))
+            while len(self._entries) > capacity:
+                self._entries.popitem(last=False)
+
+    def discard(self, buffer_id):
+        with self._lock:
+            self._entries.pop(buffer_id, None)
+            self._recorded.pop(buffer_id, None)
+
+    def record_change(self, buffer_id, a, b, size, change_count):
+        '''
+        记录一次文本改动 (由DirtySpanRecorder在主线程调用), 合并进缓存版本之后的脏区间
+        '''
+        with self._lock:
+            self._recorded[buffer_id] = change_count
+            entry = self._entries.get(buffer_id)
+            if entry is not None and entry.dirty_change_count is not None:
+                entry.dirty = merge_dirty_span(entry.dirty, a, b, size)
+                entry.dirty_change_count = change_count
+
+    def get(self, view):
+        '''
+        view当前内容的解析结果, 未缓存时解析并缓存: 记录了缓存版本之后的所有改动时, 从缓存版本增量解析, 否则解析整个buffer
+        '''
+        buffer_id, change_count = view.buffer_id(), view.change_count()
+        with self._lock:
+            entry = self._entries.get(buffer_id)
+            if entry is None:
+                base = base_index = dirty = None
+            else:
+                self._entries.move_to_end(buffer_id)
+                if entry.change_count == change_count:
+                    return entry.document
+                base = entry.document if entry.dirty_change_count == change_count else None
+                base_index = entry.pair_index if base is not None else None
+                dirty = entry.dirty
+
+        content = view.substr(sublime.Region(0, view.size()))
+        document = base.update(content, dirty) if base is not None else parse(content)
+        # 缓存版本已建立代码块索引时, 同样增量更新
+        pair_index = PairIndex.of(document, base_index) if base_index is not None else None
+        # 读取内容期间没有发生改动时才缓存
+        if view.change_count() == change_count:
+            self.put(buffer_id, change_count, document, pair_index)
+        return document
+
+    def pair_index(self, view):
+        '''
+        view当前内容的代码块索引, 按需建立并缓存
+        '''
+        buffer_id, change_count = view.buffer_id(), view.change_count()
+        cached = self.peek(buffer_id, change_count)
+        if cached is not None and cached[1] is not None:
+            return cached[1]
+
+        document = cached[0] if cached is not None else self.get(view)
+        pair_index = PairIndex.of(document)
+        with self._lock:
+            entry = self._entries.get(buffer_id)
+            if entry is not None and entry.document is document:
+                entry.pair_index = pair_index
+        return pair_index
+
+
+documents = DocumentCache()
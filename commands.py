@@ -1,16 +1,41 @@
 import sublime
 import sublime_plugin
-import re
 from .utils import *
+from .transforms import TRANSFORMS, pipeline, coalesce
+from .tables import table_to_markdown
+from .markdown import markdown_to_bbcode
+from .splitter import split_post
+from .cache import documents
+from . import jobs
+from .scheduler import get_setting
+from .profiling import profiled
 
 
-NGA_DOMAIN = '(' + '|'.join(['bbs.nga.cn', 'ngabbs.com', 'nga.178.com']) + ')'
+def _target_ranges(view, size):
+    '''
+    所选区域 (若没选中内容, 则默认为全文), 从后往前排列, 使修改后面的区域时前面的位置保持不变
+    '''
+    selections = list(view.sel())
+    if len(selections) == 1 and selections[0].empty():
+        return [(0, size)]
+    return [(region.begin(), region.end()) for region in reversed(selections)]
+
+
+def _apply_pipeline(view, edit, title, names):
+    '''
+    解析一次, 在各所选区域内依次应用names中的转换, 每个区域只替换一次 (大文件在后台进行, 见jobs.start)
+    '''
+    def compute(document, begin, end):
+        return coalesce(document.text, pipeline(document, names, begin, end)), None
+
+    jobs.start(view, edit, title, _target_ranges(view, view.size()), compute)
 
 
 class ToggleBoldCommand(sublime_plugin.TextCommand):
     '''
     在选中区域两侧 添加/去除 [b][/b]
     '''
+    @profiled('command.toggle_bold')
     def run(self, edit):
         toggle(self.view, edit, 'b')
 
@@ -19,6 +44,7 @@ class ToggleUnderlineCommand(sublime_plugin.TextCommand):
     '''
     在选中区域两侧 添加/去除 [u][/u]
     '''
+    @profiled('command.toggle_underline')
     def run(self, edit):
         toggle(self.view, edit, 'u')
 
@@ -27,6 +53,7 @@ class ToggleItalicCommand(sublime_plugin.TextCommand):
     '''
     在选中区域两侧 添加/去除 [i][/i]
     '''
+    @profiled('command.toggle_italic')
     def run(self, edit):
         toggle(self.view, edit, 'i')
 
@@ -35,6 +62,7 @@ class ToggleQuoteCommand(sublime_plugin.TextCommand):
     '''
     在选中区域两侧 添加/去除 [quote][/quote]
     '''
+    @profiled('command.toggle_quote')
     def run(self, edit):
         toggle(self.view, edit, 'quote')
 
@@ -47,21 +75,10 @@ class DecodeCommand(sublime_plugin.TextCommand):
     (转换前) [b]加粗[/b] [i]斜体[/i]
     (转换后) [[size=0%][/size]b]加粗[[size=0%][/size]/b] [[size=0%][/size]i]斜体[[size=0%][/size]/i]
     '''
+    @profiled('command.decode')
     def run(self, edit):
-        pattern = '\['
-
-        for select_region in self.view.sel():
-            # 捕获所选区域的所有'[' (若没选中内容, 则默认对全文进行操作)
-            if len(self.view.sel()) == 1 and select_region.empty():
-                regions = find_all(self.view, pattern)
-            else:
-                regions = find_all(self.view, pattern, within=select_region)
-
-            for region in reversed(regions):
-                scopes = self.view.scope_name(region.a).split()
-                # 将"[tag]...[/tag]"变为"[[size=0%][/size]tag]...[[size=0%][/size]/tag]"
-                if 'tag.bbcode.nga' in scopes[-1]:
-                    self.view.insert(edit, region.a + 1, '[size=0%][/size]')
+        # 将"[tag]...[/tag]"变为"[[size=0%][/size]tag]...[[size=0%][/size]/tag]", 所有插入合并为一次替换
+        _apply_pipeline(self.view, edit, 'BBCode转纯文本', ['decode'])
 
     def is_visible(self):
         return self.view.match_selector(0, 'source.bbcode.nga')
@@ -82,25 +99,10 @@ class CondenseUrlCommand(sublime_plugin.TextCommand):
     (转换前) [url=https://www.bilibili.com/bangumi/play/ep1642068?season_id=90684&season_type=1&aid=114424941643282&season_cover=https%3A%2F%2Fi0.hdslb.com%2Fbfs%2Fbangumi%2Fimage%2F2f5946880c07914d1cccd112702884f232b647e0.png&title=7&long_title=%E9%9E%A0%E8%BA%AC%E8%A6%81%E6%B7%B1%20%E5%BF%97%E5%90%91%E8%A6%81%E9%AB%98&player_width=1920&player_height=1080&player_rotate=0&ep_status=13&is_preview=0&spm_id_from=333.1365.list.card_pgc.click]末日后酒店EP7[/url]
     (转换后) [url=https://www.bilibili.com/bangumi/play/ep1642068]末日后酒店EP7[/url]
     '''
+    @profiled('command.condense_url')
     def run(self, edit):
-        pattern = '(https://)?(' + NGA_DOMAIN + '/)|(www.bilibili.com/[^\[\]\s]+)'
-
-        for select_region in self.view.sel():
-            # 捕获所选区域的所有NGA域名/B站链接 (若没选中内容, 则默认对全文进行操作)
-            if len(self.view.sel()) == 1 and select_region.empty():
-                regions = find_all(self.view, pattern)
-            else:
-                regions = find_all(self.view, pattern, within=select_region)
-
-            for region in reversed(regions):
-                scopes = self.view.scope_name(region.a).split()
-                # 将URL中的NGA域名精简成"/", B站链接去掉"?"之后的内容
-                if 'link' in scopes[-1]:
-                    url = self.view.substr(region)
-                    if 'bilibili' in url:
-                        self.view.replace(edit, region, url.split('?')[0])
-                    else:
-                        self.view.replace(edit, region, '/')
+        # 将URL中的NGA域名精简成"/", B站链接去掉"?"之后的内容
+        _apply_pipeline(self.view, edit, 'url精简', ['condense_url'])
 
     def is_visible(self):
         return self.view.match_selector(0, 'source.bbcode.nga')
@@ -114,21 +116,36 @@ class ReplaceImgCommand(sublime_plugin.TextCommand):
     (转换前) [quote][img]./mon_202505/22/-9lddQ1aa-axbtK2aT1kSac-ac.png[/img][/quote]
     (转换后) [quote]__图__[/quote]
     '''
+    @profiled('command.replace_img')
     def run(self, edit):
-        pattern = '\[img\](.+?)\[/img\]'
+        # 将"[img]...[/img]"变为"__图__"
+        _apply_pipeline(self.view, edit, 'img转占位符', ['replace_img'])
+
+    def is_visible(self):
+        return self.view.match_selector(0, 'source.bbcode.nga')
+
+
+class TransformPipelineCommand(sublime_plugin.TextCommand):
+    '''依次转换: 按顺序对选中区域应用多个转换 (decode/condense_url/replace_img), 只解析一次并只替换一次
 
-        for select_region in self.view.sel():
-            # 捕获所选区域的img块 (若没选中内容, 则默认对全文进行操作)
-            if len(self.view.sel()) == 1 and select_region.empty():
-                regions = find_all(self.view, pattern)
-            else:
-                regions = find_all(self.view, pattern, within=select_region)
+    转换列表取自参数transforms, 未指定时使用设置中的pipeline_transforms, 结果与依次执行各命令相同
+
+    示例 (transforms=["condense_url", "replace_img"])
+    ----
+    (转换前) [url=https://bbs.nga.cn/read.php?tid=43417488][img]./mon_202505/22/-9lddQ1aa-axbtK2aT1kSac-ac.png[/img][/url]
+    (转换后) [url=/read.php?tid=43417488]__图__[/url]
+    '''
+    @profiled('command.transform_pipeline')
+    def run(self, edit, transforms=None):
+        if transforms is None:
+            transforms = get_setting('pipeline_transforms', ['condense_url', 'replace_img'])
 
-            for region in reversed(regions):
-                scopes = self.view.scope_name(region.a).split()
-                # 将"[img]...[/img]"变为"__图__"
-                if 'img.tag.bbcode.nga' in scopes[-1]:
-                    self.view.replace(edit, region, '__图__')
+        unknown = [name for name in transforms if name not in TRANSFORMS]
+        if unknown:
+            sublime.status_message('未知的转换: ' + ', '.join(unknown))
+            return
+
+        _apply_pipeline(self.view, edit, '依次转换', transforms)
 
     def is_visible(self):
         return self.view.match_selector(0, 'source.bbcode.nga')
@@ -172,73 +189,86 @@ class TableToMarkdownCommand(sublime_plugin.TextCommand):
     | 链接1    | https://bbs.nga.cn/thread.php?fid=-447601 | 链接2    | [猴区](https://bbs.nga.cn/thread.php?fid=-447601)                                        |
     
     '''
+    @profiled('command.table_to_markdown')
     def run(self, edit):
-        for select_region in self.view.sel():
-            start = select_region.begin()
-            url = None
-            md_table = None
-            replaces = []
-            
-            content = self.view.substr(select_region)
-            tag_stack = []
-            pattern = re.compile('\[(/)?([^=\[\] \d]+|\*)(\d+| [^\[\]]+|=[^\]]+)?\]')
-            for match in pattern.finditer(content):
-                is_end, tag, suffix = match.groups()
-
-                pos = start + match.start()
-                end_pos = pos + len(match.group())
-                
-                scopes = self.view.scope_name(pos).split()
-                if 'tag.bbcode.nga' not in scopes[-1]:
-                    continue
-
-                # 跳过表格外部区域
-                if not md_table and tag != 'table' and not is_end:
-                    continue
-                
-                # 跳过不支持转换的BBCode
-                if tag not in ['table', 'tr', 'td', 'b', 'i', 'del', 'code', 'url', 'img']:
-                    if md_table:
-                        text = self.view.substr(sublime.Region(last_pos, pos))
-                        md_table.update_cell(text)
-                    last_pos = end_pos
-                    continue
-
-                if not is_end:
-                    # 开头tag
-                    if tag == 'table':
-                        if md_table:
-                            self.view.show_popup('不支持嵌套表格', location=pos)
-                            break
-                        # 表格初始化
-                        md_table = MarkdownTable(pos)
-                    elif tag == 'tr':
-                        md_table.new_row()
-                    elif tag == 'td':
-                        md_table.new_col()
-                    elif tag == 'url' and suffix:
-                        md_table.buffer['url'] = suffix[1:]
-                    tag_stack.append(tag)
-                else:
-                    # 结尾tag
-                    if tag_stack and tag_stack.pop() == tag:
-                        text = self.view.substr(sublime.Region(last_pos, pos))
-                        if tag == 'table':
-                            # 生成markdown格式的表格
-                            replace_str = md_table.build(end_pos=end_pos)
-                            replaces.append((md_table.region, replace_str))
-                            md_table = None
-                        else:
-                            md_table.update_cell(text, tag)
-                    else:
-                        self.view.show_popup('检测到未闭合/不当闭合顺序代码块 ' + tag_stack[-1], location=pos)
-                        break
-
-                # 跳过BBCode tag
-                last_pos = end_pos
-
-            for replace_region, replace_str in reversed(replaces):
-                self.view.replace(edit, replace_region, replace_str)
+        def compute(document, begin, end):
+            # 所选区域内的所有表格合并为一次替换
+            edits, error = table_to_markdown(document, begin, end)
+            return coalesce(document.text, edits), error
+
+        ranges = [(region.begin(), region.end()) for region in reversed(list(self.view.sel()))]
+        jobs.start(self.view, edit, 'table转Markdown', ranges, compute)
 
     def is_visible(self):
-        return self.view.match_selector(0, 'source.bbcode.nga')
\ No newline at end of file
+        return self.view.match_selector(0, 'source.bbcode.nga')
+
+
+class MarkdownToBbcodeCommand(sublime_plugin.TextCommand):
+    '''Markdown转BBCode: 将选中区域中的Markdown转换为BBCode (表格/加粗/斜体/删除线/代码/链接/图片/列表/标题/引用)
+
+    不需要解析BBCode, 直接执行: 逐行一次遍历, 每个区域只替换一次; NGA图床图片的完整URL精简为"./"开头的相对路径
+
+    示例
+    ----
+    (转换前)
+    | 功能 | 展示 |
+    | --- | --- |
+    | 加粗 | **加粗** |
+    | 图片 | ![IMG](https://img.nga.178.com/attachments/mon_202505/22/-9lddQ1aa-axbtK2aT1kSac-ac.png) |
+
+    (转换后)
+    [table]
+    [tr][td]功能[/td][td]展示[/td][/tr]
+    [tr][td]加粗[/td][td][b]加粗[/b][/td][/tr]
+    [tr][td]图片[/td][td][img]./mon_202505/22/-9lddQ1aa-axbtK2aT1kSac-ac.png[/img][/td][/tr]
+    [/table]
+    '''
+    @profiled('command.markdown_to_bbcode')
+    def run(self, edit):
+        # 从后往前替换, 所有区域的修改在同一次命令中完成 (一次撤销)
+        for begin, end in _target_ranges(self.view, self.view.size()):
+            region = sublime.Region(begin, end)
+            text = self.view.substr(region)
+            converted = markdown_to_bbcode(text)
+            if converted != text:
+                self.view.replace(edit, region, converted)
+
+    def is_visible(self):
+        return self.view.match_selector(0, 'source.bbcode.nga')
+
+
+class SplitPostCommand(sublime_plugin.TextCommand):
+    '''分楼: 将全文切分为长度不超过上限的若干段, 每段写入一个新的视图
+
+    默认只在不属于任何代码块的位置切分 (不会拆开[quote]/[collapse]/[table]等), 参数或设置中reopen_tags为true时,
+    也可在代码块中的行首切分, 并在切分处自动关闭代码块、在下一段开头重新打开
+    '''
+    @profiled('command.split_post')
+    def run(self, edit, max_length=None, reopen_tags=None):
+        if max_length is None:
+            max_length = get_setting('split_max_length', 50000)
+        if reopen_tags is None:
+            reopen_tags = get_setting('split_reopen_tags', False)
+
+        document = parse_view(self.view)
+        chunks, oversized = split_post(document, documents.pair_index(self.view), max_length, reopen_tags)
+        if len(chunks) <= 1:
+            sublime.status_message('全文未超过长度上限 ({}字), 无需分楼'.format(max_length))
+            return
+
+        window = self.view.window()
+        syntax = self.view.settings().get('syntax')
+        file_name = self.view.file_name()
+        name = file_name.replace('\\', '/').split('/')[-1] if file_name else (self.view.name() or 'untitled')
+        for i, chunk in enumerate(chunks):
+            chunk_view = window.new_file()
+            chunk_view.set_name('{} ({}/{})'.format(name, i + 1, len(chunks)))
+            if syntax:
+                chunk_view.assign_syntax(syntax)
+            chunk_view.run_command('append', {'characters': chunk})
+
+        if oversized:
+            sublime.status_message('第 {} 段超过长度上限 (单个代码块过长)'.format(', '.join(str(i + 1) for i in oversized)))
+
+    def is_visible(self):
+        return self.view.match_selector(0, 'source.bbcode.nga')
@@ -0,0 +1,66 @@
+import re
+from .bbcode import SUPPORTED_TAGS, TAG_PATTERN
+from .schema import ALIGN_NAMES, COLOR_NAMES, FONT_NAMES
+
+
+__all__ = ['scan_open_tags', 'suggest']
+
+# 只能直接包含特定代码块的tag -> (子代码块, 插入内容), 插入内容接在已输入的'['之后
+CHILDREN = {
+    'table': [('tr', 'tr]$0[/tr]')],
+    'tr': [('td', 'td]$0[/td]')],
+    'list': [('*', '*]')],
+}
+# 属性 -> (合法取值, 说明), 补全时插入语法文件中原样的取值 (如"Times New Roman"), 检查时才忽略大小写
+ATTRIBUTES = {
+    'align': (sorted(ALIGN_NAMES, key=str.lower), '对齐'),
+    'color': (sorted(COLOR_NAMES, key=str.lower), '颜色'),
+    'font': (sorted(FONT_NAMES, key=str.lower), '字体'),
+}
+ATTRIBUTE_PATTERN = re.compile(r'\[(align|color|font)=$')
+
+
+def scan_open_tags(open_tags, text):
+    '''
+    从tag栈open_tags (tag名, 由外向内) 开始继续扫描text中的tag, 返回扫描后的tag栈
+
+    用于补全时尚未检查的少量新内容, 不区分作用域, 只忽略[code]中除[/code]外的tag
+    '''
+    stack = list(open_tags)
+    for match in TAG_PATTERN.finditer(text):
+        is_end, tag, _ = match.groups()
+        if tag not in SUPPORTED_TAGS:
+            continue
+        if stack and stack[-1] == 'code' and not (is_end and tag == 'code'):
+            continue
+        if not is_end:
+            stack.append(tag)
+        elif stack:
+            stack.pop()
+    return stack
+
+
+def suggest(open_tags, before):
+    '''
+    按光标处的tag栈open_tags (tag名, 由外向内) 及光标前已输入的文本before (不含正在输入的单词), 返回补全项
+    (触发词, 说明, 插入内容); 不属于以下情况时返回None (使用静态补全)
+
+    - 已输入"[/": 需要的结尾tag (最内层在前)
+    - 已输入"[": 最内层代码块只能包含的子代码块 ([table]中的[tr], [tr]中的[td], [list]中的[*])
+    - 已输入"[align="/"[color="/"[font=": 合法的取值
+    '''
+    if before.endswith('[/'):
+        items = []
+        for tag in reversed(open_tags):
+            if tag not in (item[0] for item in items):
+                items.append((tag, '[/{}]'.format(tag), tag + ']'))
+        return items or None
+
+    match = ATTRIBUTE_PATTERN.search(before)
+    if match is not None:
+        values, annotation = ATTRIBUTES[match.group(1)]
+        return [(value, annotation, value + ']') for value in values]
+
+    if before.endswith('[') and open_tags and open_tags[-1] in CHILDREN:
+        return [(tag, '[{}]'.format(tag), contents) for tag, contents in CHILDREN[open_tags[-1]]]
+    return None
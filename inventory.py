@@ -0,0 +1,157 @@
+import sublime
+import sublime_plugin
+import os
+import json
+from collections import OrderedDict
+from .cache import documents
+from .profiling import profiled
+from .transforms import _fill_url, _fill_id_url
+from .utils import select_regions
+
+
+__all__ = ['LINK_TAGS', 'LinkEntry', 'collect_links']
+
+PANEL_NAME = 'bbcode_nga_links'
+
+# 收集的代码块 -> 显示名称
+LINK_TAGS = OrderedDict([
+    ('img', '图片'),
+    ('url', '链接'),
+    ('tid', '主题'),
+    ('pid', '回复'),
+    ('uid', '用户'),
+])
+
+
+class LinkEntry:
+    '''
+    去重后的一个链接: tag, 补全后的url, 各次出现时链接原文的区域 (按位置排序)
+    '''
+    __slots__ = ('tag', 'url', 'occurrences')
+
+    def __init__(self, tag, url):
+        self.tag = tag
+        self.url = url
+        self.occurrences = []
+
+
+def _normalize(tag, target):
+    if tag == 'img':
+        return _fill_url(target, img=True)
+    if tag == 'url':
+        return _fill_url(target)
+    return _fill_id_url(tag, target)
+
+
+def collect_links(document):
+    '''
+    按顺序遍历一次已解析的tag, 收集所有[img]/[url]/[tid]/[pid]/[uid]的链接, 按(tag, 补全后的url)去重
+
+    返回按第一次出现的位置排序的LinkEntry
+    '''
+    text = document.text
+    tokens = document.tokens
+    entries = OrderedDict()
+    for i, (begin, end, tag, is_end, suffix) in enumerate(tokens):
+        if is_end or tag not in LINK_TAGS:
+            continue
+
+        if suffix and suffix.startswith('='):
+            # [url=链接]内容[/url]
+            target_begin, target_end = end - len(suffix), end - 1
+        elif i + 1 < len(tokens) and tokens[i + 1][2] == tag and tokens[i + 1][3]:
+            # [url]链接[/url]
+            target_begin, target_end = end, tokens[i + 1][0]
+        else:
+            continue
+
+        target = text[target_begin:target_end]
+        stripped = target.strip()
+        if not stripped:
+            continue
+        # 区域不包含两侧空白
+        target_begin += len(target) - len(target.lstrip())
+        url = _normalize(tag, stripped)
+
+        entry = entries.get((tag, url))
+        if entry is None:
+            entry = entries[(tag, url)] = LinkEntry(tag, url)
+        entry.occurrences.append((target_begin, target_begin + len(stripped)))
+    return list(entries.values())
+
+
+def _format_inventory(view, entries):
+    '''
+    每个链接一行, 其下逐行列出各次出现的位置; 已保存的文件输出为 路径:行:列, 可在面板中双击跳转
+    '''
+    file_name = view.file_name()
+    lines = []
+    for entry in entries:
+        lines.append('{} {} ({}处)'.format(LINK_TAGS[entry.tag], entry.url, len(entry.occurrences)))
+        for begin, _ in entry.occurrences:
+            row, col = view.rowcol(begin)
+            if file_name:
+                lines.append('    {}:{}:{}'.format(file_name, row + 1, col + 1))
+            else:
+                lines.append('    第{}行第{}列'.format(row + 1, col + 1))
+    return '\n'.join(lines) + '\n'
+
+
+class LinkInventoryCommand(sublime_plugin.TextCommand):
+    '''链接清单: 列出全文中所有[img]/[url]/[tid]/[pid]/[uid]的链接 (补全为完整url并去重)
+
+    output="quick_panel"时在快速面板中列出, 选中后选中该链接的所有出现位置; output="panel"输出到面板;
+    output="json"写入JSON文件 (默认为 Packages/User/BBCode (NGA) links.json)
+    '''
+    @profiled('command.link_inventory')
+    def run(self, edit, output='quick_panel', path=None):
+        view = self.view
+        entries = collect_links(documents.get(view))
+        if not entries:
+            sublime.status_message('没有[img]/[url]/[tid]/[pid]/[uid]链接')
+            return
+
+        window = view.window()
+        if output == 'json':
+            if path is None:
+                path = os.path.join(sublime.packages_path(), 'User', 'BBCode (NGA) links.json')
+            report = []
+            for entry in entries:
+                occurrences = []
+                for begin, end in entry.occurrences:
+                    row, col = view.rowcol(begin)
+                    occurrences.append({'line': row + 1, 'column': col + 1, 'begin': begin, 'end': end})
+                report.append({'type': entry.tag, 'url': entry.url, 'occurrences': occurrences})
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            window.open_file(path)
+            return
+
+        if output == 'panel':
+            panel = window.create_output_panel(PANEL_NAME)
+            panel.settings().set('result_file_regex', r'^\s+(.+):(\d+):(\d+)$')
+            panel.run_command('append', {'characters': _format_inventory(view, entries)})
+            window.run_command('show_panel', {'panel': 'output.' + PANEL_NAME})
+            return
+
+        original = list(view.sel())
+        original_viewport = view.viewport_position()
+
+        def on_highlight(index):
+            view.show_at_center(entries[index].occurrences[0][0])
+
+        def on_done(index):
+            if index == -1:
+                # 取消时恢复原来的选区及位置
+                select_regions(view, original)
+                view.set_viewport_position(original_viewport, False)
+                return
+            select_regions(view, [sublime.Region(begin, end) for begin, end in entries[index].occurrences])
+
+        items = [[entry.url, '{} · {}处 · 第{}行'.format(
+            LINK_TAGS[entry.tag], len(entry.occurrences), view.rowcol(entry.occurrences[0][0])[0] + 1)]
+            for entry in entries]
+        window.show_quick_panel(items, on_done, 0, 0, on_highlight)
+
+    def is_visible(self):
+        return self.view.match_selector(0, 'source.bbcode.nga')
@@ -0,0 +1,275 @@
+import sublime
+import sublime_plugin
+import time
+import traceback
+from threading import Lock
+from .bbcode import Document
+from .transforms import coalesce
+from .cache import documents
+from .scheduler import scheduler, get_setting
+from .profiling import profiler, profiled
+
+
+__all__ = ['start', 'cancel']
+
+STATUS_KEY = 'bbcode_nga_job'
+# 后台转换每段最多占用工作线程多少毫秒 (段与段之间让出工作线程, 如处理高亮检查)
+JOB_SLICE_MS = 20
+# 解析及转换时每处理多少个tag检查一次是否超时
+JOB_STEP_TAGS = 256
+
+
+class _Job:
+    '''
+    在工作线程中分段进行的转换: 基于启动时的内容快照计算, 完成后由BbcodeApplyEditsCommand一次性应用
+    '''
+    __slots__ = ('view', 'title', 'change_count', 'steps', 'status', 'result', 'cancelled')
+
+    def __init__(self, view, title, change_count):
+        self.view = view
+        self.title = title
+        # 快照对应的change_count, 应用前内容有变化则放弃结果
+        self.change_count = change_count
+        # _steps的生成器
+        self.steps = None
+        # 当前进度 (显示在状态栏)
+        self.status = ''
+        # 完成后的(替换, 错误)
+        self.result = None
+        self.cancelled = False
+
+
+# view id -> 进行中的_Job
+_jobs = {}
+_jobs_lock = Lock()
+
+
+def _compute(document, ranges, compute):
+    '''
+    对各区域执行compute, 返回(替换, 错误): 替换为从后往前排列的(起始, 结束, 新文本), 错误为(位置, 提示信息)
+    '''
+    replacements = []
+    errors = []
+    for begin, end in ranges:
+        replacement, error = compute(document, begin, end)
+        if replacement is not None:
+            replacements.append(replacement)
+        if error is not None:
+            errors.append(error)
+    return replacements, errors
+
+
+def _sub_ranges(document, begin, end):
+    '''
+    将[begin, end)在不属于任何代码块的tag边界处切分, 依次返回各含约JOB_STEP_TAGS个tag的子区域 (不会切开顶层代码块)
+    '''
+    pairs = document.pairs
+    opening = set(pairs.first.begins)
+    closing = set(pairs.second.begins)
+    # 开头tag在begin之前、结尾tag不在begin之前的代码块数, 即begin处的嵌套深度
+    depth = sum(1 for a, b in zip(pairs.first.begins, pairs.second.begins) if a < begin <= b)
+
+    begins, ends = document.tokens.begins, document.tokens.ends
+    # tag互不重叠, 结尾位置同样有序
+    i = begins.bisect_left(begin)
+    j = max(i, ends.bisect_right(end))
+    start = begin
+    count = 0
+    for token_begin, token_end in zip(begins[i:j], ends[i:j]):
+        if token_begin in opening:
+            depth += 1
+        elif token_begin in closing:
+            depth -= 1
+        count += 1
+        if depth == 0 and count >= JOB_STEP_TAGS:
+            yield start, token_end
+            start = token_end
+            count = 0
+    yield start, end
+
+
+def _apply(view, edit, replacements, errors):
+    for begin, end, text in replacements:
+        view.replace(edit, sublime.Region(begin, end), text)
+    for pos, message in errors:
+        # 错误位置为替换前的位置, 加上其前面各处替换造成的长度变化
+        shift = sum(len(text) - (end - begin) for begin, end, text in replacements if end <= pos)
+        view.show_popup(message, location=pos + shift)
+
+
+def _steps(job, document, text, ranges, compute):
+    '''
+    解析快照(已有该版本的解析结果document时跳过)并逐个子区域转换, 每完成一小步产出一次
+    '''
+    view = job.view
+    if document is None:
+        # '['的个数是tag数的上限, 用于估计解析进度
+        brackets = max(1, text.count('['))
+        parsed = 0
+        for document in Document().iter_update(text, step=JOB_STEP_TAGS):
+            if document is not None:
+                break
+            parsed += JOB_STEP_TAGS
+            job.status = '解析 {}%'.format(min(99, parsed * 100 // brackets))
+            yield
+        # 与高亮检查共用该版本的解析结果
+        documents.put(view.buffer_id(), job.change_count, document)
+
+    replacements = []
+    errors = []
+    total = max(1, sum(end - begin for begin, end in ranges))
+    done = 0
+    for begin, end in ranges:
+        # 分成若干子区域转换, 每个子区域为一步; 遇到错误时停止转换该区域
+        parts = []
+        for sub_begin, sub_end in _sub_ranges(document, begin, end):
+            job.status = '转换 {}%'.format(min(99, done * 100 // total))
+            yield
+            replacement, error = compute(document, sub_begin, sub_end)
+            done += sub_end - sub_begin
+            if replacement is not None:
+                parts.append(replacement)
+            if error is not None:
+                errors.append(error)
+                break
+        # 同一区域的各处替换合并为一次替换
+        replacement = coalesce(document.text, parts)
+        if replacement is not None:
+            replacements.append(replacement)
+    job.result = (replacements, errors)
+
+
+def _finish(job, message):
+    with _jobs_lock:
+        if _jobs.get(job.view.id()) is job:
+            del _jobs[job.view.id()]
+    job.view.erase_status(STATUS_KEY)
+    if message:
+        sublime.status_message('{}: {}'.format(job.title, message))
+
+
+def _continue(job):
+    '''
+    推进后台转换, 每段不超过JOB_SLICE_MS毫秒
+    '''
+    if job.cancelled:
+        return
+    view = job.view
+    if not view.is_valid():
+        _finish(job, None)
+        return
+    if view.change_count() != job.change_count:
+        _finish(job, '内容已改动, 已取消')
+        return
+
+    with profiler.measure(view, 'job_slice'):
+        deadline = time.monotonic() + JOB_SLICE_MS / 1000
+        try:
+            for _ in job.steps:
+                if time.monotonic() >= deadline or job.cancelled:
+                    break
+        except Exception as e:
+            traceback.print_exc()
+            _finish(job, '出错 ({}: {}), 已取消'.format(type(e).__name__, e))
+            return
+
+    if job.cancelled:
+        # 在这一段执行期间被取消
+        return
+    if job.result is None:
+        view.set_status(STATUS_KEY, '{}: {} (Esc取消)'.format(job.title, job.status))
+        scheduler.schedule((view.id(), 'job'), lambda: _continue(job), 0)
+        return
+
+    _finish(job, None)
+    replacements, errors = job.result
+    if not replacements and not errors:
+        sublime.status_message('{}: 没有需要修改的内容'.format(job.title))
+        return
+    sublime.set_timeout(lambda: view.run_command('bbcode_apply_edits', {
+        'change_count': job.change_count,
+        'replacements': replacements,
+        'errors': errors,
+    }), 0)
+
+
+def start(view, edit, title, ranges, compute):
+    '''
+    对ranges(从后往前排列)中的各区域执行compute(document, begin, end) -> (替换或None, 错误或None)
+
+    不超过设置中background_command_threshold个字符时直接在当前线程完成; 否则读取内容快照,
+    在工作线程中分段解析及转换并在状态栏显示进度, 完成后一次性应用 (期间内容有改动时放弃)
+    '''
+    threshold = get_setting('background_command_threshold', 100000)
+    if not threshold or view.size() < threshold:
+        replacements, errors = _compute(documents.get(view), ranges, compute)
+        _apply(view, edit, replacements, errors)
+        return
+
+    cancel(view)
+    change_count = view.change_count()
+    job = _Job(view, title, change_count)
+    cached = documents.peek(view.buffer_id(), change_count)
+    if cached is not None:
+        # 已有该版本的解析结果时不需要读取内容
+        job.steps = _steps(job, cached[0], None, ranges, compute)
+    else:
+        job.steps = _steps(job, None, view.substr(sublime.Region(0, view.size())), ranges, compute)
+    with _jobs_lock:
+        _jobs[view.id()] = job
+    view.set_status(STATUS_KEY, '{}: 开始 (Esc取消)'.format(title))
+    scheduler.schedule((view.id(), 'job'), lambda: _continue(job), 0)
+
+
+def cancel(view):
+    '''
+    取消该视图进行中的后台转换, 返回是否有被取消的转换
+    '''
+    with _jobs_lock:
+        job = _jobs.get(view.id())
+    if job is None:
+        return False
+    job.cancelled = True
+    scheduler.cancel(lambda key: key == (view.id(), 'job'))
+    _finish(job, '已取消')
+    return True
+
+
+class BbcodeApplyEditsCommand(sublime_plugin.TextCommand):
+    '''
+    应用后台转换的结果 (作为一次修改, 可一次撤销); 计算期间内容有改动时放弃
+    '''
+    @profiled('command.bbcode_apply_edits')
+    def run(self, edit, change_count, replacements, errors=()):
+        if self.view.change_count() != change_count:
+            sublime.status_message('内容已改动, 已放弃转换结果')
+            return
+        _apply(self.view, edit, replacements, errors)
+
+
+class BbcodeCancelJobCommand(sublime_plugin.TextCommand):
+    '''
+    取消当前视图进行中的后台转换
+    '''
+    def run(self, edit):
+        cancel(self.view)
+
+    def is_enabled(self):
+        with _jobs_lock:
+            return self.view.id() in _jobs
+
+
+class JobListener(sublime_plugin.EventListener):
+    def on_query_context(self, view, key, operator, operand, match_all):
+        if key != 'bbcode_nga_job_running':
+            return None
+        with _jobs_lock:
+            running = view.id() in _jobs
+        if operator == sublime.OP_EQUAL:
+            return running == operand
+        if operator == sublime.OP_NOT_EQUAL:
+            return running != operand
+        return None
+
+    def on_close(self, view):
+        cancel(view)
@@ -0,0 +1,316 @@
+import re
+from .transforms import _shorten_img_url
+
+
+__all__ = ['markdown_to_bbcode']
+
+FENCE_PATTERN = re.compile(r'\s*(```+|~~~+)')
+HEADING_PATTERN = re.compile(r'#{1,6}\s+(.*?)(\s+#+)?\s*$')
+QUOTE_PATTERN = re.compile(r'\s{0,3}> ?')
+LIST_ITEM_PATTERN = re.compile(r'(\s*)([-*+]|\d+[.)])\s+(.*)$')
+TABLE_SEPARATOR_PATTERN = re.compile(r'\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$')
+CELL_SEPARATOR_PATTERN = re.compile(r'(?<!\\)\|')
+BR_PATTERN = re.compile(r'<br\s*/?>', re.IGNORECASE)
+
+# 行内语法中有特殊含义的字符, 其余字符原样保留
+INLINE_SPECIAL_PATTERN = re.compile(r'[\\`!\[<*_~]')
+ESCAPABLE_CHARS = frozenset('\\`*_{}[]()#+-.!~|<>')
+CLOSE_BRACKET_PATTERN = re.compile(r'\]')
+# 链接/自动链接中url的结尾
+LINK_STOP_PATTERN = re.compile(r'[)\s]')
+AUTOLINK_STOP_PATTERN = re.compile(r'[>\s]')
+LINK_TITLE_PATTERN = re.compile(r'\s+"[^"\n]*"\)')
+AUTOLINK_PATTERN = re.compile(r'https?://.')
+# 强调的分隔符 -> tag
+EMPHASIS_TAGS = {'**': 'b', '__': 'b', '~~': 'del', '*': 'i', '_': 'i'}
+
+
+class _NextMatch:
+    '''
+    text中不早于pos的第一个匹配位置 (不存在时为len(text)): 记住上一次的结果, pos不减时总共只扫描text一遍
+    '''
+    __slots__ = ('pattern', 'text', 'pos', 'found')
+
+    def __init__(self, pattern, text):
+        self.pattern = pattern
+        self.text = text
+        self.pos = self.found = len(text) + 1
+
+    def __call__(self, pos):
+        if not self.pos <= pos <= self.found:
+            match = self.pattern.search(self.text, pos)
+            self.pos = pos
+            self.found = match.start() if match is not None else len(self.text)
+        return self.found
+
+
+def _is_word(char):
+    return char.isalnum() or char == '_'
+
+
+def _link_target(text, bracket, link_stops):
+    '''
+    "]"之后的"(url)"或"(url "title")", 返回(url, 结束位置); 不是链接时返回None
+    '''
+    if not text.startswith('(', bracket + 1):
+        return None
+    stop = link_stops(bracket + 2)
+    if stop == bracket + 2 or stop == len(text):
+        return None
+    url = text[bracket + 2:stop]
+    if text[stop] == ')':
+        return url, stop + 1
+    title = LINK_TITLE_PATTERN.match(text, stop)
+    return (url, title.end()) if title is not None else None
+
+
+def _inline(text):
+    '''
+    转换一行(或一个单元格)中的行内语法
+
+    从左到右扫描一遍: 转义/行内代码/图片/链接遇到时整体转换, 其中的字符不再作为分隔符; "*"等强调的分隔符
+    能结束强调时与栈中最近的同类分隔符配对 (之间未配对的分隔符原样保留), 否则能开始强调时入栈.
+    未闭合的分隔符不向后查找, "]"等结尾的位置也只查找一遍, 转换时间与文本长度成正比
+    '''
+    out = []
+    n = len(text)
+    # 未配对的分隔符: (分隔符, 在out中的下标, 强调内容的开始位置)
+    stack = []
+    # 各种分隔符在stack中的下标
+    openers = dict((mark, []) for mark in EMPHASIS_TAGS)
+    brackets = _NextMatch(CLOSE_BRACKET_PATTERN, text)
+    link_stops = _NextMatch(LINK_STOP_PATTERN, text)
+    autolink_stops = _NextMatch(AUTOLINK_STOP_PATTERN, text)
+    # 找不到结尾的行内代码的"`"个数
+    unclosed_code = set()
+    # 上一次解析的(链接的"]"位置, 结果): 多个"["共用同一个"]"时只解析一次
+    target = (-1, None)
+    i = 0
+    while i < n:
+        special = INLINE_SPECIAL_PATTERN.search(text, i)
+        if special is None:
+            out.append(text[i:])
+            break
+        if special.start() > i:
+            out.append(text[i:special.start()])
+        i = special.start()
+        char = text[i]
+
+        if char == '\\':
+            if i + 1 < n and text[i + 1] in ESCAPABLE_CHARS:
+                out.append(text[i + 1])
+                i += 2
+            else:
+                out.append(char)
+                i += 1
+            continue
+
+        if char == '`':
+            j = i
+            while j < n and text[j] == '`':
+                j += 1
+            ticks = text[i:j]
+            close = text.find(ticks, j + 1) if len(ticks) not in unclosed_code else -1
+            if close == -1:
+                unclosed_code.add(len(ticks))
+                out.append(ticks)
+                i = j
+            else:
+                out.append('[code]' + text[j:close].strip() + '[/code]')
+                i = close + len(ticks)
+            continue
+
+        if char == '[' or text.startswith('![', i):
+            image = char == '!'
+            start = i + 2 if image else i + 1
+            bracket = brackets(start)
+            if bracket < n and (image or bracket > start):
+                if target[0] != bracket:
+                    target = (bracket, _link_target(text, bracket, link_stops))
+                if target[1] is not None:
+                    url, i = target[1]
+                    if image:
+                        out.append('[img]' + _shorten_img_url(url) + '[/img]')
+                    else:
+                        label = text[start:bracket]
+                        out.append('[url]' + url + '[/url]' if label == url else
+                                   '[url=' + url + ']' + _inline(label) + '[/url]')
+                    continue
+            out.append(char)
+            i += 1
+            continue
+
+        if char == '<':
+            stop = autolink_stops(i + 1)
+            if stop < n and text[stop] == '>' and AUTOLINK_PATTERN.match(text, i + 1, stop):
+                out.append('[url]' + text[i + 1:stop] + '[/url]')
+                i = stop + 1
+            else:
+                out.append(char)
+                i += 1
+            continue
+
+        mark = text[i:i + 2] if text[i:i + 2] in EMPHASIS_TAGS else char
+        if mark not in EMPHASIS_TAGS:
+            out.append(char)
+            i += 1
+            continue
+        end = i + len(mark)
+        before = text[i - 1] if i > 0 else ' '
+        after = text[end] if end < n else ' '
+        positions = openers[mark]
+        if (not before.isspace() and not (mark == '_' and _is_word(after)) and
+                positions and stack[positions[-1]][2] < i):
+            # 结束强调: 与最近的同类分隔符配对, 之间的其他分隔符不再配对
+            k = positions.pop()
+            for other, _, _ in stack[k + 1:]:
+                openers[other].pop()
+            tag = EMPHASIS_TAGS[mark]
+            out[stack[k][1]] = '[' + tag + ']'
+            out.append('[/' + tag + ']')
+            del stack[k:]
+        elif not after.isspace() and not (mark[0] == '_' and _is_word(before)):
+            positions.append(len(stack))
+            stack.append((mark, len(out), end))
+            out.append(mark)
+        else:
+            out.append(mark)
+        i = end
+    return ''.join(out)
+
+
+def _cells(line):
+    '''
+    表格一行中的各单元格 (去掉两侧的"|")
+    '''
+    line = line.strip()
+    if line.startswith('|'):
+        line = line[1:]
+    if line.endswith('|') and not line.endswith('\\|'):
+        line = line[:-1]
+    return [cell.strip().replace('\\|', '|') for cell in CELL_SEPARATOR_PATTERN.split(line)]
+
+
+def _table_row(line):
+    # 与table转Markdown相反, 单元格中的<br>还原为换行
+    return '[tr]' + ''.join('[td]' + BR_PATTERN.sub('\n', _inline(cell)) + '[/td]' for cell in _cells(line)) + '[/tr]'
+
+
+def _is_ordered(item):
+    '''
+    列表项是否为有序列表 ("1."/"1)"开头)
+    '''
+    return item.group(2)[0].isdigit()
+
+
+def _convert_lines(lines, out):
+    '''
+    逐行转换, 结果依次加入out: 每行只处理一次 (引用中的内容在引用结束时再转换一次)
+    '''
+    # 各层列表的缩进, 及各层是否为有序列表
+    list_indents = []
+    list_ordered = []
+    i = 0
+    n = len(lines)
+    while i < n:
+        line = lines[i]
+
+        # 列表: 缩进更深时开始子列表, 更浅时结束内层列表
+        item = LIST_ITEM_PATTERN.match(line)
+        if item is not None:
+            indent = len(item.group(1).expandtabs(4))
+            if not list_indents or indent > list_indents[-1]:
+                list_indents.append(indent)
+                list_ordered.append(_is_ordered(item))
+                out.append('[list]')
+            else:
+                while len(list_indents) > 1 and indent < list_indents[-1]:
+                    list_indents.pop()
+                    list_ordered.pop()
+                    out.append('[/list]')
+            out.append('[*]' + _inline(item.group(3)))
+            i += 1
+            continue
+        if list_indents:
+            if line.strip() and line[:1].isspace():
+                # 列表项的后续行
+                out.append(_inline(line.strip()))
+                i += 1
+                continue
+            following = LIST_ITEM_PATTERN.match(lines[i + 1]) if not line.strip() and i + 1 < n else None
+            if following is not None:
+                # 列表项之间的空行: 下一项所在的一层换成另一种列表时, 结束该层(及更内层)的列表
+                indent = len(following.group(1).expandtabs(4))
+                if indent > list_indents[-1]:
+                    i += 1
+                    continue
+                level = len(list_indents) - 1
+                while level > 0 and indent < list_indents[level]:
+                    level -= 1
+                if list_ordered[level] == _is_ordered(following):
+                    i += 1
+                    continue
+                if level > 0:
+                    out += ['[/list]'] * (len(list_indents) - level)
+                    del list_indents[level:]
+                    del list_ordered[level:]
+                    i += 1
+                    continue
+            out += ['[/list]'] * len(list_indents)
+            list_indents = []
+            list_ordered = []
+
+        # 代码块: 内容原样保留
+        fence = FENCE_PATTERN.match(line)
+        if fence is not None:
+            mark = fence.group(1)
+            j = i + 1
+            while j < n and not lines[j].lstrip().startswith(mark):
+                j += 1
+            out.append('[code]' + '\n'.join(lines[i + 1:j]) + '[/code]')
+            i = j + 1
+            continue
+
+        # 表格: 表头行的下一行为分隔行
+        if '|' in line and i + 1 < n and TABLE_SEPARATOR_PATTERN.match(lines[i + 1]) and '-' in lines[i + 1]:
+            out.append('[table]')
+            out.append(_table_row(line))
+            i += 2
+            while i < n and '|' in lines[i] and lines[i].strip():
+                out.append(_table_row(lines[i]))
+                i += 1
+            out.append('[/table]')
+            continue
+
+        # 引用: 连续的引用行去掉">"后作为一段内容转换
+        if QUOTE_PATTERN.match(line):
+            j = i
+            quoted = []
+            while j < n and QUOTE_PATTERN.match(lines[j]):
+                quoted.append(lines[j][QUOTE_PATTERN.match(lines[j]).end():])
+                j += 1
+            inner = []
+            _convert_lines(quoted, inner)
+            out.append('[quote]' + '\n'.join(inner) + '[/quote]')
+            i = j
+            continue
+
+        heading = HEADING_PATTERN.match(line)
+        if heading is not None:
+            out.append('[h]' + _inline(heading.group(1)) + '[/h]')
+        else:
+            out.append(_inline(line))
+        i += 1
+
+    out += ['[/list]'] * len(list_indents)
+
+
+def markdown_to_bbcode(text):
+    '''
+    将Markdown转换为NGA BBCode: 表格/加粗/斜体/删除线/代码/链接/图片/列表/标题/引用
+
+    逐行一次遍历, 各行的结果先存入列表, 最后只拼接一次; NGA图床图片的完整URL精简为"./"开头的相对路径
+    '''
+    out = []
+    _convert_lines(text.split('\n'), out)
+    return '\n'.join(out)
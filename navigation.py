@@ -0,0 +1,154 @@
+import sublime
+import sublime_plugin
+from .cache import documents
+from .profiling import profiled
+from .utils import select_regions
+
+
+# 大纲中列出的代码块
+OUTLINE_TAGS = ('collapse', 'h', 'table')
+# 大纲中[h]的标题最多显示多少个字符
+OUTLINE_TITLE_LENGTH = 40
+
+
+class GotoMatchingTagCommand(sublime_plugin.TextCommand):
+    '''跳转到配对tag: 光标在开头tag上时跳到结尾tag, 在结尾tag上时跳到开头tag, 不在tag上时跳到包裹光标的代码块的结尾tag
+    '''
+    @profiled('command.goto_matching_tag')
+    def run(self, edit):
+        pair_index = documents.pair_index(self.view)
+
+        cursors = []
+        for region in self.view.sel():
+            pos = region.b
+            k = pair_index.tag_at(pos)
+            if k != -1:
+                start = pair_index.starts[k]
+                # 光标紧贴在开头tag右侧时同样视为在开头tag上
+                pos = pair_index.ends[k][0] if start[0] <= pos <= start[1] else start[0]
+            else:
+                k = pair_index.innermost(pos)
+                if k != -1:
+                    pos = pair_index.ends[k][0]
+            cursors.append(sublime.Region(pos))
+        select_regions(self.view, cursors)
+
+    def is_visible(self):
+        return self.view.match_selector(0, 'source.bbcode.nga')
+
+
+class SelectEnclosingBlockCommand(sublime_plugin.TextCommand):
+    '''选中代码块: 选中包裹各选区的最内层代码块 (含两侧tag)
+    '''
+    @profiled('command.select_enclosing_block')
+    def run(self, edit):
+        pair_index = documents.pair_index(self.view)
+
+        selections = []
+        for region in self.view.sel():
+            for k in pair_index.containing(region.begin(), region.end()):
+                region = sublime.Region(pair_index.starts[k][0], pair_index.ends[k][1])
+                break
+            selections.append(region)
+        select_regions(self.view, selections)
+
+    def is_visible(self):
+        return self.view.match_selector(0, 'source.bbcode.nga')
+
+
+class ExpandSelectionToParentBlockCommand(sublime_plugin.TextCommand):
+    '''扩展选区至外层代码块: 每执行一次, 依次扩展为 代码块的内容 -> 整个代码块 -> 外层代码块的内容 -> ...
+    '''
+    @profiled('command.expand_selection_to_parent_block')
+    def run(self, edit):
+        pair_index = documents.pair_index(self.view)
+
+        selections = []
+        for region in self.view.sel():
+            begin, end = region.begin(), region.end()
+            for k in pair_index.containing(begin, end):
+                inner = (pair_index.starts[k][1], pair_index.ends[k][0])
+                outer = (pair_index.starts[k][0], pair_index.ends[k][1])
+                if inner[0] <= begin and end <= inner[1] and inner != (begin, end):
+                    region = sublime.Region(*inner)
+                    break
+                if outer != (begin, end):
+                    region = sublime.Region(*outer)
+                    break
+            selections.append(region)
+        select_regions(self.view, selections)
+
+    def is_visible(self):
+        return self.view.match_selector(0, 'source.bbcode.nga')
+
+
+class BlockOutlineCommand(sublime_plugin.TextCommand):
+    '''代码块大纲: 按层级列出[collapse]/[h]/[table], 选择后跳转到该代码块
+    '''
+    @profiled('command.block_outline')
+    def run(self, edit):
+        view = self.view
+        document = documents.get(view)
+        pair_index = documents.pair_index(view)
+        text = document.text
+
+        # 各代码块外层有几个大纲中的代码块 (外层代码块总是排在前面)
+        depths = [0] * len(pair_index)
+        in_outline = [False] * len(pair_index)
+        entries = []
+        caret = view.sel()[0].b if len(view.sel()) else 0
+        selected = 0
+        for k, start in enumerate(pair_index.starts):
+            parent = pair_index.parents[k]
+            if parent != -1:
+                depths[k] = depths[parent] + in_outline[parent]
+
+            token = document.token_at(start[0])
+            if token is None or token[2] not in OUTLINE_TAGS:
+                continue
+            in_outline[k] = True
+
+            tag, suffix = token[2], token[4]
+            if tag == 'collapse':
+                label = '折叠: ' + suffix[1:] if suffix and suffix.startswith('=') else '折叠'
+            elif tag == 'h':
+                title = ' '.join(text[start[1]:pair_index.ends[k][0]].split())
+                if len(title) > OUTLINE_TITLE_LENGTH:
+                    title = title[:OUTLINE_TITLE_LENGTH] + '…'
+                label = '标题: ' + title
+            else:
+                label = '表格'
+
+            if start[0] <= caret:
+                selected = len(entries)
+            row = view.rowcol(start[0])[0] + 1
+            entries.append((k, ['    ' * depths[k] + label, '第{}行'.format(row)]))
+
+        if not entries:
+            sublime.status_message('没有[collapse]/[h]/[table]代码块')
+            return
+
+        original = list(view.sel())
+        original_viewport = view.viewport_position()
+
+        def region_of(index):
+            k = entries[index][0]
+            return sublime.Region(pair_index.starts[k][0], pair_index.ends[k][1])
+
+        def on_highlight(index):
+            view.show_at_center(region_of(index).begin())
+
+        def on_done(index):
+            if index == -1:
+                # 取消时恢复原来的选区及位置
+                select_regions(view, original)
+                view.set_viewport_position(original_viewport, False)
+                return
+            region = region_of(index)
+            select_regions(view, [sublime.Region(region.begin())])
+            view.show_at_center(region.begin())
+
+        view.window().show_quick_panel([item for _, item in entries], on_done, 0, selected, on_highlight)
+
+    def is_visible(self):
+        return self.view.match_selector(0, 'source.bbcode.nga')
@@ -0,0 +1,145 @@
+import sublime
+import sublime_plugin
+from threading import Lock
+from .cache import documents
+from .render import BlockRenderer
+from .scheduler import scheduler
+from .profiling import profiler, profiled
+
+
+__all__ = ['schedule_update', 'discard']
+
+PHANTOM_KEY = 'bbcode_nga_preview'
+
+STYLE = '''
+<style>
+    body { padding: 0.5rem 1rem; }
+    a { text-decoration: none; }
+    .h { font-size: 1.3rem; font-weight: bold; margin: 0.5rem 0; border-bottom: 1px solid color(var(--foreground) alpha(0.3)); }
+    .quote { margin: 0.3rem 0; padding: 0.3rem 0.6rem; background-color: color(var(--background) blend(var(--foreground) 92%)); border-left: 0.2rem solid color(var(--foreground) alpha(0.3)); }
+    .code { margin: 0.3rem 0; padding: 0.3rem 0.6rem; font-family: monospace; background-color: color(var(--background) blend(var(--foreground) 92%)); }
+    .collapse { margin: 0.3rem 0; padding: 0.3rem 0.6rem; border: 1px solid color(var(--foreground) alpha(0.3)); }
+    .collapse-title { font-weight: bold; color: var(--bluish); }
+    .randomblock { margin: 0.3rem 0; border: 1px dashed color(var(--foreground) alpha(0.3)); }
+    .table { margin: 0.3rem 0; border-top: 1px solid color(var(--foreground) alpha(0.3)); }
+    .tr { padding: 0.2rem 0; border-bottom: 1px solid color(var(--foreground) alpha(0.3)); }
+    .td { padding: 0 0.6rem 0 0; }
+    .del { color: color(var(--foreground) alpha(0.5)); }
+    .sup { font-size: 0.8rem; }
+    .right { text-align: right; }
+</style>
+'''
+
+
+def _page(body):
+    return '<body id="bbcode-nga-preview">' + STYLE + body + '</body>'
+
+
+class _Preview:
+    '''
+    某个视图的预览: ST4中为HTML页签, ST3中为临时视图中的phantom
+    '''
+    __slots__ = ('view', 'sheet', 'phantom_set', 'renderer', 'change_count')
+
+    def __init__(self, view, sheet=None, phantom_set=None):
+        self.view = view
+        self.sheet = sheet
+        self.phantom_set = phantom_set
+        self.renderer = BlockRenderer()
+        # 当前显示的内容对应的change_count
+        self.change_count = None
+
+    def is_open(self):
+        if self.sheet is not None:
+            return self.sheet.window() is not None
+        return self.phantom_set.view.is_valid()
+
+    def show(self, body):
+        if self.sheet is not None:
+            self.sheet.set_contents(_page(body))
+        else:
+            self.phantom_set.update([sublime.Phantom(sublime.Region(0), _page(body), sublime.LAYOUT_BLOCK)])
+
+
+# view id -> _Preview
+_previews = {}
+_previews_lock = Lock()
+
+
+def _get(view_id):
+    with _previews_lock:
+        preview = _previews.get(view_id)
+        if preview is not None and not preview.is_open():
+            # 预览已被关闭
+            del _previews[view_id]
+            return None
+        return preview
+
+
+def discard(view_id):
+    with _previews_lock:
+        _previews.pop(view_id, None)
+
+
+def _update(preview, document, pair_index, change_count):
+    if preview.change_count is not None and preview.change_count == change_count:
+        return
+    with profiler.measure(preview.view, 'preview.render'):
+        body = preview.renderer.render(document, pair_index)
+    preview.show(body)
+    preview.change_count = change_count
+
+
+def schedule_update(view, document, pair_index, change_count):
+    '''
+    检查结果更新后, 按该结果(复用其代码块索引)重新渲染打开中的预览
+    '''
+    preview = _get(view.id())
+    if preview is None:
+        return
+    scheduler.schedule((view.id(), 'preview'), lambda: _update(preview, document, pair_index, change_count), 0)
+
+
+def _update_current(preview):
+    '''
+    按视图当前内容渲染 (使用与高亮共用的解析缓存)
+    '''
+    view = preview.view
+    change_count = view.change_count()
+    _update(preview, documents.get(view), documents.pair_index(view), change_count)
+
+
+class PreviewPostCommand(sublime_plugin.TextCommand):
+    '''预览: 在旁边的页签中显示渲染后的帖子, 编辑时只重新渲染内容变化的顶层代码块
+    '''
+    @profiled('command.preview_post')
+    def run(self, edit):
+        view = self.view
+        window = view.window()
+        preview = _get(view.id())
+        if preview is not None:
+            if preview.sheet is not None:
+                window.focus_sheet(preview.sheet)
+            else:
+                window.focus_view(preview.phantom_set.view)
+            return
+
+        name = '预览: ' + (view.file_name() and view.file_name().replace('\\', '/').split('/')[-1] or view.name() or 'untitled')
+        if hasattr(window, 'new_html_sheet'):
+            # 与当前视图并排显示
+            sheet = window.new_html_sheet(name, _page(''), flags=getattr(sublime, 'ADD_TO_SELECTION', 0))
+            preview = _Preview(view, sheet=sheet)
+        else:
+            preview_view = window.new_file()
+            preview_view.set_scratch(True)
+            preview_view.set_read_only(True)
+            preview_view.set_name(name)
+            preview = _Preview(view, phantom_set=sublime.PhantomSet(preview_view, PHANTOM_KEY))
+        window.focus_view(view)
+
+        with _previews_lock:
+            _previews[view.id()] = preview
+        scheduler.schedule((view.id(), 'preview'), lambda: _update_current(preview), 0)
+
+    def is_visible(self):
+        return self.view.match_selector(0, 'source.bbcode.nga')
@@ -0,0 +1,203 @@
+import sublime
+import sublime_plugin
+import functools
+import json
+import os
+import time
+from threading import Lock
+from collections import defaultdict, deque
+from .cache import documents
+from .scheduler import get_setting
+
+
+__all__ = ['profiler', 'profiled']
+
+# 每个视图每项指标保留最近多少次记录
+WINDOW_SIZE = 1000
+PANEL_NAME = 'bbcode_nga_profile'
+STATUS_KEY = 'bbcode_nga_profile'
+PERCENTILES = (50, 95, 99)
+
+
+def _enabled():
+    return get_setting('profiling', False)
+
+
+def _percentile(sorted_values, p):
+    '''
+    最近秩法求百分位数
+    '''
+    k = max(0, -(-len(sorted_values) * p // 100) - 1)
+    return sorted_values[k]
+
+
+class _Sample:
+    __slots__ = ('ms', 'size', 'tags')
+
+    def __init__(self, ms, size, tags):
+        self.ms = ms
+        self.size = size
+        self.tags = tags
+
+
+class Profiler:
+    '''
+    按视图记录插件各热点的耗时: 每项指标只保留最近WINDOW_SIZE次, 用于统计p50/p95/p99
+    '''
+    def __init__(self):
+        # view id -> 指标名 -> 最近的记录
+        self._samples = defaultdict(lambda: defaultdict(lambda: deque(maxlen=WINDOW_SIZE)))
+        # view id -> 视图名称 (用于输出)
+        self._names = {}
+        self._lock = Lock()
+
+    def record(self, view, name, ms, change_count=None):
+        '''
+        记录一次耗时, 同时记录buffer大小及该版本内容的tag数 (已解析时)
+        '''
+        tags = None
+        if change_count is not None:
+            cached = documents.peek(view.buffer_id(), change_count)
+            if cached is not None:
+                tags = len(cached[0].tokens)
+
+        with self._lock:
+            self._samples[view.id()][name].append(_Sample(ms, view.size(), tags))
+            self._names[view.id()] = view.file_name() or view.name() or 'untitled'
+
+        if name == 'lint' and get_setting('profiling_status', False):
+            view.set_status(STATUS_KEY, 'BBCode检查: {:.1f} ms'.format(ms))
+
+    def measure(self, view, name):
+        '''
+        记录with块耗时的上下文管理器 (未开启性能统计时不做任何事)
+        '''
+        return _Measure(view, name) if _enabled() else _NULL_MEASURE
+
+    def discard(self, view_id):
+        with self._lock:
+            self._samples.pop(view_id, None)
+            self._names.pop(view_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+            self._names.clear()
+
+    def report(self):
+        '''
+        各视图各项指标的统计结果
+        '''
+        with self._lock:
+            snapshot = dict((view_id, dict((name, list(samples)) for name, samples in metrics.items()))
+                            for view_id, metrics in self._samples.items())
+            names = dict(self._names)
+
+        report = []
+        for view_id, metrics in sorted(snapshot.items()):
+            view_report = {'view_id': view_id, 'name': names.get(view_id), 'metrics': {}}
+            for name, samples in sorted(metrics.items()):
+                times = sorted(sample.ms for sample in samples)
+                tags = [sample.tags for sample in samples if sample.tags is not None]
+                metric = {
+                    'count': len(times),
+                    'max_ms': round(times[-1], 3),
+                    'size': samples[-1].size,
+                    'tags': tags[-1] if tags else None,
+                }
+                for p in PERCENTILES:
+                    metric['p{}_ms'.format(p)] = round(_percentile(times, p), 3)
+                view_report['metrics'][name] = metric
+            report.append(view_report)
+        return report
+
+
+class _Measure:
+    __slots__ = ('view', 'name', 'start')
+
+    def __init__(self, view, name):
+        self.view = view
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        profiler.record(self.view, self.name, (time.perf_counter() - self.start) * 1000)
+        return False
+
+
+class _NullMeasure:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_MEASURE = _NullMeasure()
+profiler = Profiler()
+
+
+def profiled(name):
+    '''
+    记录被装饰方法(所属对象需有view属性)的耗时, 仅在设置"profiling"开启时生效
+    '''
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not _enabled():
+                return method(self, *args, **kwargs)
+
+            change_count = self.view.change_count()
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                profiler.record(self.view, name, (time.perf_counter() - start) * 1000, change_count)
+        return wrapper
+    return decorator
+
+
+def _format_report(report):
+    lines = []
+    header = '{:<28}{:>8}{:>12}{:>12}{:>12}{:>12}{:>10}{:>10}'.format('指标', '次数', 'p50(ms)', 'p95(ms)', 'p99(ms)', 'max(ms)', '字符数', 'tag数')
+    for view_report in report:
+        lines.append('[{}] {}'.format(view_report['view_id'], view_report['name']))
+        lines.append(header)
+        for name, metric in view_report['metrics'].items():
+            lines.append('{:<28}{:>8}{:>12.3f}{:>12.3f}{:>12.3f}{:>12.3f}{:>10}{:>10}'.format(
+                name, metric['count'], metric['p50_ms'], metric['p95_ms'], metric['p99_ms'], metric['max_ms'],
+                metric['size'], '-' if metric['tags'] is None else metric['tags']))
+        lines.append('')
+    return '\n'.join(lines) if lines else '没有记录 (请在设置中开启 "profiling")'
+
+
+class BbcodeProfileReportCommand(sublime_plugin.WindowCommand):
+    '''
+    输出各视图的性能统计: output="panel"输出到面板, output="json"写入JSON文件 (默认为 Packages/User/BBCode (NGA) profile.json)
+    '''
+    def run(self, output='panel', path=None):
+        report = profiler.report()
+
+        if output == 'json':
+            if path is None:
+                path = os.path.join(sublime.packages_path(), 'User', 'BBCode (NGA) profile.json')
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.window.open_file(path)
+            return
+
+        panel = self.window.create_output_panel(PANEL_NAME)
+        panel.run_command('append', {'characters': _format_report(report)})
+        self.window.run_command('show_panel', {'panel': 'output.' + PANEL_NAME})
+
+
+class BbcodeProfileResetCommand(sublime_plugin.WindowCommand):
+    '''
+    清空性能统计记录
+    '''
+    def run(self):
+        profiler.clear()
+        for view in self.window.views():
+            view.erase_status(STATUS_KEY)
@@ -0,0 +1,231 @@
+import re
+import hashlib
+from html import escape
+from .transforms import _fill_url, _fill_id_url, ID_LINKS
+
+
+__all__ = ['BlockRenderer', 'top_level_blocks', 'render_block']
+
+# 分块渲染时每块的最小长度
+MIN_BLOCK_LENGTH = 500
+# [*]在渲染结果中的占位
+_ITEM = object()
+_SIZE_PATTERN = re.compile(r'=(\d+)%$')
+
+# 只需包上固定HTML标签的BBCode
+_WRAPPERS = {
+    'b': ('<b>', '</b>'),
+    'i': ('<i>', '</i>'),
+    'u': ('<u>', '</u>'),
+    'del': ('<span class="del">', '</span>'),
+    'sup': ('<span class="sup">', '</span>'),
+    'h': ('<div class="h">', '</div>'),
+    'quote': ('<div class="quote">', '</div>'),
+    'code': ('<div class="code">', '</div>'),
+    'l': ('<div class="left">', '</div>'),
+    'r': ('<div class="right">', '</div>'),
+    'randomblock': ('<div class="randomblock">', '</div>'),
+    'table': ('<div class="table">', '</div>'),
+    'tr': ('<div class="tr">', '</div>'),
+    'td': ('<span class="td">', '</span>'),
+}
+
+
+def _text(text):
+    return escape(text, quote=False).replace('\n', '<br>')
+
+
+def _link(href, content):
+    return '<a href="{}">{}</a>'.format(escape(href), content)
+
+
+def _render_tag(tag, suffix, content, raw):
+    '''
+    渲染一个正确闭合的代码块: content为内容渲染后的各部分, raw为内容的原文
+    '''
+    value = suffix[1:] if suffix and suffix.startswith('=') else None
+
+    if tag == 'list':
+        # [*]之前的内容放在列表前面
+        chunks = [[]]
+        for part in content:
+            if part is _ITEM:
+                chunks.append([])
+            else:
+                chunks[-1].append(part)
+        return ''.join(chunks[0]) + '<ul>' + ''.join('<li>' + ''.join(chunk) + '</li>' for chunk in chunks[1:]) + '</ul>'
+
+    content = ''.join(part for part in content if part is not _ITEM)
+    if tag in _WRAPPERS:
+        begin, end = _WRAPPERS[tag]
+        return begin + content + end
+    if tag == 'collapse':
+        title = _text(value) if value else '点击显示隐藏的内容'
+        return '<div class="collapse"><div class="collapse-title">{}</div>{}</div>'.format(title, content)
+    if tag == 'url':
+        url = (value or raw).strip()
+        return _link(_fill_url(url), content) if url else content
+    if tag == 'img':
+        url = raw.strip()
+        return _link(_fill_url(url, img=True), '[图片]') if url else ''
+    if tag in ID_LINKS:
+        return _link(_fill_id_url(tag, (value or raw).strip()), content)
+    if tag == 'color' and value:
+        value = value.lower()
+        if value.startswith('bg'):
+            return '<span style="background-color: {}">{}</span>'.format(value[2:], content)
+        return '<span style="color: {}">{}</span>'.format(value, content)
+    if tag == 'size':
+        match = _SIZE_PATTERN.match(suffix or '')
+        if match is not None:
+            percent = int(match.group(1))
+            # [size=0%]用于使BBCode失去效果, 不显示内容
+            return '<span style="font-size: {}rem">{}</span>'.format(percent / 100, content) if percent else ''
+    if tag == 'align' and value:
+        return '<div style="text-align: {}">{}</div>'.format(value.lower(), content)
+    return content
+
+
+def render_block(document, pair_index, begin, end):
+    '''
+    将[begin, end)渲染为minihtml, 正确闭合的代码块按BBCode渲染, 其余tag原样显示
+    '''
+    text = document.text
+    events = [(token[0], token[1], token) for token in document.tokens_within(begin, end)]
+
+    # 各list中的[*]
+    for _, _, token in list(events):
+        if token[2] == 'list' and not token[3]:
+            k = pair_index.tag_at(token[0])
+            if k != -1 and pair_index.starts[k][0] == token[0]:
+                events += [(b, e, None) for b, e in pair_index.items_of(k)]
+    events.sort(key=lambda event: event[0])
+
+    # (tag, suffix, 代码块序号, 内容开始位置, 内容渲染后的各部分)
+    frames = [(None, None, -1, begin, [])]
+    pos = begin
+    for event_begin, event_end, token in events:
+        parts = frames[-1][4]
+        if event_begin > pos:
+            parts.append(_text(text[pos:event_begin]))
+        pos = event_end
+
+        if token is None:
+            parts.append(_ITEM)
+            continue
+
+        k = pair_index.tag_at(event_begin)
+        if k != -1 and not token[3] and pair_index.starts[k][0] == event_begin:
+            frames.append((token[2], token[4], k, event_end, []))
+        elif k != -1 and token[3] and pair_index.ends[k][0] == event_begin and frames[-1][2] == k:
+            tag, suffix, _, content_begin, content = frames.pop()
+            frames[-1][4].append(_render_tag(tag, suffix, content, text[content_begin:event_begin]))
+        else:
+            # 未闭合/不当闭合顺序的tag原样显示
+            parts.append(_text(text[event_begin:event_end]))
+    if end > pos:
+        frames[-1][4].append(_text(text[pos:end]))
+
+    # 区域在代码块中间截断时, 未闭合的代码块原样显示开头tag
+    while len(frames) > 1:
+        _, _, k, content_begin, content = frames.pop()
+        frames[-1][4].append(_text(text[pair_index.starts[k][0]:content_begin]))
+        frames[-1][4].extend(content)
+    return ''.join(part for part in frames[0][4] if part is not _ITEM)
+
+
+def top_level_blocks(document, pair_index):
+    '''
+    将全文划分为若干区域: 只在不属于任何代码块的换行处切分, 因此每个顶层代码块都完整地位于一个区域中;
+    每个区域至少MIN_BLOCK_LENGTH个字符 (全文末尾除外), 使同一行/相邻几行中的短代码块合并渲染
+    '''
+    text = document.text
+    parents, ends = pair_index.parents, pair_index.ends.ends
+    begin = 0
+    pos = MIN_BLOCK_LENGTH
+    while pos < len(text):
+        cut = text.find('\n', pos)
+        if cut == -1:
+            break
+        k = pair_index.innermost(cut)
+        if k == -1:
+            yield (begin, cut + 1)
+            begin = cut + 1
+            pos = begin + MIN_BLOCK_LENGTH
+        else:
+            # 换行位于代码块中, 跳到其所在顶层代码块之后
+            while parents[k] != -1:
+                k = parents[k]
+            pos = ends[k]
+    if begin < len(text):
+        yield (begin, len(text))
+
+
+def _open_tags_before(document, blocks):
+    '''
+    依次返回各区域开始处尚未闭合的tag名 (由外向内)
+
+    所有tag都正确闭合时均为空 (区域只在不属于任何代码块的位置切分); 否则按顺序扫描一次tag, 与Document.open_tags_at的规则相同
+    '''
+    if not document.errors and not document.open_tags:
+        for _ in blocks:
+            yield ()
+        return
+
+    tokens = document.tokens
+    stack = []
+    k = 0
+    for begin, _ in blocks:
+        # tag互不重叠, 结尾位置同样有序
+        j = tokens.ends.bisect_right(begin)
+        for _, _, tag, is_end, _ in tokens[k:j]:
+            if tag == 'fixsize' or tag == '*':
+                continue
+            if not is_end:
+                stack.append(tag)
+            elif stack:
+                stack.pop()
+        k = j
+        yield tuple(stack)
+
+
+class BlockRenderer:
+    '''
+    按顶层代码块渲染全文, 并按内容哈希及区域开始处未闭合的tag缓存各区域的渲染结果: 编辑后只重新渲染内容或上文变化的区域
+
+    缓存只保留最近一次渲染用到的区域, 大小随全文的区域数变化
+    '''
+    __slots__ = ('cache', 'rendered', 'reused')
+
+    def __init__(self):
+        # (区域开始处未闭合的tag, 区域内容的哈希) -> 渲染结果
+        self.cache = {}
+        # 最近一次渲染中重新渲染/复用的区域数
+        self.rendered = 0
+        self.reused = 0
+
+    def render(self, document, pair_index):
+        text = document.text
+        old_cache = self.cache
+        cache = {}
+        parts = []
+        self.rendered = self.reused = 0
+        blocks = list(top_level_blocks(document, pair_index))
+        for (begin, end), open_tags in zip(blocks, _open_tags_before(document, blocks)):
+            # 区域之前未闭合的tag会改变区域中内容的解析 (如在[code]中时不再解析tag), 因此与内容一起作为缓存的键
+            key = (open_tags, hashlib.sha1(text[begin:end].encode('utf-8')).digest())
+            html = cache.get(key)
+            if html is None:
+                html = old_cache.get(key)
+                if html is None:
+                    html = render_block(document, pair_index, begin, end)
+                    self.rendered += 1
+                else:
+                    self.reused += 1
+                cache[key] = html
+            else:
+                self.reused += 1
+            parts.append(html)
+
+        self.cache = cache
+        return ''.join(parts)
@@ -0,0 +1,83 @@
+import sublime
+import threading
+import time
+import traceback
+
+
+__all__ = ['scheduler', 'get_setting']
+
+SETTINGS_FILE = 'BBCode-NGA.sublime-settings'
+
+
+def get_setting(key, default=None):
+    return sublime.load_settings(SETTINGS_FILE).get(key, default)
+
+
+class Scheduler:
+    '''
+    插件共用的单个常驻工作线程: 相同key的任务会被合并(只保留最新的一个, 并重新计算延迟), 到期后依次执行
+    '''
+    def __init__(self):
+        self._tasks = {}    # key -> (到期时间, 回调)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def schedule(self, key, callback, delay=0):
+        '''
+        delay毫秒后执行callback, 覆盖尚未执行的同key任务
+        '''
+        with self._cond:
+            self._tasks[key] = (time.monotonic() + delay / 1000, callback)
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped = False
+                self._thread = threading.Thread(target=self._run, name='BBCode (NGA) scheduler')
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify()
+
+    def cancel(self, predicate):
+        '''
+        取消所有key满足predicate的任务
+        '''
+        with self._cond:
+            for key in [key for key in self._tasks if predicate(key)]:
+                del self._tasks[key]
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._tasks.clear()
+            self._cond.notify()
+
+    def _next_task(self):
+        with self._cond:
+            while not self._stopped:
+                if not self._tasks:
+                    self._cond.wait()
+                    continue
+                key, (due, callback) = min(self._tasks.items(), key=lambda item: item[1][0])
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                del self._tasks[key]
+                return callback
+            return None
+
+    def _run(self):
+        while True:
+            callback = self._next_task()
+            if callback is None:
+                return
+            try:
+                callback()
+            except Exception:
+                traceback.print_exc()
+
+
+scheduler = Scheduler()
+
+
+def plugin_unloaded():
+    scheduler.stop()
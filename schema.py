@@ -0,0 +1,34 @@
+'''
+由 tools/gen_schema.py 根据 BBCode (NGA).sublime-syntax 中的 variables 生成, 请勿手动修改
+'''
+
+
+__all__ = ['ALIGN_NAMES', 'ALIGN_CODES', 'COLOR_NAMES', 'COLOR_CODES', 'FONT_NAMES', 'FONT_CODES', 'HEX_CODE']
+
+# algin_code (保持原样, 用于显示及补全)
+ALIGN_NAMES = (
+    'left', 'center', 'right',
+)
+# algin_code (忽略大小写: 统一为小写, 比较时只需将输入转为小写)
+ALIGN_CODES = frozenset(name.lower() for name in ALIGN_NAMES)
+# color_code (保持原样, 用于显示及补全)
+COLOR_NAMES = (
+    'skyblue', 'royalblue', 'blue', 'darkblue', 'orange', 'orangered', 'crimson', 'red', 'firebrick', 'darkred',
+    'green', 'limegreen', 'seagreen', 'teal', 'deeppink', 'tomato', 'coral', 'purple', 'indigo', 'burlywood',
+    'sandybrown', 'chocolate', 'sienna', 'silver', 'bgskyblue', 'bgroyalblue', 'bgblue', 'bgdarkblue', 'bgorange',
+    'bgorangered', 'bgcrimson', 'bgred', 'bgfirebrick', 'bgdarkred', 'bggreen', 'bglimegreen', 'bgseagreen', 'bgteal',
+    'bgdeeppink', 'bgtomato', 'bgcoral', 'bgpurple', 'bgindigo', 'bgburlywood', 'bgsandybrown', 'bgchocolate',
+    'bgsienna', 'bgsilver',
+)
+# color_code (忽略大小写: 统一为小写, 比较时只需将输入转为小写)
+COLOR_CODES = frozenset(name.lower() for name in COLOR_NAMES)
+# font_code (保持原样, 用于显示及补全)
+FONT_NAMES = (
+    'simsun', 'simhei', 'Arial', 'Arial Black', 'Book Antiqua', 'Century Gothic', 'Comic Sans MS', 'Courier New',
+    'Georgia', 'Impact', 'Tahoma', 'Times New Roman', 'Trebuchet MS', 'Script MT Bold', 'Stencil', 'Verdana',
+    'Lucida Console',
+)
+# font_code (忽略大小写: 统一为小写, 比较时只需将输入转为小写)
+FONT_CODES = frozenset(name.lower() for name in FONT_NAMES)
+# hex_code
+HEX_CODE = '#([A-Fa-f0-9]{3}|[A-Fa-f0-9]{6})'
@@ -0,0 +1,109 @@
+__all__ = ['split_post']
+
+
+def _depth_zero_cut(text, ranges, i, begin, limit):
+    '''
+    (begin, limit]中最靠后的、不在任何代码块中的切分位置, 优先选择行首; 不存在时返回None
+
+    ranges[i:]为从begin附近开始的顶层区间
+    '''
+    fallback = None
+    j = i
+    while j < len(ranges) and ranges[j][0] <= limit:
+        j += 1
+    for a, b in reversed(ranges[i:j]):
+        lo, hi = max(a, begin), min(b, limit)
+        if hi <= begin:
+            continue
+        newline = text.rfind('\n', lo, hi)
+        if newline != -1:
+            return newline + 1
+        if fallback is None:
+            fallback = hi
+    return fallback
+
+
+def _enclosing_blocks(pair_index, pos):
+    '''
+    在pos处切分时需要关闭再重新打开的代码块 (由内向外), pos位于tag中间时返回None
+    '''
+    blocks = []
+    for k in pair_index.enclosing(pos):
+        start, end = pair_index.starts[k], pair_index.ends[k]
+        if start[0] < pos < start[1] or end[0] < pos < end[1]:
+            return None
+        if start[0] < pos:
+            blocks.append(k)
+    return blocks
+
+
+def _reopen_cut(text, pair_index, begin, limit, budget):
+    '''
+    (begin, limit]中最靠后的行首, 要求加上关闭各代码块的结尾tag后不超过budget; 返回(切分位置, 代码块), 不存在时返回None
+    '''
+    cut = text.rfind('\n', begin, limit) + 1
+    while cut > begin:
+        blocks = _enclosing_blocks(pair_index, cut)
+        if blocks is not None:
+            closing = sum(pair_index.ends[k][1] - pair_index.ends[k][0] for k in blocks)
+            if cut - begin + closing <= budget:
+                return cut, blocks
+        cut = text.rfind('\n', begin, cut - 1) + 1
+    return None
+
+
+def _append_chunk(chunks, chunk, max_length):
+    '''
+    添加一段; 只有空白的段并入上一段, 放不下(或没有上一段)时丢弃
+    '''
+    if chunk.strip():
+        chunks.append(chunk)
+    elif chunks and len(chunks[-1]) + len(chunk) <= max_length:
+        chunks[-1] += chunk
+
+
+def split_post(document, pair_index, max_length, reopen_tags=False):
+    '''
+    将全文切分为长度(字符数)不超过max_length的若干段, 返回(各段文本, 超出长度的段的序号)
+
+    默认只在不属于任何代码块的位置(优先在行首)切分; reopen_tags为True时可在代码块中的行首切分,
+    并在切分处关闭包裹该位置的代码块, 在下一段开头重新打开. 没有合适的切分位置时(如单个顶层代码块过长),
+    该段会超出长度
+    '''
+    text = document.text
+    size = len(text)
+    # 不在任何代码块中的区间, 来自检查时建立的代码块索引
+    ranges = list(pair_index.depth_zero_ranges(size))
+
+    chunks = []
+    oversized = []
+    begin = 0
+    i = 0
+    prefix = ''
+    while begin < size:
+        budget = max_length - len(prefix)
+        limit = begin + budget
+        if limit >= size:
+            _append_chunk(chunks, prefix + text[begin:], max_length)
+            break
+
+        while i < len(ranges) and ranges[i][1] < begin:
+            i += 1
+
+        reopened = _reopen_cut(text, pair_index, begin, limit, budget) if reopen_tags else None
+        if reopened is not None:
+            cut, blocks = reopened
+            closing = ''.join(text[pair_index.ends[k][0]:pair_index.ends[k][1]] for k in blocks)
+            opening = ''.join(text[pair_index.starts[k][0]:pair_index.starts[k][1]] for k in reversed(blocks))
+        else:
+            cut = _depth_zero_cut(text, ranges, i, begin, limit)
+            closing = opening = ''
+            if cut is None:
+                # 顶层代码块过长, 只能延长到其之后第一个可以切分的位置
+                cut = next((max(a, limit) for a, b in ranges[i:] if b > limit), size)
+                oversized.append(len(chunks))
+
+        _append_chunk(chunks, prefix + text[begin:cut] + closing, max_length)
+        prefix = opening
+        begin = cut
+    return chunks, oversized
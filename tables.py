@@ -0,0 +1,202 @@
+import re
+from collections import defaultdict
+from .transforms import _fill_url
+
+
+__all__ = ['display_width', 'MarkdownTable', 'table_to_markdown']
+
+BBCODE2MD = defaultdict(str)
+BBCODE2MD.update({
+    'b': '**',
+    'i': '*',
+    'del': '~~',
+    'code': '`'
+})
+# table中支持转换的BBCode
+TABLE_TAGS = frozenset(['table', 'tr', 'td', 'b', 'i', 'del', 'code', 'url', 'img'])
+
+# 显示宽度为2的字符 (Unicode East Asian Width 中的 W/F, 相邻区间间隔的未分配码位已合并)
+WIDE_RANGES = (
+    (0x1100, 0x115F), (0x231A, 0x231B), (0x2329, 0x232A), (0x23E9, 0x23EC), (0x23F0, 0x23F0), (0x23F3, 0x23F3),
+    (0x25FD, 0x25FE), (0x2614, 0x2615), (0x2648, 0x2653), (0x267F, 0x267F), (0x2693, 0x2693), (0x26A1, 0x26A1),
+    (0x26AA, 0x26AB), (0x26BD, 0x26BE), (0x26C4, 0x26C5), (0x26CE, 0x26CE), (0x26D4, 0x26D4), (0x26EA, 0x26EA),
+    (0x26F2, 0x26F3), (0x26F5, 0x26F5), (0x26FA, 0x26FA), (0x26FD, 0x26FD), (0x2705, 0x2705), (0x270A, 0x270B),
+    (0x2728, 0x2728), (0x274C, 0x274C), (0x274E, 0x274E), (0x2753, 0x2755), (0x2757, 0x2757), (0x2795, 0x2797),
+    (0x27B0, 0x27B0), (0x27BF, 0x27BF), (0x2B1B, 0x2B1C), (0x2B50, 0x2B50), (0x2B55, 0x2B55), (0x2E80, 0x303E),
+    (0x3041, 0x3247), (0x3250, 0x4DBF), (0x4E00, 0xA4C6), (0xA960, 0xA97C), (0xAC00, 0xD7A3), (0xF900, 0xFAFF),
+    (0xFE10, 0xFE19), (0xFE30, 0xFE6B), (0xFF01, 0xFF60), (0xFFE0, 0xFFE6), (0x16FE0, 0x1B2FB), (0x1F004, 0x1F004),
+    (0x1F0CF, 0x1F0CF), (0x1F18E, 0x1F18E), (0x1F191, 0x1F19A), (0x1F200, 0x1F320), (0x1F32D, 0x1F335),
+    (0x1F337, 0x1F37C), (0x1F37E, 0x1F393), (0x1F3A0, 0x1F3CA), (0x1F3CF, 0x1F3D3), (0x1F3E0, 0x1F3F0),
+    (0x1F3F4, 0x1F3F4), (0x1F3F8, 0x1F43E), (0x1F440, 0x1F440), (0x1F442, 0x1F4FC), (0x1F4FF, 0x1F53D),
+    (0x1F54B, 0x1F54E), (0x1F550, 0x1F567), (0x1F57A, 0x1F57A), (0x1F595, 0x1F596), (0x1F5A4, 0x1F5A4),
+    (0x1F5FB, 0x1F64F), (0x1F680, 0x1F6C5), (0x1F6CC, 0x1F6CC), (0x1F6D0, 0x1F6D2), (0x1F6D5, 0x1F6DF),
+    (0x1F6EB, 0x1F6EC), (0x1F6F4, 0x1F6FC), (0x1F7E0, 0x1F7F0), (0x1F90C, 0x1F93A), (0x1F93C, 0x1F945),
+    (0x1F947, 0x1F9FF), (0x1FA70, 0x1FAF6), (0x20000, 0x3FFFD),
+)
+_NARROW_PATTERN = re.compile('[^' + ''.join('{}-{}'.format(chr(begin), chr(end)) for begin, end in WIDE_RANGES) + ']+')
+
+
+def display_width(text):
+    '''
+    获取字符串的显示宽度 (全角/宽字符占两个显示宽度)
+    '''
+    # 去掉所有窄字符后剩下的都是宽字符, 每个宽字符额外占一个显示宽度
+    return len(text) + len(_NARROW_PATTERN.sub('', text))
+
+
+class _Row:
+    '''
+    表格的一行: 各单元格的内容及其显示宽度
+    '''
+    __slots__ = ('cells', 'widths')
+
+    def __init__(self):
+        self.cells = []
+        self.widths = []
+
+
+class MarkdownTable:
+    '''
+    流式构建Markdown表格: 单元格内容先存入列表, 单元格结束时只拼接一次并计算一次显示宽度
+    '''
+    __slots__ = ('begin', 'rows', 'col_widths', 'row', 'parts', 'url')
+
+    def __init__(self, begin):
+        self.begin = begin
+        self.rows = []
+        # 各列的最大显示宽度
+        self.col_widths = []
+        self.row = _Row()
+        self.parts = []
+        # "[url=链接]"中的链接
+        self.url = None
+
+    def new_row(self):
+        self.row = _Row()
+
+    def end_row(self):
+        self.rows.append(self.row)
+
+    def new_cell(self):
+        self.parts = []
+
+    def end_cell(self, text):
+        self.parts.append(text)
+        cell = ''.join(self.parts).replace('\n', '<br>')
+        width = display_width(cell)
+
+        row = self.row
+        col = len(row.cells)
+        row.cells.append(cell)
+        row.widths.append(width)
+        if col == len(self.col_widths):
+            self.col_widths.append(width)
+        elif width > self.col_widths[col]:
+            self.col_widths[col] = width
+
+    def add_text(self, text, tag=''):
+        '''
+        将以tag结尾的文本加入当前单元格
+        '''
+        parts = self.parts
+        if tag == 'url':
+            # "[url]链接[/url]"变为"链接", "[url=链接]描述[/url]"变为"[描述](链接)"
+            if self.url:
+                parts.append('[{}]({})'.format(text, _fill_url(self.url)))
+            else:
+                parts.append(_fill_url(text))
+            self.url = None
+        elif tag == 'img':
+            parts.append('![IMG]({})'.format(_fill_url(text, img=True)))
+        else:
+            mark = BBCODE2MD[tag]
+            parts.append(mark)
+            parts.append(text)
+            parts.append(mark)
+
+    def build(self):
+        '''
+        生成Markdown格式的表格, 没有单元格时返回None
+        '''
+        col_widths = self.col_widths
+        if not col_widths:
+            return None
+
+        lines = []
+        for row in self.rows:
+            # 填充单元格, 使得每个单元格显示宽度一样, 并填充缺少的列
+            cells = [cell + ' ' * (col_widths[i] - width) for i, (cell, width) in enumerate(zip(row.cells, row.widths))]
+            cells.extend(' ' * width for width in col_widths[len(cells):])
+            lines.append('| ' + ' | '.join(cells) + ' |')
+
+        split_row = '| ' + ' | '.join([':' + '-' * (width - 1) for width in col_widths]) + ' |'
+        lines.insert(1, split_row)
+        return '\n'.join(lines)
+
+
+def table_to_markdown(document, begin, end):
+    '''
+    将[begin, end)内的table代码块转换为Markdown格式, 一次遍历区域内的所有tag
+
+    返回(修改, 错误): 修改为按位置排序的(起始, 结束, 新文本), 错误为(位置, 提示信息), 没有错误时为None
+    遇到错误时停止转换, 之前已转换的表格仍会返回
+    '''
+    content = document.text
+    edits = []
+    md_table = None
+    tag_stack = []
+    last_pos = begin
+
+    for pos, end_pos, tag, is_end, suffix in document.tokens_within(begin, end):
+        # 跳过表格外部区域
+        if md_table is None:
+            if tag == 'table' and not is_end:
+                md_table = MarkdownTable(pos)
+                tag_stack.append(tag)
+                last_pos = end_pos
+            continue
+
+        # 跳过不支持转换的BBCode, 保留其前面的文本
+        if tag not in TABLE_TAGS:
+            md_table.add_text(content[last_pos:pos])
+            last_pos = end_pos
+            continue
+
+        if not is_end:
+            # 开头tag
+            if tag == 'table':
+                return edits, (pos, '不支持嵌套表格')
+            elif tag == 'tr':
+                md_table.new_row()
+            elif tag == 'td':
+                md_table.new_cell()
+            else:
+                # 保留单元格中位于样式tag前面的文本
+                md_table.add_text(content[last_pos:pos])
+                if tag == 'url' and suffix:
+                    md_table.url = suffix[1:]
+            tag_stack.append(tag)
+        else:
+            # 结尾tag
+            if not tag_stack or tag_stack[-1] != tag:
+                return edits, (pos, '检测到未闭合/不当闭合顺序代码块 ' + (tag_stack[-1] if tag_stack else tag))
+            tag_stack.pop()
+
+            text = content[last_pos:pos]
+            if tag == 'table':
+                # 生成markdown格式的表格
+                replace_str = md_table.build()
+                if replace_str is not None:
+                    edits.append((md_table.begin, end_pos, replace_str))
+                md_table = None
+            elif tag == 'tr':
+                md_table.end_row()
+            elif tag == 'td':
+                md_table.end_cell(text)
+            else:
+                md_table.add_text(text, tag)
+
+        # 跳过BBCode tag
+        last_pos = end_pos
+
+    return edits, None
@@ -0,0 +1,26 @@
+'''
+插件中不依赖 Sublime Text 的模块的测试
+
+与 tools/lint.py 相同, 以包的形式加载插件 (插件内部使用相对导入):
+
+    python -m pytest tests
+    python -m unittest discover -s tests -t .
+'''
+import importlib
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = 'bbcode_nga'
+
+
+def load(name):
+    '''
+    加载插件中的模块name
+    '''
+    if PACKAGE not in sys.modules:
+        package = types.ModuleType(PACKAGE)
+        package.__path__ = [ROOT]
+        sys.modules[PACKAGE] = package
+    return importlib.import_module(PACKAGE + '.' + name)
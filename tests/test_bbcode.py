@@ -0,0 +1,129 @@
+import random
+import unittest
+
+from . import load
+
+bbcode = load('bbcode')
+
+# 随机文本的组成部分: 各种tag(含不合法的属性值)、[*]、换行、不完整的tag及普通文本
+TAGS = ['b', 'i', 'list', 'quote', 'style ab', 'randomblock', 'table', 'td', 'tr', 'url', 'url=x', 'code', 'img',
+        'tid=3', 'color=red', 'color=reddd', 'align=', 'font=simsun', 'size=0%', 'collapse=t',
+        'fixsize height 1 width 2 3 background #fff']
+FRAGMENTS = ['[', ']', '[b=', ' ', '__x__', '__']
+WORDS = ['abc', '中文', 'x', 'yy ', '3']
+
+
+def _piece(rng):
+    c = rng.random()
+    if c < 0.35:
+        tag = rng.choice(TAGS)
+        name = tag.split()[0].split('=')[0] if rng.random() < 0.5 else tag
+        return '[' + rng.choice(['', '/']) + name + ']'
+    if c < 0.4:
+        return '[*]'
+    if c < 0.5:
+        return '\n'
+    if c < 0.55:
+        return rng.choice(FRAGMENTS)
+    return rng.choice(WORDS)
+
+
+def _random_text(rng, n):
+    return ''.join(_piece(rng) for _ in range(n))
+
+
+def _snapshot(document):
+    return (list(document.tokens), list(document.spans), list(document.pairs), document.error_regions(),
+            list(document.attribute_errors), list(document.items))
+
+
+def _index_columns(pair_index):
+    return (list(pair_index.starts), list(pair_index.ends), list(pair_index.parents),
+            list(pair_index.bounds), list(pair_index.owners))
+
+
+class ParseTest(unittest.TestCase):
+    def test_pairs_and_errors(self):
+        text = '[b]x[i]y[/i][/b][quote]z'
+        document = bbcode.parse(text)
+        self.assertEqual(list(document.pairs), [((4, 7), (8, 12)), ((0, 3), (12, 16))])
+        self.assertEqual(document.error_regions(), [(16, 23)])
+
+    def test_open_tags_at(self):
+        text = '[quote][b]x[/b][list][*]y'
+        document = bbcode.parse(text)
+        self.assertEqual([tag for tag, _ in document.open_tags_at(len(text))], ['quote', 'list'])
+        self.assertEqual([tag for tag, _ in document.open_tags_at(11)], ['quote', 'b'])
+
+    def test_attribute_errors(self):
+        text = '[color=reddd]x[/color][color=red]y[/color]'
+        document = bbcode.parse(text)
+        self.assertEqual(list(document.attribute_errors), [(7, 12)])
+
+
+class IncrementalUpdateTest(unittest.TestCase):
+    '''
+    增量解析与代码块索引的增量更新: 随机改动后的结果应与重新全量解析/建立索引一致
+    '''
+    def setUp(self):
+        # 断点更密集, 使复用上一次结果的各种情况都能出现
+        self.checkpoint_interval = bbcode.CHECKPOINT_INTERVAL
+        bbcode.CHECKPOINT_INTERVAL = 3
+
+    def tearDown(self):
+        bbcode.CHECKPOINT_INTERVAL = self.checkpoint_interval
+
+    def _random_edits(self, seed, trials, steps):
+        rng = random.Random(seed)
+        for _ in range(trials):
+            text = _random_text(rng, rng.randint(0, 300))
+            document = bbcode.parse(text)
+            pair_index = bbcode.PairIndex.of(document)
+            for _ in range(steps):
+                # 一次update前可能有多处改动, 合并为一个脏区间
+                dirty = None
+                for _ in range(rng.randint(1, 3)):
+                    a = rng.randint(0, len(text))
+                    b = min(len(text), a + rng.choice([0, 0, 1, 2, 5, 30]))
+                    inserted = _random_text(rng, rng.randint(0, 4))
+                    text = text[:a] + inserted + text[b:]
+                    dirty = bbcode.merge_dirty_span(dirty, a, b, len(inserted))
+                document = document.update(text, dirty)
+                pair_index = bbcode.PairIndex.of(document, pair_index)
+                yield text, document, pair_index
+
+    def test_update_matches_parse(self):
+        for text, document, _ in self._random_edits(0, 80, 10):
+            self.assertEqual(_snapshot(document), _snapshot(bbcode.parse(text)), text)
+
+    def test_pair_index_matches_full_build(self):
+        for text, _, pair_index in self._random_edits(1, 60, 10):
+            document = bbcode.parse(text)
+            full = bbcode.PairIndex(document.pairs, document.items, text)
+            self.assertEqual(_index_columns(pair_index), _index_columns(full), text)
+            self.assertEqual(list(pair_index.depth_zero_ranges(len(text))), list(full.depth_zero_ranges(len(text))))
+            for pos in range(0, len(text) + 1, 7):
+                enclosing = list(full.enclosing(pos))
+                self.assertEqual(list(pair_index.enclosing(pos)), enclosing)
+                for k in enclosing:
+                    self.assertEqual(pair_index.active_item(k, pos), full.active_item(k, pos))
+                    self.assertEqual(pair_index.items_of(k), full.items_of(k))
+
+    def test_insert_right_after_start_tag(self):
+        # 改动恰好位于开头tag之后: 复用的代码块中, 开头tag的区域不平移
+        document = bbcode.parse('[d][table][tr]\n[/tr]')
+        text = '[d][table][tr][collapse][/style ab][/code]abc\n[/tr]'
+        updated = document.update(text, (14, 45, 31))
+        self.assertEqual(_snapshot(updated), _snapshot(bbcode.parse(text)))
+        self.assertEqual(list(updated.pairs), [((10, 14), (46, 51))])
+        pair_index = bbcode.PairIndex.of(updated, bbcode.PairIndex.of(document))
+        self.assertEqual(list(pair_index.starts), [(10, 14)])
+
+    def test_update_without_dirty_span(self):
+        document = bbcode.parse('[b]x[/b]')
+        text = '[i][b]x[/b]'
+        self.assertEqual(_snapshot(document.update(text)), _snapshot(bbcode.parse(text)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+
+from . import load
+
+markdown = load('markdown')
+
+
+class InlineTest(unittest.TestCase):
+    def assertConverts(self, text, expected):
+        self.assertEqual(markdown.markdown_to_bbcode(text), expected)
+
+    def test_emphasis(self):
+        self.assertConverts('**bold** and *it* and _u_ and __b2__ and ~~del~~',
+                            '[b]bold[/b] and [i]it[/i] and [i]u[/i] and [b]b2[/b] and [del]del[/del]')
+        self.assertConverts('*a **b** c*', '[i]a [b]b[/b] c[/i]')
+
+    def test_literal_delimiters(self):
+        self.assertConverts('a*b*c foo_bar_baz `code *x*` \\*lit\\*',
+                            'a[i]b[/i]c foo_bar_baz [code]code *x*[/code] *lit*')
+        self.assertConverts('2 * 3 * 4 and snake_case_name', '2 * 3 * 4 and snake_case_name')
+
+    def test_links_and_images(self):
+        self.assertConverts(
+            '[text **b**](http://x.com) [x](x) ![alt](https://img.nga.178.com/attachments/mon_2023/a.png "t") <https://a.b/c>',
+            '[url=http://x.com]text [b]b[/b][/url] [url]x[/url] [img]./mon_2023/a.png[/img] [url]https://a.b/c[/url]')
+
+    def test_unclosed_delimiters(self):
+        # 未闭合的分隔符原样保留
+        text = '*a ' * 100000
+        self.assertConverts(text, text)
+        text = '[a ![c <http://d ' * 10000 + '`b'
+        self.assertConverts(text, text)
+
+
+class BlockTest(unittest.TestCase):
+    def assertConverts(self, text, expected):
+        self.assertEqual(markdown.markdown_to_bbcode(text), expected)
+
+    def test_lists(self):
+        self.assertConverts('- a\n- b\n\n- c\n  cont\n    - d\n1. x',
+                            '[list]\n[*]a\n[*]b\n[*]c\ncont\n[list]\n[*]d\n[/list]\n[*]x\n[/list]')
+
+    def test_list_type_change_after_blank_line(self):
+        self.assertConverts('- a\n- b\n\n1. c\n2. d', '[list]\n[*]a\n[*]b\n[/list]\n\n[list]\n[*]c\n[*]d\n[/list]')
+        self.assertConverts('- a\n  - b\n\n  1. c\n- e',
+                            '[list]\n[*]a\n[list]\n[*]b\n[/list]\n[list]\n[*]c\n[/list]\n[*]e\n[/list]')
+
+    def test_table(self):
+        self.assertConverts('| a | b |\n|---|---|\n| **x** | y<br>z |',
+                            '[table]\n[tr][td]a[/td][td]b[/td][/tr]\n[tr][td][b]x[/b][/td][td]y\nz[/td][/tr]\n[/table]')
+
+    def test_quote_heading_and_code(self):
+        self.assertConverts('> quote *i*\n> - l\n\n# Head #\n```\ncode **x**\n```',
+                            '[quote]quote [i]i[/i]\n[list]\n[*]l\n[/list][/quote]\n\n[h]Head[/h]\n[code]code **x**[/code]')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+from . import load
+
+bbcode = load('bbcode')
+splitter = load('splitter')
+
+
+def _split(text, max_length, reopen_tags=False):
+    document = bbcode.parse(text)
+    return splitter.split_post(document, bbcode.PairIndex.of(document), max_length, reopen_tags)
+
+
+class SplitPostTest(unittest.TestCase):
+    def test_split_at_line_starts(self):
+        text = '\n'.join('line {} [b]bold[/b]'.format(i) for i in range(8))
+        chunks, oversized = _split(text, 60)
+        self.assertEqual(chunks, [
+            'line 0 [b]bold[/b]\nline 1 [b]bold[/b]\nline 2 [b]bold[/b]\n',
+            'line 3 [b]bold[/b]\nline 4 [b]bold[/b]\nline 5 [b]bold[/b]\n',
+            'line 6 [b]bold[/b]\nline 7 [b]bold[/b]',
+        ])
+        self.assertEqual(oversized, [])
+        self.assertEqual(''.join(chunks), text)
+
+    def test_oversized_block(self):
+        # 不在代码块中切分: 过长的顶层代码块单独成为超长的一段
+        text = '[quote]' + '\n'.join('q{} text'.format(i) for i in range(6)) + '[/quote]\ntail'
+        chunks, oversized = _split(text, 30)
+        self.assertEqual(chunks, ['[quote]q0 text\nq1 text\nq2 text\nq3 text\nq4 text\nq5 text[/quote]', '\ntail'])
+        self.assertEqual(oversized, [0])
+
+    def test_reopen_tags(self):
+        text = '[quote]' + '\n'.join('q{} text'.format(i) for i in range(6)) + '[/quote]\ntail'
+        chunks, oversized = _split(text, 30, reopen_tags=True)
+        self.assertEqual(chunks, ['[quote]q{} text\n[/quote]'.format(i) for i in range(5)] + ['[quote]q5 text[/quote]\ntail'])
+        self.assertEqual(oversized, [])
+        self.assertTrue(all(len(chunk) <= 30 for chunk in chunks))
+
+    def test_short_post(self):
+        self.assertEqual(_split('[b]x[/b]', 100), (['[b]x[/b]'], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
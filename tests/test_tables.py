@@ -0,0 +1,49 @@
+import unittest
+
+from . import load
+
+bbcode = load('bbcode')
+tables = load('tables')
+markdown = load('markdown')
+
+
+def _convert(text):
+    return tables.table_to_markdown(bbcode.parse(text), 0, len(text))
+
+
+class TableToMarkdownTest(unittest.TestCase):
+    def test_styles_and_url(self):
+        text = ('x[table][tr][td]名称[/td][td]值[/td][/tr][tr][td][b]粗[/b] [i]斜[/i][/td]'
+                '[td][url=https://bbs.nga.cn/read.php?tid=1]帖子[/url][/td][/tr][/table]y')
+        edits, error = _convert(text)
+        self.assertIsNone(error)
+        self.assertEqual(edits, [(1, len(text) - 1, '\n'.join([
+            '| 名称        | 值                                        |',
+            '| :---------- | :---------------------------------------- |',
+            '| **粗** *斜* | [帖子](https://bbs.nga.cn/read.php?tid=1) |',
+        ]))])
+
+    def test_newline_code_and_img(self):
+        text = ('[table][tr][td]a\nb[/td][td][del]d[/del] [code]c[/code][/td][/tr]'
+                '[tr][td][img]./mon_2023/a.jpg[/img][/td][td]x[/td][/tr][/table]')
+        edits, error = _convert(text)
+        self.assertIsNone(error)
+        self.assertEqual(edits, [(0, len(text), '\n'.join([
+            '| a<br>b                                                     | ~~d~~ `c` |',
+            '| :--------------------------------------------------------- | :-------- |',
+            '| ![IMG](https://img.nga.178.com/attachments/mon_2023/a.jpg) | x         |',
+        ]))])
+
+    def test_nested_table(self):
+        self.assertEqual(_convert('[table][tr][td][table][/table][/td][/tr][/table]'), ([], (15, '不支持嵌套表格')))
+
+    def test_round_trip(self):
+        # 与Markdown转BBCode互逆 (图片精简为相对路径)
+        text = '[table][tr][td]a[/td][td][b]b[/b][/td][/tr][tr][td][img]./mon_2023/a.jpg[/img][/td][td]c\nd[/td][/tr][/table]'
+        (_, _, converted), = _convert(text)[0]
+        self.assertEqual(markdown.markdown_to_bbcode(converted).replace('\n[tr]', '[tr]').replace('\n[/table]', '[/table]'),
+                         text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+from . import load
+
+bbcode = load('bbcode')
+transforms = load('transforms')
+
+
+def _apply(text, names):
+    document = bbcode.parse(text)
+    replacement = transforms.coalesce(text, transforms.pipeline(document, names, 0, len(text)))
+    if replacement is None:
+        return text
+    begin, end, new_text = replacement
+    return text[:begin] + new_text + text[end:]
+
+
+class TransformTest(unittest.TestCase):
+    def test_condense_url(self):
+        self.assertEqual(
+            _apply('see https://bbs.nga.cn/read.php?tid=123 and [url]https://ngabbs.com/read.php?tid=1[/url]', ['condense_url']),
+            'see https://bbs.nga.cn/read.php?tid=123 and [url]/read.php?tid=1[/url]')
+        self.assertEqual(_apply('[url=https://bbs.nga.cn/read.php?tid=5]t[/url]', ['condense_url']),
+                         '[url=/read.php?tid=5]t[/url]')
+
+    def test_replace_img(self):
+        self.assertEqual(
+            _apply('[img]https://img.nga.178.com/attachments/mon_2023/a.jpg[/img] [img]./mon_2023/b.png[/img]', ['replace_img']),
+            transforms.IMG_PLACEHOLDER + ' ' + transforms.IMG_PLACEHOLDER)
+
+    def test_decode(self):
+        mark = transforms.DECODE_MARK
+        self.assertEqual(_apply('[b]x[/b] [@name]', ['decode']),
+                         '[' + mark + 'b]x[' + mark + '/b] [@name]')
+
+    def test_no_edits(self):
+        text = '[quote][b]plain[/b][/quote]'
+        self.assertEqual(_apply(text, ['condense_url', 'replace_img']), text)
+
+
+class PipelineTest(unittest.TestCase):
+    def test_same_as_sequential_commands(self):
+        text = '[url=https://bbs.nga.cn/read.php?tid=5]t[/url] [img]https://img.nga.178.com/attachments/mon_2023/a.jpg[/img]'
+        self.assertEqual(_apply(text, ['condense_url', 'replace_img']),
+                         _apply(_apply(text, ['condense_url']), ['replace_img']))
+
+    def test_broken_tags_are_not_transformed_again(self):
+        # decode破坏了[url]/[img]的结构, 之后依赖这些tag的condense_url/replace_img不再生效
+        mark = transforms.DECODE_MARK
+        self.assertEqual(_apply('[url]https://ngabbs.com/read.php?tid=1[/url] [img]./a.png[/img]',
+                                ['decode', 'condense_url', 'replace_img']),
+                         '[' + mark + 'url]https://ngabbs.com/read.php?tid=1[' + mark + '/url] [' + mark + 'img]./a.png[' + mark + '/img]')
+        # 先精简url再decode时两者都生效
+        self.assertEqual(_apply('[url]https://ngabbs.com/read.php?tid=1[/url]', ['condense_url', 'decode']),
+                         '[' + mark + 'url]/read.php?tid=1[' + mark + '/url]')
+
+    def test_coalesce_without_edits(self):
+        self.assertIsNone(transforms.coalesce('text', []))
+
+
+if __name__ == '__main__':
+    unittest.main()
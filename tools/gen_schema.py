@@ -0,0 +1,166 @@
+'''
+根据 BBCode (NGA).sublime-syntax 中的 variables 生成 schema.py
+
+插件检查属性取值时使用生成的 frozenset, 不在运行时读取或解析 sublime-syntax.
+修改 sublime-syntax 中的取值后需要重新生成:
+
+    python tools/gen_schema.py            # 写入 schema.py
+    python tools/gen_schema.py --check    # 只检查 schema.py 是否为最新 (不是最新时以状态码 1 退出)
+'''
+import argparse
+import os
+import re
+import sys
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(TOOLS_DIR)
+SYNTAX_PATH = os.path.join(ROOT, 'BBCode (NGA).sublime-syntax')
+SCHEMA_PATH = os.path.join(ROOT, 'schema.py')
+
+# sublime-syntax中的变量名 -> schema.py中的常量名 (取值为忽略大小写的枚举, 用于比较的小写取值的集合, 以及保持原样的取值)
+ENUM_VARIABLES = [
+    ('algin_code', 'ALIGN_CODES', 'ALIGN_NAMES'),
+    ('color_code', 'COLOR_CODES', 'COLOR_NAMES'),
+    ('font_code', 'FONT_CODES', 'FONT_NAMES'),
+]
+# sublime-syntax中的变量名 -> schema.py中的常量名 (取值为正则)
+PATTERN_VARIABLES = [
+    ('hex_code', 'HEX_CODE'),
+]
+
+ENUM_PATTERN = re.compile(r'^\(\?xi:(.*)\)$', re.S)
+# (?x)模式下未转义的空白被忽略, "\ "表示一个空格
+EXTENDED_WHITESPACE_PATTERN = re.compile(r'\\(\s)|\s+')
+LINE_WIDTH = 120
+
+
+def read_variables(path):
+    '''
+    读取sublime-syntax顶层的variables (只支持单行取值及"|-"多行取值, 足以覆盖该文件)
+    '''
+    with open(path, encoding='utf-8') as f:
+        lines = f.read().split('\n')
+
+    variables = {}
+    in_variables = False
+    name = None
+    for line in lines:
+        if not line.strip():
+            continue
+        if not line.startswith(' '):
+            if name is not None:
+                variables[name] = '\n'.join(variables[name]).strip()
+                name = None
+            in_variables = line.rstrip() == 'variables:'
+            continue
+        if not in_variables:
+            continue
+
+        match = re.match(r'^  (\w+):\s*(.*)$', line)
+        if match is not None:
+            if name is not None:
+                variables[name] = '\n'.join(variables[name]).strip()
+            name, value = match.groups()
+            if value == '|-':
+                variables[name] = []
+            else:
+                # 单引号字符串中两个单引号表示一个单引号
+                if value.startswith("'") and value.endswith("'"):
+                    value = value[1:-1].replace("''", "'")
+                variables[name] = value
+                name = None
+        elif name is not None:
+            variables[name].append(line.strip())
+    if name is not None:
+        variables[name] = '\n'.join(variables[name]).strip()
+    return variables
+
+
+def enum_values(name, pattern):
+    '''
+    将"(?xi: a | b\\ c | ...)"形式的正则展开为取值列表: 与 (?x) 一样去掉未转义的空白, "\\ "还原为空格,
+    保持原有的大小写及首次出现的顺序 (忽略大小写去重)
+    '''
+    match = ENUM_PATTERN.match(pattern)
+    if match is None:
+        raise ValueError('{}: 不是 (?xi: a | b | ...) 形式的取值: {!r}'.format(name, pattern))
+
+    values = []
+    seen = set()
+    for value in match.group(1).split('|'):
+        value = EXTENDED_WHITESPACE_PATTERN.sub(lambda m: m.group(1) or '', value)
+        if not re.match(r'^\w+( \w+)*$', value):
+            raise ValueError('{}: 不支持的取值: {!r}'.format(name, value))
+        if value.lower() not in seen:
+            seen.add(value.lower())
+            values.append(value)
+    return values
+
+
+def _sequence_literal(values, indent='    '):
+    lines = []
+    line = indent
+    for value in values:
+        item = repr(value) + ', '
+        if len(line) + len(item) > LINE_WIDTH and line.strip():
+            lines.append(line.rstrip())
+            line = indent
+        line += item
+    lines.append(line.rstrip().rstrip(','))
+    return '\n'.join(lines)
+
+
+def render(variables):
+    out = [
+        "'''",
+        '由 tools/gen_schema.py 根据 BBCode (NGA).sublime-syntax 中的 variables 生成, 请勿手动修改',
+        "'''",
+        '',
+        '',
+        '__all__ = [{}]'.format(', '.join(
+            [repr(constant) for _, codes, names in ENUM_VARIABLES for constant in (names, codes)] +
+            [repr(constant) for _, constant in PATTERN_VARIABLES])),
+        '',
+    ]
+    for name, constant, names_constant in ENUM_VARIABLES:
+        values = enum_values(name, variables[name])
+        out.append('# {} (保持原样, 用于显示及补全)'.format(name))
+        out.append('{} = (\n{},\n)'.format(names_constant, _sequence_literal(values)))
+        out.append('# {} (忽略大小写: 统一为小写, 比较时只需将输入转为小写)'.format(name))
+        out.append('{} = frozenset(name.lower() for name in {})'.format(constant, names_constant))
+    for name, constant in PATTERN_VARIABLES:
+        out.append('# {}'.format(name))
+        out.append('{} = {!r}'.format(constant, variables[name]))
+    return '\n'.join(out) + '\n'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--check', action='store_true', help='只检查 schema.py 是否为最新')
+    args = parser.parse_args(argv)
+
+    variables = read_variables(SYNTAX_PATH)
+    missing = [name for name in [item[0] for item in ENUM_VARIABLES + PATTERN_VARIABLES] if name not in variables]
+    if missing:
+        print('sublime-syntax中缺少变量: ' + ', '.join(missing), file=sys.stderr)
+        return 1
+    source = render(variables)
+
+    if args.check:
+        try:
+            with open(SCHEMA_PATH, encoding='utf-8') as f:
+                current = f.read()
+        except OSError:
+            current = None
+        if current != source:
+            print('schema.py 不是最新, 请运行 python tools/gen_schema.py', file=sys.stderr)
+            return 1
+        return 0
+
+    with open(SCHEMA_PATH, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(source)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+'''
+NGA BBCode 命令行批量检查/转换
+
+不依赖 Sublime Text: 与插件使用相同的解析及转换逻辑, 递归查找目录中的 .nga / .bbsnga 文件,
+用进程池并行检查未闭合/不当闭合顺序的代码块及不合法的属性值 (如[color=reddd]), 或依次应用转换后写回文件
+
+    python tools/lint.py posts/ [--format text|json] [--jobs N]
+    python tools/lint.py posts/ --transform condense_url --transform replace_img [--dry-run]
+
+有错误 (或 --dry-run 时有文件需要转换) 时以状态码 1 退出, 便于在CI中使用
+'''
+import argparse
+import concurrent.futures
+import importlib
+import json
+import mmap
+import os
+import sys
+import types
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(TOOLS_DIR)
+PACKAGE = 'bbcode_nga'
+EXTENSIONS = ('.nga', '.bbsnga')
+# 超过该大小的文件通过mmap读取
+MMAP_THRESHOLD = 1 << 20
+
+
+def load_plugin():
+    '''
+    以包的形式加载插件中不依赖 Sublime Text 的模块 (插件内部使用相对导入)
+    '''
+    if PACKAGE not in sys.modules:
+        package = types.ModuleType(PACKAGE)
+        package.__path__ = [ROOT]
+        sys.modules[PACKAGE] = package
+    return dict((name, importlib.import_module(PACKAGE + '.' + name)) for name in ('bbcode', 'transforms'))
+
+
+# 在模块顶层加载, 使进程池以spawn方式启动子进程时同样可用
+plugin = load_plugin()
+
+
+def find_files(paths):
+    '''
+    展开目录, 返回排序后的 .nga / .bbsnga 文件路径
+    '''
+    files = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+                files.update(os.path.join(dirpath, name) for name in filenames if name.endswith(EXTENSIONS))
+        else:
+            files.add(path)
+    return sorted(files)
+
+
+def read_text(path):
+    '''
+    读取UTF-8文本 (大文件通过mmap读取), 返回(统一为"\\n"换行的内容, 原换行符)
+    '''
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            # 直接从映射的内存解码, 不再复制一份bytes
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                text = str(mm, 'utf-8-sig')
+        else:
+            text = f.read().decode('utf-8-sig')
+
+    # 与 Sublime Text 一致, 按"\n"换行解析
+    newline = '\r\n' if '\r\n' in text else '\n'
+    if newline != '\n':
+        text = text.replace('\r\n', '\n')
+    return text, newline
+
+
+def lint(document):
+    '''
+    检查未闭合/不当闭合顺序代码块及不合法的属性值, 按位置返回各错误的位置信息
+    '''
+    return [{
+        'line': line,
+        'column': column,
+        'end_line': end_line,
+        'end_column': end_column,
+        'tag': tag,
+        'message': message,
+    } for line, column, end_line, end_column, message, tag in document.diagnostics()]
+
+
+def process_file(path, transforms=(), write=True):
+    '''
+    检查单个文件, 并在指定转换时依次应用 (在进程池中执行)
+    '''
+    result = {'path': path, 'errors': [], 'changed': False}
+    try:
+        text, newline = read_text(path)
+    except (OSError, UnicodeDecodeError) as e:
+        result['failure'] = '{}: {}'.format(type(e).__name__, e)
+        return result
+
+    document = plugin['bbcode'].parse(text)
+    result['errors'] = lint(document)
+
+    if transforms:
+        transform_module = plugin['transforms']
+        replacement = transform_module.coalesce(text, transform_module.pipeline(document, transforms, 0, len(text)))
+        if replacement is not None:
+            begin, end, replace_str = replacement
+            new_text = text[:begin] + replace_str + text[end:]
+            result['changed'] = new_text != text
+            if result['changed'] and write:
+                if newline != '\n':
+                    new_text = new_text.replace('\n', newline)
+                with open(path, 'w', encoding='utf-8', newline='') as f:
+                    f.write(new_text)
+    return result
+
+
+def _process_args(args):
+    return process_file(*args)
+
+
+def run(files, transforms=(), write=True, jobs=None):
+    '''
+    用进程池并行处理各文件, 按文件顺序返回结果
+    '''
+    tasks = [(path, tuple(transforms), write) for path in files]
+    if jobs == 1 or len(tasks) <= 1:
+        return [_process_args(task) for task in tasks]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        # 文件通常很小, 成批分发以减少进程间通信
+        chunksize = max(1, len(tasks) // ((jobs or os.cpu_count() or 1) * 4))
+        return list(executor.map(_process_args, tasks, chunksize=chunksize))
+
+
+def format_text(results, dry_run=False):
+    '''
+    每个问题一行: 路径:行:列: 信息
+    '''
+    lines = []
+    for result in results:
+        if 'failure' in result:
+            lines.append('{}:0:0: {}'.format(result['path'], result['failure']))
+        for error in result['errors']:
+            lines.append('{}:{}:{}: {} {}'.format(result['path'], error['line'], error['column'], error['message'], error['tag']))
+        if result['changed']:
+            lines.append('{}:0:0: {}'.format(result['path'], '需要转换' if dry_run else '已转换'))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+', help='文件或目录 (递归查找 .nga / .bbsnga 文件)')
+    parser.add_argument('--format', choices=['text', 'json'], default='text', help='输出格式')
+    parser.add_argument('--jobs', '-j', type=int, default=None, help='进程数 (默认为CPU核数)')
+    parser.add_argument('--transform', '-t', action='append', default=[], choices=sorted(plugin['transforms'].TRANSFORMS),
+                        help='依次应用的转换, 可重复指定, 结果写回原文件')
+    parser.add_argument('--dry-run', action='store_true', help='只报告需要转换的文件, 不写回')
+    args = parser.parse_args(argv)
+
+    files = find_files(args.paths)
+    results = run(files, args.transform, write=not args.dry_run, jobs=args.jobs)
+
+    n_errors = sum(len(result['errors']) for result in results)
+    n_failures = sum('failure' in result for result in results)
+    n_changed = sum(result['changed'] for result in results)
+
+    if args.format == 'json':
+        report = {
+            'files': len(files),
+            'errors': n_errors,
+            'failures': n_failures,
+            'changed': n_changed,
+            'results': [result for result in results if result['errors'] or result['changed'] or 'failure' in result],
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+    else:
+        output = format_text(results, args.dry_run)
+    if output:
+        print(output)
+
+    failed = n_errors or n_failures or (args.dry_run and n_changed)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,180 @@
+import re
+import bisect
+
+
+__all__ = ['TRANSFORMS', 'DECODE_MARK', 'IMG_PLACEHOLDER', 'decode', 'condense_url', 'replace_img', 'pipeline', 'coalesce']
+
+NGA_DOMAIN = '(' + '|'.join(['bbs.nga.cn', 'ngabbs.com', 'nga.178.com']) + ')'
+URL_PATTERN = re.compile(r'(https://)?(' + NGA_DOMAIN + r'/)|(www.bilibili.com/[^\[\]\s]+)')
+IMG_PATTERN = re.compile(r'\[img\](.+?)\[/img\]')
+NGA_HOSTING = 'https://bbs.nga.cn'
+NGA_IMAGE_HOSTING = 'https://img.nga.178.com/attachments'
+
+DECODE_MARK = '[size=0%][/size]'
+IMG_PLACEHOLDER = '__图__'
+
+# 以下转换均返回按位置排序的修改 (起始, 结束, 新文本, 依赖区域起始, 依赖区域结束),
+# 依赖区域为该修改生效所需保持完整的tag/语法匹配区域
+
+
+def decode(document, begin, end):
+    '''
+    BBCode转纯文本: 在[begin, end)内每个BBCode tag的'['后面插入"[size=0%][/size]"
+    '''
+    text = document.text
+    edits = []
+    for span_begin, span_end, scope, _ in document.spans_within(begin, end):
+        if 'tag.bbcode.nga' not in scope:
+            continue
+        stop = min(span_end, end)
+        pos = text.find('[', max(span_begin, begin), stop)
+        while pos != -1:
+            edits.append((pos + 1, pos + 1, DECODE_MARK, span_begin, span_end))
+            pos = text.find('[', pos + 1, stop)
+    return edits
+
+
+def condense_url(document, begin, end):
+    '''
+    url精简: 将[begin, end)内url代码块中的NGA域名精简成"/", B站链接去掉"?"之后的内容
+    '''
+    edits = []
+    for match in URL_PATTERN.finditer(document.text, begin, end):
+        pos = match.start()
+        span = document.span_at(pos)
+        if span is None or 'link' not in span[2]:
+            continue
+
+        url = match.group()
+        new_url = url.split('?')[0] if 'bilibili' in url else '/'
+        if new_url == url:
+            continue
+        # "[url=链接]"依赖整个tag, "[url]链接[/url]"依赖整个匹配区域
+        dependency = document.token_at(pos) or span
+        edits.append((pos, match.end(), new_url, dependency[0], dependency[1]))
+    return edits
+
+
+def replace_img(document, begin, end):
+    '''
+    img转占位符: 将[begin, end)内的img代码块替换为"__图__"
+    '''
+    edits = []
+    for match in IMG_PATTERN.finditer(document.text, begin, end):
+        scope = document.scope_at(match.start())
+        if scope is not None and 'img.tag.bbcode.nga' in scope:
+            edits.append((match.start(), match.end(), IMG_PLACEHOLDER, match.start(), match.end()))
+    return edits
+
+
+def _fill_url(url, img=False):
+    if img:
+        # 若NGA图床为相对路径(默认), 则填充为完整路径
+        return NGA_IMAGE_HOSTING + url[1:] if url[0] == '.' else url
+    else:
+        # 若url为精简过NGA域名的链接, 则填充上NGA域名
+        return NGA_HOSTING + url if url[0] == '/' else url
+
+
+def _shorten_img_url(url):
+    # _fill_url(img=True)的逆操作: NGA图床的完整路径精简为相对路径
+    return '.' + url[len(NGA_IMAGE_HOSTING):] if url.startswith(NGA_IMAGE_HOSTING + '/') else url
+
+
+# tid/pid/uid链接到的页面
+ID_LINKS = {
+    'tid': '/read.php?tid=',
+    'pid': '/read.php?pid=',
+    'uid': '/nuke.php?func=ucp&uid=',
+}
+
+
+def _fill_id_url(tag, target):
+    # [pid=回复id,主题id,页码]只取回复id
+    return NGA_HOSTING + ID_LINKS[tag] + target.split(',')[0]
+
+
+# 转换名 -> (转换函数, 是否会破坏BBCode结构)
+TRANSFORMS = {
+    'decode': (decode, True),
+    'condense_url': (condense_url, False),
+    'replace_img': (replace_img, True),
+}
+
+
+class _Edits:
+    '''
+    按位置排序且互不重叠的已接受修改
+    '''
+    def __init__(self, edits=()):
+        self.edits = list(edits)
+        self.begins = [edit[0] for edit in self.edits]
+        self.ends = [edit[1] for edit in self.edits]
+
+    def intersects(self, begin, end, breaking=None):
+        '''
+        是否存在与[begin, end)相交的修改 (breaking不为None时只考虑破坏BBCode结构的修改)
+        '''
+        i = bisect.bisect_left(self.ends, begin)
+        while i < len(self.edits) and self.begins[i] <= end:
+            edit_begin, edit_end = self.begins[i], self.ends[i]
+            if breaking is None or breaking[i]:
+                if edit_begin == edit_end:
+                    # 插入
+                    if begin < edit_begin < end or (begin == end == edit_begin):
+                        return True
+                elif edit_begin < end and edit_end > begin and begin != end:
+                    return True
+                elif begin == end and edit_begin < begin < edit_end:
+                    return True
+            i += 1
+        return False
+
+
+def pipeline(document, names, begin, end):
+    '''
+    在一次解析的基础上依次应用多个转换, 只产生一组修改
+
+    各转换均按转换前的BBCode结构匹配, 后面的转换若与前面的修改位置重叠, 或其依赖的tag已被前面的转换破坏, 则该修改不再生效
+    (与依次执行各命令的区别: 前面的转换使原本不是BBCode的内容变为BBCode时, 后面的转换不会处理这部分内容)
+    '''
+    accepted = _Edits()
+    breaking = []
+    applied = set()
+    for name in names:
+        if name in applied:
+            continue
+        applied.add(name)
+        transform, breaks = TRANSFORMS[name]
+
+        kept = []
+        for edit in transform(document, begin, end):
+            edit_begin, edit_end, _, dependency_begin, dependency_end = edit
+            if accepted.intersects(edit_begin, edit_end):
+                continue
+            if accepted.intersects(dependency_begin, dependency_end, breaking):
+                continue
+            kept.append(edit)
+
+        merged = sorted([(edit, flag) for edit, flag in zip(accepted.edits, breaking)] + [(edit, breaks) for edit in kept],
+                        key=lambda item: (item[0][0], item[0][1]))
+        accepted = _Edits(edit for edit, _ in merged)
+        breaking = [flag for _, flag in merged]
+    return accepted.edits
+
+
+def coalesce(text, edits):
+    '''
+    将按位置排序且互不重叠的多处修改合并为一次替换, 返回(起始, 结束, 新文本), 没有修改时返回None
+    '''
+    if not edits:
+        return None
+
+    parts = []
+    start = last = edits[0][0]
+    for edit in edits:
+        begin, end, new_text = edit[:3]
+        parts.append(text[last:begin])
+        parts.append(new_text)
+        last = end
+    return start, last, ''.join(parts)
@@ -1,18 +1,8 @@
 import sublime
-from collections import defaultdict
+from .cache import documents
 
 
-__all__ = ['toggle', 'find_all', 'MarkdownTable']
-
-NGA_HOSTING = 'https://bbs.nga.cn'
-NGA_IMAGE_HOSTING = 'https://img.nga.178.com/attachments'
-BBCODE2MD = defaultdict(str)
-BBCODE2MD.update({
-    'b': '**',
-    'i': '*',
-    'del': '~~',
-    'code': '`'
-})
+__all__ = ['toggle', 'select_regions', 'parse_view']
 
 
 def toggle(view, edit, tag):
@@ -54,122 +44,19 @@ def toggle(view, edit, tag):
         view.sel().add(selection)
 
 
-def find_all(view, pattern, within=None):
+def select_regions(view, regions):
     '''
-    查找region中的所有pattern
+    用regions替换当前选区, 并滚动到第一个区域
     '''
-    if within is not None:
-        if sublime.version() >= '4181':
-            regions = view.find_all(pattern, within=within)
-        else:
-            regions = view.find_all(pattern)
-            regions = [region for region in regions if region.a >= select_region.begin() and region.b <= select_region.end()]
-    else:
-        regions = view.find_all(pattern)
-
-    return regions
+    view.sel().clear()
+    for region in regions:
+        view.sel().add(region)
+    if regions:
+        view.show(regions[0])
 
 
-def _get_display_width(text):
+def parse_view(view):
     '''
-    获取UTF-8编码字符串的显示宽度
+    整个buffer中BBCode的解析结果 (不需要逐个tag向Sublime查询作用域, 同一版本的内容只解析一次)
     '''
-    width = 0
-    for char in text:
-        code = ord(char)
-        if (0x4E00 <= code <= 0x9FFF or  # CJK统一表意文字
-            0x3040 <= code <= 0x309F or  # 平假名
-            0x30A0 <= code <= 0x30FF or  # 片假名
-            0xFF00 <= code <= 0xFFEF):   # 全角符号
-            width += 2
-        else:
-            width += 1
-    return width
-
-
-def _fill_url(url, img=False):
-    if img:
-        # 若NGA图床为相对路径(默认), 则填充为完整路径
-        return NGA_IMAGE_HOSTING + url[1:] if url[0] == '.' else url
-    else:
-        # 若url为精简过NGA域名的链接, 则填充上NGA域名
-        return NGA_HOSTING + url if url[0] == '/' else url
-
-
-class MarkdownTable:
-    def __init__(self, start_pos):
-        self.start_pos = start_pos
-        self.end_pos = -1
-        self.rows = []
-        self.len_cols = defaultdict(int)
-        self.row = []
-        self.cell = ''
-        self.cur_col = 0
-        self.buffer = defaultdict(lambda: None)
-
-    @property
-    def n_cols(self):
-        return max(self.len_cols.keys())
-
-    @property
-    def region(self):
-        return sublime.Region(self.start_pos, self.end_pos) if self.end_pos != -1 else None
-
-    def new_row(self):
-        self.row = []
-        self.cur_col = 0
-
-    def new_col(self):
-        self.new_cell()
-        self.cur_col += 1
-
-    def new_cell(self):
-        self.cell = ''
-
-    def update_row(self):
-        self.rows.append(self.row)
-
-    def update_col(self):
-        self.cell = self.cell.replace('\n', '<br>')
-        self.row.append(self.cell)
-        self.len_cols[self.cur_col] = max(self.len_cols[self.cur_col], _get_display_width(self.cell))
-
-    def update_cell(self, text, tag=''):
-        if tag == 'tr':
-            self.update_row()
-        elif tag == 'td':
-            self.cell += text
-            self.update_col()
-        elif tag == 'url':
-            # "[url]链接[/url]"变为"链接", "[url=链接]描述[/url]"变为"[描述](链接)"
-            if self.buffer['url']:
-                caption, url = text, _fill_url(self.buffer['url'])
-                self.cell += '[{}]({})'.format(caption, url)
-            else:
-                url = _fill_url(text)
-                self.cell += url
-            self.buffer['url'] = None
-        elif tag == 'img':
-            img_url = _fill_url(text, img=True)
-            self.cell += '![IMG]({})'.format(img_url)
-        else:
-            self.cell += BBCODE2MD[tag] + text + BBCODE2MD[tag]
-
-    def build(self, end_pos):
-        self.end_pos = end_pos
-        filled_rows = []
-
-        for row in self.rows:
-            # 填充缺少的列
-            row += [''] * (self.n_cols - len(row))
-            # 填充单元格, 使得每个单元格长度一样 (中文占两个显示宽度, 需要手动处理)
-            row = ['{:<{:}}'.format(cell, self.len_cols[i + 1] - _get_display_width(cell) + len(cell)) for i, cell in enumerate(row)]
-            # 转为字符串
-            filled_rows.append('| ' + ' | '.join(row) + ' |')
-
-        split_row = '| ' + ' | '.join([':' + '-' * (self.len_cols[i + 1] - 1) for i in range(self.n_cols)]) + ' |'
-        filled_rows.insert(1, split_row)
-
-        # 转为字符串
-        table = '\n'.join(filled_rows)
-        return table
\ No newline at end of file
+    return documents.get(view)
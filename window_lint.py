@@ -0,0 +1,203 @@
+import sublime
+import sublime_plugin
+import concurrent.futures
+import os
+import threading
+from .bbcode import parse
+from .cache import documents
+from .scheduler import get_setting
+
+
+PANEL_NAME = 'bbcode_nga_lint'
+EXTENSIONS = ('.nga', '.bbsnga')
+
+# 各次检查共用的线程池, 按设置lint_window_workers限制线程数
+_executor = None
+_executor_workers = None
+_executor_lock = threading.Lock()
+
+# buffer id -> (change_count, 错误), 打开的视图上一次的检查结果
+_view_results = {}
+# 文件路径 -> ((修改时间, 大小), 错误), 项目文件夹中未打开的文件上一次的检查结果
+_file_results = {}
+_results_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor, _executor_workers
+    workers = max(1, get_setting('lint_window_workers', 4))
+    with _executor_lock:
+        if _executor is not None and _executor_workers != workers:
+            # 设置改变后重建线程池, 旧线程池中已提交的检查照常完成
+            _executor.shutdown(wait=False)
+            _executor = None
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+            _executor_workers = workers
+        return _executor
+
+
+def _lint_view(buffer_id, change_count, document, text):
+    '''
+    检查打开的视图 (在线程池中执行): 已有该版本的解析结果document时直接使用, 否则解析内容快照text
+
+    与_lint_file一样返回(错误, 是否复用了上一次的结果)
+    '''
+    if document is None:
+        document = parse(text)
+    errors = document.diagnostics()
+    with _results_lock:
+        _view_results[buffer_id] = (change_count, errors)
+    return errors, False
+
+
+def _lint_file(path):
+    '''
+    检查项目文件夹中的文件 (在线程池中执行), 修改时间及大小未变化时复用上一次的结果
+    '''
+    try:
+        stat = os.stat(path)
+        version = (stat.st_mtime, stat.st_size)
+        with _results_lock:
+            cached = _file_results.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1], True
+
+        with open(path, encoding='utf-8-sig') as f:
+            # 与Sublime一致, 按"\n"换行解析
+            text = f.read()
+    except (OSError, UnicodeDecodeError) as e:
+        return [(0, 0, 0, 0, '{}: {}'.format(type(e).__name__, e), '')], False
+
+    errors = parse(text).diagnostics()
+    with _results_lock:
+        _file_results[path] = (version, errors)
+    return errors, False
+
+
+def _find_files(folders, skipped):
+    '''
+    递归查找文件夹中的 .nga / .bbsnga 文件, 排除skipped中的路径 (已打开的文件以视图内容为准)
+    '''
+    files = []
+    for folder in folders:
+        for dirpath, dirnames, filenames in os.walk(folder):
+            dirnames[:] = sorted(name for name in dirnames if not name.startswith('.'))
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                if name.endswith(EXTENSIONS) and path not in skipped:
+                    files.append(path)
+    return files
+
+
+def _prune_view_results():
+    '''
+    丢弃已关闭的buffer的检查结果
+    '''
+    open_buffers = set(view.buffer_id() for window in sublime.windows() for view in window.views())
+    with _results_lock:
+        for buffer_id in [buffer_id for buffer_id in _view_results if buffer_id not in open_buffers]:
+            del _view_results[buffer_id]
+
+
+def _is_bbcode_view(view):
+    syntax = view.settings().get('syntax') or ''
+    file_name = view.file_name()
+    return syntax.endswith('BBCode (NGA).sublime-syntax') or bool(file_name and file_name.endswith(EXTENSIONS))
+
+
+def _format_entry(label, path, errors):
+    '''
+    已保存的文件输出为 路径:行:列: 信息 tag (可在面板中双击跳转), 未保存的视图只列出名称
+    '''
+    lines = []
+    for line, column, _, _, message, tag in errors:
+        if path:
+            lines.append('{}:{}:{}: {} {}'.format(path, line, column, message, tag))
+        else:
+            lines.append('[{}] 第{}行第{}列: {} {}'.format(label, line, column, message, tag))
+    return lines
+
+
+def _collect(window, entries, folders, skipped):
+    '''
+    等待各检查完成后输出到面板 (在单独的线程中执行, 不占用主线程及插件的工作线程)
+    '''
+    executor = _get_executor()
+    if folders:
+        entries = entries + [(path, path, executor.submit(_lint_file, path)) for path in _find_files(folders, skipped)]
+
+    lines = []
+    n_errors = n_reused = 0
+    for i, (label, path, result) in enumerate(entries):
+        if len(entries) > 1:
+            sublime.status_message('BBCode检查: {}/{}'.format(i + 1, len(entries)))
+        if isinstance(result, concurrent.futures.Future):
+            result = result.result()
+        errors, reused = result
+        n_errors += len(errors)
+        n_reused += reused
+        lines += _format_entry(label, path, errors)
+
+    header = 'BBCode检查: {}个视图/文件 (其中{}个未改动, 复用上一次的结果), 共{}处问题'.format(len(entries), n_reused, n_errors)
+    sublime.set_timeout(lambda: _show_panel(window, '\n'.join([header, ''] + lines) + '\n'), 0)
+
+
+def _show_panel(window, content):
+    panel = window.create_output_panel(PANEL_NAME)
+    panel.settings().set('result_file_regex', r'^(.+):(\d+):(\d+): ')
+    panel.run_command('append', {'characters': content})
+    window.run_command('show_panel', {'panel': 'output.' + PANEL_NAME})
+    sublime.status_message(content.split('\n', 1)[0])
+
+
+class LintWindowCommand(sublime_plugin.WindowCommand):
+    '''检查窗口中所有打开的BBCode视图 (include_folders为true时还包括项目文件夹中的文件), 错误汇总输出到面板
+
+    在共用的线程池中并行检查; 内容(change_count)未变化的视图、修改时间未变化的文件复用上一次的结果
+    '''
+    def run(self, include_folders=None):
+        if include_folders is None:
+            include_folders = get_setting('lint_window_folders', False)
+
+        executor = _get_executor()
+        _prune_view_results()
+        entries = []
+        skipped = set()
+        buffers = set()
+        for view in self.window.views():
+            # 同一buffer的多个视图(克隆)只检查一次
+            if not _is_bbcode_view(view) or view.buffer_id() in buffers:
+                continue
+            buffers.add(view.buffer_id())
+            path = view.file_name()
+            if path:
+                skipped.add(path)
+            label = path or view.name() or 'untitled'
+
+            buffer_id, change_count = view.buffer_id(), view.change_count()
+            with _results_lock:
+                cached = _view_results.get(buffer_id)
+            if cached is not None and cached[0] == change_count:
+                entries.append((label, path, (cached[1], True)))
+                continue
+
+            # 该版本已被高亮检查或命令解析过时直接使用, 否则在主线程中只读取内容快照
+            parsed = documents.peek(buffer_id, change_count)
+            document = parsed[0] if parsed is not None else None
+            text = view.substr(sublime.Region(0, view.size())) if document is None else None
+            entries.append((label, path, executor.submit(_lint_view, buffer_id, change_count, document, text)))
+
+        folders = self.window.folders() if include_folders else []
+        if not entries and not folders:
+            sublime.status_message('没有打开的BBCode视图')
+            return
+        threading.Thread(target=_collect, args=(self.window, entries, folders, skipped), name='BBCode (NGA) window lint').start()
+
+
+def plugin_unloaded():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None